@@ -4,7 +4,7 @@ Benchmark script for solver_logic.py.
 Runs optimization with different category_diversity_weight values and records results.
 
 Usage:
-    python benchmarks/bench_solver.py [--label "version label"]
+    python benchmarks/bench_solver.py [--label "version label"] [--input file.xlsx] [--builder matrix|pulp|patterns|aggregated] [--backend cbc|highs] [--measure-memory] [--instant] [--lns SECONDS] [--time-limit SECONDS] [--sweep WORKERS]
 """
 import sys
 import os
@@ -16,19 +16,23 @@ from datetime import datetime
 # Add webapp to path so we can import solver_logic
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "webapp"))
 from solver_logic import run_optimization
+from sweep import run_weight_sweep
 
 INPUT_FILE = os.path.join(os.path.dirname(__file__), "..", "archive", "filled_template_2025_with_categories.xlsx")
 RESULTS_FILE = os.path.join(os.path.dirname(__file__), "results.md")
 WEIGHTS = [0, 5, 10, 15]
 
 
-def run_bench(weight, input_path):
+def run_bench(weight, input_path, builder="matrix", measure_memory=False, backend="cbc", instant=False, lns=0, time_limit=300):
     """Run a single benchmark with the given category weight. Returns (time_s, stats_dict, success, msg)."""
     with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as f:
         output_path = f.name
     try:
         t0 = time.time()
-        success, msg, stats = run_optimization(input_path, output_path, category_diversity_weight=weight)
+        success, msg, stats = run_optimization(input_path, output_path, category_diversity_weight=weight,
+                                               model_builder=builder, measure_memory=measure_memory,
+                                               solver_backend=backend, instant=instant,
+                                               lns_time_limit=lns, time_limit=time_limit)
         elapsed = time.time() - t0
         return elapsed, stats, success, msg
     finally:
@@ -38,36 +42,85 @@ def run_bench(weight, input_path):
 
 def format_table(results):
     """Format results as a markdown table."""
-    header = "| Weight | Time (s) | Objective | Pref Rate | Vetoes | Neutrals | Cat Diversity |"
-    sep = "|--------|----------|-----------|-----------|--------|----------|---------------|"
+    header = "| Weight | Backend | Time (s) | Solve (s) | Build (s) | Warm-up build (s) | Build peak (MB) | Heuristic | LP bound | Objective | Gap | Pref Rate | Vetoes | Neutrals | Cat Diversity |"
+    sep = "|--------|---------|----------|-----------|-----------|-------------------|-----------------|-----------|----------|-----------|-----|-----------|--------|----------|---------------|"
     rows = [header, sep]
     for r in results:
         cat_div = r.get("cat_div", "-")
         rows.append(
-            f"| {r['weight']:>6} | {r['time']:>8.1f} | {r['objective']:>9} | {r['pref_rate']:>9} "
-            f"| {r['vetoes']:>6} | {r['neutrals']:>8} | {cat_div} |"
+            f"| {r['weight']:>6} | {r.get('backend', '-'):>7} | {r['time']:>8.1f} | {r.get('solve', '-'):>9} "
+            f"| {r.get('build', '-'):>9} | {r.get('warmup_build', '-'):>17} | {r.get('build_peak', '-'):>15} "
+            f"| {r.get('heuristic', '-'):>9} | {r.get('lp_bound', '-'):>8} | {r['objective']:>9} | {r.get('gap', '-')} | {r['pref_rate']:>9} | {r['vetoes']:>6} | {r['neutrals']:>8} | {cat_div} |"
         )
     return "\n".join(rows)
 
 
+def run_sweep(input_path, workers, backend="cbc", time_limit=300):
+    """Run every weight as one sweep (sweep.run_weight_sweep). Returns (time_s, points)."""
+    outputs = {w: tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False).name for w in WEIGHTS}
+    try:
+        t0 = time.time()
+        points = run_weight_sweep(input_path, outputs, workers=workers, solver_backend=backend, time_limit=time_limit)
+        return time.time() - t0, points
+    finally:
+        for path in outputs.values():
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def format_sweep_table(points):
+    """Format a sweep's trade-off table as markdown."""
+    rows = ["| Weight | Time (s) | Objective | Pref Rate | Cat Coverage | Warm start | Pareto |",
+            "|--------|----------|-----------|-----------|--------------|------------|--------|"]
+    for p in points:
+        if not p["success"]:
+            rows.append(f"| {p['weight']:>6} | {p['time_s']:>8} | FAIL | - | - | - | - |")
+            continue
+        coverage = f"{p['category_coverage']}%" if p["category_coverage"] is not None else "-"
+        rows.append(f"| {p['weight']:>6} | {p['time_s']:>8} | {p['objective']:>9.2f} | {p['pref_rate']:>8}% | {coverage:>12} "
+                    f"| {'yes' if p['warm_started'] else 'no':>10} | {'*' if p['pareto'] else '':>6} |")
+    return "\n".join(rows)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Benchmark solver performance")
     parser.add_argument("--label", default="unlabeled", help="Version label for this benchmark run")
+    parser.add_argument("--input", default=INPUT_FILE, help="Filled template to benchmark on")
+    parser.add_argument("--builder", default="matrix", choices=["matrix", "pulp", "patterns", "aggregated"], help="Model builder")
+    parser.add_argument("--backend", default="cbc", choices=["cbc", "highs"], help="Solver backend (matrix builder)")
+    parser.add_argument("--measure-memory", action="store_true", help="Trace the peak memory of the model build")
+    parser.add_argument("--instant", action="store_true", help="Heuristic plan only (no MIP)")
+    parser.add_argument("--time-limit", type=float, default=300, help="Solver time limit; the best incumbent is kept")
+    parser.add_argument("--lns", type=float, default=0, help="Improve the heuristic plan by LNS for this many seconds (no MIP)")
+    parser.add_argument("--sweep", type=int, default=0, metavar="WORKERS",
+                        help="Solve all weights as one sweep over this many parallel chains (warm starts, Pareto table)")
     args = parser.parse_args()
 
-    if not os.path.exists(INPUT_FILE):
-        print(f"ERROR: Input file not found: {INPUT_FILE}")
+    if not os.path.exists(args.input):
+        print(f"ERROR: Input file not found: {args.input}")
         sys.exit(1)
 
     print(f"=== Solver Benchmark ({args.label}) ===")
-    print(f"Input: {INPUT_FILE}")
+    print(f"Input: {args.input}")
+    print(f"Builder: {args.builder} / backend: {args.backend}")
     print(f"Weights: {WEIGHTS}")
     print()
 
+    if args.sweep:
+        elapsed, points = run_sweep(args.input, args.sweep, args.backend, args.time_limit)
+        table = format_sweep_table(points) + f"\n\nSweep wall time: {elapsed:.1f}s ({args.sweep} chain(s))"
+        print("\n" + table + "\n")
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(RESULTS_FILE, "a") as f:
+            f.write(f"\n## {args.label} ({timestamp})\n\n")
+            f.write(table + "\n")
+        print(f"Results appended to {RESULTS_FILE}")
+        return
+
     results = []
     for w in WEIGHTS:
         print(f"--- Running weight={w} ---")
-        elapsed, stats, success, msg = run_bench(w, INPUT_FILE)
+        elapsed, stats, success, msg = run_bench(w, args.input, args.builder, args.measure_memory, args.backend, args.instant, args.lns, args.time_limit)
         if not success:
             print(f"  FAILED: {msg}")
             results.append({
@@ -82,6 +135,7 @@ def main():
                                  key=lambda k: int(k.split("/")[0]), reverse=True)
             cat_div = ", ".join(f"{k}:{stats['category_diversity_distribution'][k]}" for k in sorted_keys)
 
+        lp_bound = stats["model_build"].get("patterns", {}).get("lp_bound")
         results.append({
             "weight": w,
             "time": elapsed,
@@ -90,6 +144,14 @@ def main():
             "vetoes": stats.get("veto_count", "N/A"),
             "neutrals": stats.get("neutral_count", "N/A"),
             "cat_div": cat_div or "-",
+            "backend": stats["solver"]["backend"],
+            "heuristic": f"{stats['heuristic']['objective']:.2f}",
+            "lp_bound": f"{lp_bound:.2f}" if lp_bound is not None else "-",
+            "gap": f"{100 * stats['solver']['gap']:.1f}%" if stats["solver"].get("gap") is not None else "-",
+            "solve": f"{stats['solver']['solve_time_s']:.1f}",
+            "build": f"{stats['model_build']['build_time_s']:.2f}",
+            "warmup_build": f"{stats['model_build'].get('warmup_build_time_s', 0):.2f}",
+            "build_peak": stats["model_build"]["peak_memory_mb"] if stats["model_build"]["peak_memory_mb"] is not None else "-",
         })
         print(f"  Time: {elapsed:.1f}s | Obj: {stats.get('objective_value')} | Pref: {stats.get('pref_rate')}")
         print()
@@ -8,15 +8,19 @@ import queue
 import datetime
 from flask import Flask, request, render_template, send_from_directory, redirect, url_for, flash, Response, jsonify
 from werkzeug.utils import secure_filename
-import traceback
 
 # Import the solver function
-from solver_logic import run_optimization
+from solver_logic import PLANNING_SHEET, run_optimization
+from solver_backends import DEFAULT_BACKEND, available_backends
+from sweep import SWEEP_WEIGHTS, run_weight_sweep
+from job_runner import open_runner, run_job
+from result_cache import cache_get, cache_key, cache_put, cache_stats, input_digest, open_cache
 
 # --- Configuration ---
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 RESULT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
 STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
 ALLOWED_EXTENSIONS = {'xlsx'}
 TEMPLATE_FILENAME = 'Template.xlsx'
 
@@ -29,6 +33,21 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 # --- Job tracking for SSE ---
 jobs = {}
 
+# --- Solves in progress, by cache key: identical requests share one solver run ---
+inflight = {}
+inflight_lock = threading.Lock()
+
+# --- Finished plannings, by input data and parameters ---
+result_cache = open_cache(CACHE_FOLDER,
+                          max_entries=int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 100)),
+                          max_bytes=int(os.environ.get('RESULT_CACHE_MAX_MB', 256)) * 2**20)
+
+# --- Solver processes: at most JOB_WORKERS at once, each with its memory and wall-clock limits ---
+job_runner = open_runner(workers=int(os.environ.get('JOB_WORKERS', 0)) or None,
+                         memory_mb=int(os.environ.get('JOB_MEMORY_MB', 4096)),
+                         time_limit=int(os.environ.get('JOB_TIME_LIMIT', 1800)),
+                         processes=os.environ.get('JOB_PROCESSES', '1') != '0')
+
 # --- Helper Functions ---
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -51,77 +70,131 @@ def _friendly_error(message):
         return "Aucun atelier valide trouvé. Vérifiez l'onglet Ateliers et les colonnes Session."
     return message
 
-def _run_solver_job(job_id, input_path, output_path, category_weight):
-    """Run the solver in a background thread, pushing progress events to a queue."""
+def _new_flight(job_id, key):
+    """A solver run shared by every job attached to it (the first one runs it)."""
     job = jobs[job_id]
-    q = job["queue"]
-
-    def progress_callback(step, pct):
-        q.put({"type": "progress", "step": step, "pct": pct})
-
-    try:
-        t_start = time.time()
-        success, status_message, stats_summary = run_optimization(
-            input_path, output_path,
-            category_diversity_weight=category_weight,
-            progress_callback=progress_callback
-        )
-        solve_time = round(time.time() - t_start, 1)
-
-        # Clean up input file
-        try:
-            os.remove(input_path)
-        except OSError:
-            pass
-
-        if success:
-            q.put({
-                "type": "complete",
-                "success": True,
-                "message": status_message,
-                "filename": job["output_filename"],
-                "stats": stats_summary,
-                "solve_time": solve_time
-            })
-        else:
-            # Clean up output file on failure
-            if os.path.exists(output_path):
-                try:
-                    os.remove(output_path)
-                except OSError:
-                    pass
-            q.put({
-                "type": "complete",
-                "success": False,
-                "message": _friendly_error(status_message),
-                "solve_time": solve_time
-            })
-
-    except Exception as e:
-        print(f"Erreur inattendue dans le job {job_id}: {e}")
-        print(traceback.format_exc())
-        if os.path.exists(input_path):
+    return {"key": key, "queues": [job["queue"]], "history": [], "members": {job_id}, "stops": set(), "cancels": set(),
+            "stop": job["stop"], "cancel": job["cancel"], "output_filename": job["output_filename"],
+            "output_path": job["output_path"]}
+
+def _publish(flight, event):
+    """Sends an event to every job attached to a flight; progress is kept to replay it to late joiners."""
+    with inflight_lock:
+        if event["type"] == "complete" and inflight.get(flight["key"]) is flight:
+            inflight.pop(flight["key"])  # from now on, identical requests are served by the cache
+        elif event["type"] != "complete":
+            flight["history"].append(event)
+        queues = list(flight["queues"])
+    for q in queues:
+        q.put(event)
+
+def _job_failure(job_id, outcome):
+    """User message for a job that ended without a result (see job_runner.run_job statuses)."""
+    if outcome["status"] == "cancelled":
+        return "Calcul annulé."
+    if outcome["status"] == "timeout":
+        return f"Calcul arrêté : durée maximale de {job_runner['time_limit']} secondes dépassée."
+    if outcome["status"] == "crashed":
+        return (f"Le processus de calcul s'est arrêté de façon inattendue (code {outcome['exitcode']}). "
+                "Le fichier est peut-être trop volumineux pour la mémoire allouée.")
+    print(f"Erreur inattendue dans le job {job_id}: {outcome['error']}")
+    if outcome["error"] and not outcome["error"].startswith("Traceback"):
+        return outcome["error"]
+    return "Une erreur serveur inattendue est survenue lors du traitement."
+
+def _remove(*paths):
+    for path in paths:
+        if path and os.path.exists(path):
             try:
-                os.remove(input_path)
+                os.remove(path)
             except OSError:
                 pass
-        if os.path.exists(output_path):
+
+def _run_solver_job(job_id, input_path, output_path, category_weight, hard_veto=False, solver_backend=DEFAULT_BACKEND,
+                    instant=False, lns_time_limit=0, key=None, previous_plan_path=None):
+    """Supervise the solver process of a job (job_runner) from a background thread, pushing its progress events."""
+    job = jobs[job_id]
+    flight = job["flight"]
+
+    def progress_callback(step, pct, incumbent=None):
+        event = {"type": "progress", "step": step, "pct": pct}
+        if incumbent is not None:
+            event["incumbent"] = incumbent
+        _publish(flight, event)
+
+    t_start = time.time()
+    outcome = run_job(job_runner, run_optimization,
+                      {"input_excel_path": input_path, "output_excel_path": output_path,
+                       "category_diversity_weight": category_weight, "hard_veto": hard_veto,
+                       "solver_backend": solver_backend, "instant": instant, "lns_time_limit": lns_time_limit,
+                       "previous_plan_path": previous_plan_path},
+                      progress_callback, stop=flight["stop"], cancel=flight["cancel"])
+    solve_time = round(time.time() - t_start, 1)
+    _remove(input_path, previous_plan_path)
+
+    if outcome["status"] == "done" and outcome["result"][0]:
+        _, status_message, stats_summary = outcome["result"]
+        # A stopped search is only the best plan so far: not worth serving again
+        if key is not None and stats_summary["solver"]["termination"] != "stopped":
             try:
-                os.remove(output_path)
-            except OSError:
-                pass
-        q.put({
+                cache_put(result_cache, key, output_path, stats_summary)
+            except OSError as e:
+                print(f"Mise en cache impossible pour le job {job_id}: {e}")
+        _publish(flight, {
+            "type": "complete",
+            "success": True,
+            "message": status_message,
+            "filename": job["output_filename"],
+            "stats": stats_summary,
+            "solve_time": solve_time
+        })
+    else:
+        _remove(output_path)
+        message = (_friendly_error(outcome["result"][1]) if outcome["status"] == "done"
+                   else _job_failure(job_id, outcome))
+        _publish(flight, {
             "type": "complete",
             "success": False,
-            "message": "Une erreur serveur inattendue est survenue lors du traitement."
+            "status": outcome["status"],
+            "message": message,
+            "solve_time": solve_time
         })
 
 
+def _run_sweep_job(job_id, input_path, output_paths, hard_veto=False, solver_backend=DEFAULT_BACKEND):
+    """Supervise a category-weight sweep process (job_runner) from a background thread, pushing its progress events."""
+    job = jobs[job_id]
+    q = job["queue"]
+    t_start = time.time()
+    outcome = run_job(job_runner, run_weight_sweep,
+                      {"input_path": input_path, "output_paths": output_paths, "solver_backend": solver_backend,
+                       "hard_veto": hard_veto},
+                      lambda step, pct, incumbent=None: q.put({"type": "progress", "step": step, "pct": pct}),
+                      cancel=job["cancel"])
+    _remove(input_path)
+    if outcome["status"] != "done":
+        _remove(*output_paths.values())
+        q.put({"type": "complete", "success": False, "status": outcome["status"], "message": _job_failure(job_id, outcome)})
+        return
+    points = outcome["result"]
+    solved = [p for p in points if p["success"]]
+    for p in points:
+        p.pop("stats", None)  # the table is enough for the page, every workbook has its full stats
+    q.put({
+        "type": "complete",
+        "success": bool(solved),
+        "message": (f"{len(solved)}/{len(points)} niveaux de variété résolus." if solved
+                    else _friendly_error(points[0]["message"])),
+        "sweep": points,
+        "solve_time": round(time.time() - t_start, 1)
+    })
+
+
 # --- Routes ---
 @app.route('/')
 def index():
     """Renders the main upload page."""
-    return render_template('index.html')
+    return render_template('index.html', backends=available_backends(), default_backend=DEFAULT_BACKEND)
 
 @app.route('/download_template')
 def download_template():
@@ -145,6 +218,22 @@ def optimize():
     if not (file and allowed_file(file.filename)):
         return jsonify({"error": "Type de fichier non autorisé. Utilisez un fichier .xlsx."}), 400
 
+    category_weight = request.form.get('category_weight', 0, type=float)
+    hard_veto = request.form.get('hard_veto', '') in ('1', 'true', 'on')
+    instant = request.form.get('instant', '') in ('1', 'true', 'on')
+    lns_time_limit = request.form.get('lns_time_limit', 0, type=int)
+    if not 0 <= lns_time_limit <= 600:
+        return jsonify({"error": "Durée d'amélioration invalide (0 à 600 secondes)."}), 400
+    solver_backend = request.form.get('solver', DEFAULT_BACKEND)
+    if solver_backend not in available_backends():
+        return jsonify({"error": f"Solveur inconnu ou indisponible: {solver_backend}."}), 400
+    # Optional: the published planning to repair instead of planning from scratch
+    previous_file = request.files.get('previous_plan')
+    if previous_file is not None and previous_file.filename == '':
+        previous_file = None
+    if previous_file is not None and not allowed_file(previous_file.filename):
+        return jsonify({"error": "Type de fichier non autorisé pour le planning précédent. Utilisez un fichier .xlsx."}), 400
+
     unique_id = uuid.uuid4().hex
     job_id = unique_id[:12]
     input_filename = f"{unique_id}_input.xlsx"
@@ -155,31 +244,110 @@ def optimize():
     human_readable_output_filename = f"Planning_{timestamp}.xlsx"
     output_path = os.path.join(app.config['RESULT_FOLDER'], human_readable_output_filename)
 
+    previous_plan_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_previous.xlsx") if previous_file else None
+
     try:
         file.save(input_path)
+        if previous_file:
+            previous_file.save(previous_plan_path)
     except Exception as e:
         return jsonify({"error": f"Erreur lors de la sauvegarde du fichier: {e}"}), 500
 
-    category_weight = request.form.get('category_weight', 0, type=float)
-
     # Create job entry
     jobs[job_id] = {
         "queue": queue.Queue(),
         "output_filename": human_readable_output_filename,
         "output_path": output_path,
+        "stop": threading.Event(),
+        "cancel": threading.Event(),
         "created": time.time()
     }
 
+    digest = input_digest(input_path)
+    previous_digest = input_digest(previous_plan_path, sheets=(PLANNING_SHEET,)) if previous_plan_path else None
+    key = None
+    if digest is not None and (previous_digest is not None or not previous_plan_path):
+        key = cache_key(digest, category_weight=category_weight, hard_veto=hard_veto, instant=instant,
+                        lns_time_limit=lns_time_limit, solver=solver_backend, previous=previous_digest)
+    with inflight_lock:
+        flight = inflight.get(key) if key is not None else None
+        if flight is not None:
+            # Identical request already being solved: follow its progress and share its result
+            for path in (input_path, previous_plan_path):
+                if path: os.remove(path)
+            jobs[job_id].update(output_filename=flight["output_filename"], output_path=flight["output_path"],
+                                flight=flight, stop=flight["stop"], cancel=flight["cancel"])
+            flight["members"].add(job_id)
+            flight["queues"].append(jobs[job_id]["queue"])
+            for event in flight["history"]:
+                jobs[job_id]["queue"].put(event)
+            return jsonify({"job_id": job_id, "coalesced": True})
+
+        # Same data and parameters as an earlier run: serve its result right away
+        stats_summary = cache_get(result_cache, key, output_path) if key is not None else None
+        if stats_summary is not None:
+            for path in (input_path, previous_plan_path):
+                if path: os.remove(path)
+            jobs[job_id]["queue"].put({
+                "type": "complete",
+                "success": True,
+                "message": "Planning déjà calculé pour ces données et ces paramètres.",
+                "filename": human_readable_output_filename,
+                "stats": stats_summary,
+                "solve_time": 0,
+                "cached": True
+            })
+            return jsonify({"job_id": job_id, "cached": True})
+
+        flight = jobs[job_id]["flight"] = _new_flight(job_id, key)
+        if key is not None:
+            inflight[key] = flight
+
     # Start solver in background thread
     thread = threading.Thread(
         target=_run_solver_job,
-        args=(job_id, input_path, output_path, category_weight),
+        args=(job_id, input_path, output_path, category_weight, hard_veto, solver_backend, instant, lns_time_limit, key,
+              previous_plan_path),
         daemon=True
     )
     thread.start()
 
     return jsonify({"job_id": job_id})
 
+@app.route('/sweep', methods=['POST'])
+def sweep():
+    """Accepts file upload, solves it for several category weights in background, returns job_id."""
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({"error": "Aucun fichier sélectionné."}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"error": "Type de fichier non autorisé. Utilisez un fichier .xlsx."}), 400
+    try:
+        weights = sorted({float(w) for w in request.form.get('weights', ','.join(map(str, SWEEP_WEIGHTS))).split(',') if w.strip()})
+    except ValueError:
+        return jsonify({"error": "Liste de poids invalide (ex. 0,5,10,15)."}), 400
+    if not 1 <= len(weights) <= 8 or not all(0 <= w <= 100 for w in weights):
+        return jsonify({"error": "Liste de poids invalide : 1 à 8 poids entre 0 et 100."}), 400
+    hard_veto = request.form.get('hard_veto', '') in ('1', 'true', 'on')
+    solver_backend = request.form.get('solver', DEFAULT_BACKEND)
+    if solver_backend not in available_backends():
+        return jsonify({"error": f"Solveur inconnu ou indisponible: {solver_backend}."}), 400
+
+    unique_id = uuid.uuid4().hex
+    job_id = unique_id[:12]
+    input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_input.xlsx")
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    output_paths = {w: os.path.join(app.config['RESULT_FOLDER'], f"Planning_{timestamp}_variete_{w:g}.xlsx") for w in weights}
+    try:
+        file.save(input_path)
+    except Exception as e:
+        return jsonify({"error": f"Erreur lors de la sauvegarde du fichier: {e}"}), 500
+
+    jobs[job_id] = {"queue": queue.Queue(), "stop": threading.Event(), "cancel": threading.Event(), "created": time.time()}
+    threading.Thread(target=_run_sweep_job, args=(job_id, input_path, output_paths, hard_veto, solver_backend),
+                     daemon=True).start()
+    return jsonify({"job_id": job_id, "weights": weights})
+
 @app.route('/progress/<job_id>')
 def progress(job_id):
     """SSE endpoint that streams solver progress events."""
@@ -208,6 +376,53 @@ def progress(job_id):
     return Response(event_stream(), mimetype='text/event-stream',
                     headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
+@app.route('/stop/<job_id>', methods=['POST'])
+def stop_job(job_id):
+    """Asks a running job to stop and return the best planning found so far."""
+    if job_id not in jobs:
+        return jsonify({"error": "Job introuvable."}), 404
+    job = jobs[job_id]
+    flight = job.get("flight")
+    if flight is None:
+        job["stop"].set()
+        return jsonify({"stopping": True})
+    # A shared run stops only once every job following it has asked to
+    with inflight_lock:
+        flight["stops"].add(job_id)
+        stopping = flight["stops"] >= flight["members"]
+    if stopping:
+        flight["stop"].set()
+    return jsonify({"stopping": stopping})
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancels a job: its solver process (and CBC) is killed, its cores freed, nothing is returned."""
+    if job_id not in jobs:
+        return jsonify({"error": "Job introuvable."}), 404
+    job = jobs[job_id]
+    flight = job.get("flight")
+    if flight is None:
+        job["cancel"].set()
+        return jsonify({"cancelled": True})
+    # A shared run is killed only once every job following it has cancelled
+    with inflight_lock:
+        flight["cancels"].add(job_id)
+        cancelled = flight["cancels"] >= flight["members"]
+        if not cancelled:
+            # the others go on: this job alone leaves the run
+            flight["members"].discard(job_id)
+            if job["queue"] in flight["queues"]: flight["queues"].remove(job["queue"])
+    if cancelled:
+        flight["cancel"].set()
+    else:
+        job["queue"].put({"type": "complete", "success": False, "status": "cancelled", "message": "Calcul annulé."})
+    return jsonify({"cancelled": True})
+
+@app.route('/cache/stats')
+def result_cache_stats():
+    """Hit/miss counters and size of the result cache."""
+    return jsonify(cache_stats(result_cache))
+
 @app.route('/download_result/<path:filename>')
 def download_result(filename):
     """Serves the generated result file."""
@@ -0,0 +1,194 @@
+# heuristics.py
+"""
+Constructive heuristic: a complete plan in a fraction of a second, used as the MIP start of
+every solve and as the "instant" result when the MIP is not needed.
+
+Students are placed one at a time, most constrained first (fewest admissible instances), each
+on the schedule that adds the least to the objective given the students already placed:
+assignment costs, the change in deviation from the ideal crowds, the extra-neutral penalty and
+the category-diversity bonus. The schedule is found by a depth-first search over the sessions,
+pruned with the cheapest tiling of the free sessions (computed over session masks like the
+presolve, ignoring codes, neutrals and categories). Instances with no seat left are skipped;
+a student who cannot be seated at all is placed over capacity and counted in "overflow".
+"""
+import time
+from collections import defaultdict
+
+import numpy as np
+
+INF = float("inf")
+
+
+def _cheapest_tilings(opening, masks, cost, full_mask):
+    """best[m]: lowest total cost of instances tiling exactly the sessions of m (INF if impossible)."""
+    best = [INF] * (full_mask + 1); best[0] = 0.0
+    for m in range(1, full_mask + 1):
+        for a in opening.get(m & -m, ()):
+            ma = masks[a]
+            if ma & ~m: continue
+            v = cost[a] + best[m ^ ma]
+            if v < best[m]: best[m] = v
+    return best
+
+
+def best_schedule(options, masks, codes, cats, cost, neutral, available_cats, neutral_penalty, category_weight, full_mask):
+    """Cheapest complete schedule over `options` (exact for the per-student objective), or None."""
+    opening = defaultdict(list)
+    for a in sorted(options, key=lambda a: cost[a]):
+        opening[masks[a] & -masks[a]].append(a)
+    optimistic = {a: cost[a] - (category_weight if cats[a] in available_cats else 0) for a in options}
+    best = _cheapest_tilings(opening, masks, optimistic, full_mask)
+    incumbent = [INF, None]; stack, used_codes, used_cats = [], set(), set()
+
+    def dfs(covered, acc, neutrals):
+        if covered == full_mask:
+            if acc < incumbent[0]: incumbent[0], incumbent[1] = acc, tuple(stack)
+            return
+        free = full_mask & ~covered
+        if acc + best[free] >= incumbent[0]: return
+        for a in opening.get(free & -free, ()):
+            if masks[a] & covered or codes[a] in used_codes: continue
+            step = cost[a]
+            if neutral[a] and neutrals >= 1: step += neutral_penalty
+            new_cat = cats[a] in available_cats and cats[a] not in used_cats
+            if new_cat: step -= category_weight; used_cats.add(cats[a])
+            stack.append(a); used_codes.add(codes[a])
+            dfs(covered | masks[a], acc + step, neutrals + int(neutral[a]))
+            stack.pop(); used_codes.discard(codes[a])
+            if new_cat: used_cats.discard(cats[a])
+
+    dfs(0, 0.0, 0)
+    return incumbent[1]
+
+
+def _schedule_cost(schedule, cost, neutral, cats, available_cats, neutral_penalty, category_weight):
+    """Per-student objective of a schedule (assignment costs, extra neutrals, categories covered)."""
+    neutrals = sum(1 for a in schedule if neutral[a])
+    covered = len({cats[a] for a in schedule if cats[a] in available_cats})
+    return sum(cost[a] for a in schedule) + neutral_penalty * max(neutrals - 1, 0) - category_weight * covered
+
+
+def _negative_cycle(weights):
+    """A cycle of negative total weight in the complete digraph `weights` (k x k), or None (Bellman-Ford)."""
+    k = len(weights)
+    dist, pred = [0.0] * k, [-1] * k
+    last = -1
+    for _ in range(k):
+        last = -1
+        for a in range(k):
+            for b in range(k):
+                if a != b and dist[a] + weights[a][b] < dist[b] - 1e-9:
+                    dist[b] = dist[a] + weights[a][b]; pred[b] = a; last = b
+        if last < 0: return None
+    for _ in range(k): last = pred[last]
+    cycle, node = [last], pred[last]
+    while node != last:
+        cycle.append(node); node = pred[node]
+    return cycle[::-1]
+
+
+def _exchange_cycles(group, schedules, profiles, codes, cats, neutral_penalty, category_weight, max_cycles=1000):
+    """
+    Reassigns the students of a group of instances with identical sessions among those instances,
+    crowds unchanged: a transportation problem solved by cancelling negative cycles, where moving
+    along a -> b costs the best change for a student of a to take b instead (the rest of their
+    schedule fixed).
+    """
+    slot = {a: i for i, a in enumerate(group)}
+    members = [(s, a) for s, schedule in schedules.items() for a in schedule if a in slot]
+    if not members: return
+    cost = np.full((len(members), len(group)), 1e9)
+    for r, (s, a) in enumerate(members):
+        options, student_costs, neutral_row, available_cats = profiles[s]
+        kept = [o for o in schedules[s] if o != a]; kept_codes = {codes[o] for o in kept}
+        for b in group:
+            if b in options and (b == a or codes[b] not in kept_codes):
+                cost[r, slot[b]] = _schedule_cost(kept + [b], student_costs, neutral_row, cats, available_cats,
+                                                  neutral_penalty, category_weight)
+    where = np.array([slot[a] for _, a in members])
+    for _ in range(max_cycles):
+        weights, movers = [], []
+        for i in range(len(group)):
+            rows = np.flatnonzero(where == i)
+            if len(rows) == 0:
+                weights.append([1e9] * len(group)); movers.append([None] * len(group)); continue
+            delta = cost[rows] - cost[rows, i][:, None]
+            best = delta.argmin(axis=0)
+            weights.append(delta[best, np.arange(len(group))].tolist()); movers.append(rows[best].tolist())
+        cycle = _negative_cycle(weights)
+        if cycle is None: break
+        for i, j in zip(cycle, cycle[1:] + cycle[:1]):
+            where[movers[i][j]] = j
+    for r, (s, a) in enumerate(members):
+        b = group[where[r]]
+        if b != a: schedules[s] = tuple(b if o == a else o for o in schedules[s])
+
+
+def schedule_pairs(data, schedules):
+    """0/1 vector over the admissible pairs of `data` from student index -> tuple of instance indices."""
+    ps, pa = data["pair_student"], data["pair_instance"]
+    starts = np.searchsorted(ps, np.arange(data["n_students"] + 1)).tolist()
+    x_pairs = np.zeros(len(ps))
+    for s, schedule in schedules.items():
+        position = {a: starts[s] + k for k, a in enumerate(pa[starts[s]:starts[s + 1]].tolist())}
+        for a in schedule: x_pairs[position[a]] = 1
+    return x_pairs
+
+
+def greedy_plan(data, rounds=2):
+    """
+    Builds a complete plan over the admissible pairs of `data` (see solver_logic.prepare_model_data),
+    then improves it by taking each student out and placing them again on their best schedule
+    given everybody else (a move that never increases the objective), for a few rounds.
+
+    Returns:
+        dict: x_pairs (0/1 per admissible pair, usable with model_matrix.start_vector),
+              schedules (student index -> tuple of instance indices), overflow (students
+              placed over capacity), time_s.
+    """
+    t0 = time.time()
+    ps, pa = data["pair_student"], data["pair_instance"]
+    n_s = data["n_students"]
+    full_mask = (1 << data["total_sessions"]) - 1
+    masks, codes, cats = data["masks"].tolist(), data["code_ids"].tolist(), data["category_ids"].tolist()
+    capacity, ideal = data["capacity"].tolist(), data["ideal"].tolist()
+    dev_weight, neutral_penalty = data["deviation_weight"], data["extra_neutral_penalty"]
+    category_weight = data["category_weight"] if data["n_categories"] >= 2 else 0
+    starts = np.searchsorted(ps, np.arange(n_s + 1)).tolist()
+    counts = [0] * data["n_instances"]
+    schedules, over_capacity = {}, set()
+
+    def place(s):
+        options = pa[starts[s]:starts[s + 1]].tolist()
+        student_costs, neutral_row, vetoed_row = data["costs"][s].tolist(), data["neutral"][s].tolist(), data["vetoed"][s].tolist()
+        available_cats = {cats[a] for a in options if cats[a] >= 0 and not vetoed_row[a]} if category_weight > 0 else set()
+        cost = {a: student_costs[a] + (dev_weight if counts[a] >= ideal[a] else -dev_weight) for a in options}
+        args = (masks, codes, cats, cost, neutral_row, available_cats, neutral_penalty, category_weight, full_mask)
+        schedule = best_schedule([a for a in options if counts[a] < capacity[a]], *args)
+        over_capacity.discard(s)
+        if schedule is None:
+            schedule = best_schedule(options, *args) or (); over_capacity.add(s)
+        schedules[s] = schedule
+        for a in schedule: counts[a] += 1
+
+    order = sorted(range(n_s), key=lambda s: starts[s + 1] - starts[s])
+    for s in order: place(s)
+    # Exchanges along cycles of instances with the same sessions leave every crowd unchanged,
+    # so they escape the local optima where all the wanted instances sit at their ideal crowd.
+    profiles = []
+    for s in range(n_s):
+        options = pa[starts[s]:starts[s + 1]].tolist()
+        vetoed_row = data["vetoed"][s].tolist()
+        profiles.append((set(options), data["costs"][s].tolist(), data["neutral"][s].tolist(),
+                         {cats[a] for a in options if cats[a] >= 0 and not vetoed_row[a]} if category_weight > 0 else set()))
+    same_sessions = defaultdict(list)
+    for a, m in enumerate(masks): same_sessions[m].append(a)
+    groups = [group for group in same_sessions.values() if len(group) > 1]
+    for _ in range(rounds):
+        for group in groups:
+            _exchange_cycles(group, schedules, profiles, codes, cats, neutral_penalty, category_weight)
+        for s in order:
+            for a in schedules[s]: counts[a] -= 1
+            place(s)
+
+    return {"x_pairs": schedule_pairs(data, schedules), "schedules": schedules, "overflow": len(over_capacity), "time_s": round(time.time() - t0, 3)}
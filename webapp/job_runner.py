@@ -0,0 +1,146 @@
+# job_runner.py
+"""
+Runs solver jobs in child processes instead of threads of the web worker.
+
+Each job gets its own process (spawn) in its own session, so the model building never holds the
+GIL of the process serving requests, and a cancel kills the whole process group: the job, the
+CBC subprocess and any pool worker it started. At most `workers` jobs run at once, the others
+wait for a free slot. Every job has an address-space limit (memory_mb) and a wall-clock limit
+(time_limit) past which it is killed. The parent side only relays the child's progress events;
+a child that dies without a result (killed, out of memory, crashed) ends the job as "crashed"
+with its exit code instead of leaving it hanging.
+"""
+import multiprocessing
+import os
+import queue
+import resource
+import signal
+import threading
+import time
+import traceback
+
+POLL_INTERVAL = 0.2  # seconds between two checks of cancel, stop, deadline and child liveness
+RESULT_GRACE = 1.0  # seconds to collect a result already sent by a child that just exited
+
+
+def open_runner(workers=None, memory_mb=0, time_limit=0, processes=True):
+    """
+    Job runner settings and slots.
+
+    Args:
+        workers (int | None): jobs running at once (default: one per CPU).
+        memory_mb (int): address-space limit of a job process and its subprocesses (0 = none).
+        time_limit (float): wall-clock seconds after which a job is killed (0 = none).
+        processes (bool): False runs jobs in the calling thread (no isolation, no hard cancel; tests and debugging).
+
+    Returns:
+        dict: the settings and a semaphore of free slots.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    return {"workers": workers, "memory_mb": memory_mb, "time_limit": time_limit, "processes": processes,
+            "slots": threading.BoundedSemaphore(workers)}
+
+
+def _child(target, kwargs, events, stop, memory_mb):
+    """Child process: runs target(progress_callback=..., **kwargs) and sends its progress and result through `events`."""
+    os.setsid()  # own process group, killed as a whole on cancel
+    if memory_mb:
+        limit = memory_mb * 2**20
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    def progress(step, pct, incumbent=None):
+        events.put(("progress", step, pct, incumbent))
+
+    if stop is not None:
+        kwargs = {**kwargs, "stop_event": stop}
+    try:
+        events.put(("result", target(progress_callback=progress, **kwargs)))
+    except MemoryError:
+        events.put(("error", "Mémoire insuffisante pour ce calcul."))
+    except Exception:
+        events.put(("error", traceback.format_exc()))
+
+
+def _kill(process):
+    """Kills a job process and its whole process group."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    process.join(5)
+
+
+def _next_event(events, timeout):
+    try:
+        return events.get(timeout=timeout)
+    except queue.Empty:
+        return None
+
+
+def run_job(runner, target, kwargs, progress, stop=None, cancel=None):
+    """
+    Runs target(progress_callback=..., [stop_event=...,] **kwargs) in a job process and waits for it.
+
+    Args:
+        runner (dict): see open_runner.
+        target (callable): module-level function (pickled by reference for the child).
+        kwargs (dict): picklable keyword arguments of target.
+        progress (callable): progress(step, pct, incumbent=None), called in this thread for every child event.
+        stop (threading.Event | None): when set, relayed to the child as its stop_event (graceful stop).
+        cancel (threading.Event | None): when set, the job process group is killed.
+
+    Returns:
+        dict: status ("done", "failed", "cancelled", "timeout" or "crashed"), result (target's return
+              value when done), error (message otherwise), exitcode (child exit code, None inline).
+    """
+    if not runner["processes"]:
+        options = {**kwargs, "stop_event": stop} if stop is not None else kwargs
+        try:
+            return {"status": "done", "result": target(progress_callback=progress, **options), "error": None, "exitcode": None}
+        except Exception:
+            return {"status": "failed", "result": None, "error": traceback.format_exc(), "exitcode": None}
+
+    if not runner["slots"].acquire(blocking=False):
+        progress("En attente d'un processus de calcul libre...", 5)
+        while not runner["slots"].acquire(timeout=POLL_INTERVAL):
+            if cancel is not None and cancel.is_set():
+                return {"status": "cancelled", "result": None, "error": None, "exitcode": None}
+    ctx = multiprocessing.get_context("spawn")
+    events = ctx.Queue()
+    child_stop = ctx.Event() if stop is not None else None
+    process = ctx.Process(target=_child, args=(target, kwargs, events, child_stop, runner["memory_mb"]))
+    outcome = None
+    try:
+        process.start()
+        deadline = time.time() + runner["time_limit"] if runner["time_limit"] else None
+        while outcome is None:
+            if cancel is not None and cancel.is_set():
+                _kill(process); outcome = {"status": "cancelled", "result": None, "error": None}; break
+            if deadline is not None and time.time() > deadline:
+                _kill(process); outcome = {"status": "timeout", "result": None, "error": None}; break
+            if child_stop is not None and stop.is_set() and not child_stop.is_set():
+                child_stop.set()
+            event = _next_event(events, POLL_INTERVAL)
+            if event is None:
+                if process.is_alive(): continue
+                event = _next_event(events, RESULT_GRACE)  # a result sent just before exiting
+                if event is None:
+                    outcome = {"status": "crashed", "result": None, "error": None}; break
+            if event[0] == "progress":
+                step, pct, incumbent = event[1:]
+                if incumbent is None: progress(step, pct)
+                else: progress(step, pct, incumbent)
+            elif event[0] == "result":
+                outcome = {"status": "done", "result": event[1], "error": None}
+            else:
+                outcome = {"status": "failed", "result": None, "error": event[1]}
+        process.join(5)
+        if process.is_alive():
+            _kill(process)
+        outcome["exitcode"] = process.exitcode
+        return outcome
+    finally:
+        if process.is_alive():
+            _kill(process)
+        events.close()
+        runner["slots"].release()
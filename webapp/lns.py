@@ -0,0 +1,153 @@
+# lns.py
+"""
+Large neighborhood search: improves a complete plan within a wall-clock budget.
+
+Each step frees a neighborhood of students (one Classe, the students seated in some instances
+of one session, or the students of a random subset of workshops) and re-optimizes their
+schedules as a small sub-MIP, everybody else fixed. The sub-MIP is the matrix model
+(model_matrix) over the freed students only, with the capacities and ideal crowds reduced by
+the seats of the fixed students: its objective is the objective of the whole plan minus the
+constant part of the fixed students, so it starts from the current schedules and never makes
+the plan worse. Several neighborhoods of the same plan are solved in parallel worker processes;
+their results are merged one at a time, each kept only if the merged plan still respects
+every capacity and improves the objective.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pulp
+
+from heuristics import schedule_pairs
+from model_matrix import build_model_matrix, start_vector
+from solver_backends import DEFAULT_BACKEND, get_backend
+
+NEIGHBORHOOD_SIZE = 60  # students freed per sub-MIP
+NEIGHBORHOOD_KINDS = ("classe", "session", "ateliers")
+SUBMIP_TIME_LIMIT = 10  # seconds, per sub-MIP (never beyond the remaining budget)
+
+
+def _sub_data(data, students, counts, schedules):
+    """The model data restricted to `students` (sorted), capacities and ideal crowds net of the other students' seats."""
+    renumber = np.full(data["n_students"], -1, dtype=np.int64); renumber[students] = np.arange(len(students))
+    keep = renumber[data["pair_student"]] >= 0
+    freed = np.bincount([a for s in students.tolist() for a in schedules[s]], minlength=data["n_instances"])
+    fixed = counts - freed
+    return {**data, "n_students": len(students), "student_ids": [data["student_ids"][s] for s in students.tolist()],
+            "pair_student": renumber[data["pair_student"][keep]], "pair_instance": data["pair_instance"][keep],
+            "capacity": data["capacity"] - fixed, "ideal": data["ideal"] - fixed,
+            "costs": data["costs"][students], "neutral": data["neutral"][students], "vetoed": data["vetoed"][students]}
+
+
+def _solve_neighborhood(sub, schedules, solver_backend, time_limit):
+    """
+    Worker: solves the sub-MIP of a neighborhood from its current schedules.
+
+    Returns:
+        dict | None: sub student index -> tuple of instance indices, None without a solution.
+    """
+    model = build_model_matrix(sub)
+    start = start_vector(model, sub, schedule_pairs(sub, schedules))
+    solved = get_backend(solver_backend)(model, time_limit=time_limit, gap_rel=0.001, start=start)
+    if solved["status"] != pulp.LpStatusOptimal:
+        return None
+    chosen = np.flatnonzero(solved["values"][slice(*model["x_cols"])] > 0.5)
+    result = {s: [] for s in range(sub["n_students"])}
+    for k in chosen.tolist():
+        result[int(sub["pair_student"][k])].append(int(sub["pair_instance"][k]))
+    return {s: tuple(schedule) for s, schedule in result.items()}
+
+
+def _neighborhood(kind, rng, data, schedules, groups, seated, size):
+    """Student indices freed by a neighborhood of the given kind (at most `size`)."""
+    if kind == "classe" and groups:
+        students = groups[rng.integers(len(groups))]
+    else:
+        if kind == "session":
+            session = rng.integers(data["total_sessions"])
+            instances = rng.permutation(np.flatnonzero((data["masks"] >> session) & 1))
+        else:
+            codes = rng.permutation(int(data["code_ids"].max()) + 1)
+            rank = np.empty_like(codes); rank[codes] = np.arange(len(codes))
+            instances = np.argsort(rank[data["code_ids"]], kind="stable")
+        students = []
+        for a in instances.tolist():
+            students.extend(seated[a])
+            if len(students) >= size: break
+    students = np.unique(np.asarray(students, dtype=np.int64))
+    return np.sort(rng.choice(students, size, replace=False)) if len(students) > size else students
+
+
+def improve_plan(data, schedules, time_budget, groups=(), workers=None, solver_backend=DEFAULT_BACKEND, seed=0,
+                 callback=None, stop=None, size=NEIGHBORHOOD_SIZE):
+    """
+    Improves a plan that respects every capacity by large neighborhood search until `time_budget`
+    seconds have elapsed, `stop` is set (checked between rounds) or, when a neighborhood already
+    holds every student, after one round.
+
+    Args:
+        data (dict): model data (see solver_logic.prepare_model_data).
+        schedules (dict): student index -> tuple of instance indices (e.g. heuristics.greedy_plan).
+        time_budget (float): wall-clock budget in seconds.
+        groups (list): arrays of student indices freed together by the "classe" neighborhoods.
+        workers (int | None): parallel worker processes (default: one per CPU; 1 = in-process).
+        solver_backend (str): backend solving the sub-MIPs (see solver_backends).
+        seed (int): seed of the neighborhood choices.
+        callback (callable | None): callback(objective, None) on every improvement (as the solver backends).
+        stop (threading.Event | None): ends the search at the end of the current round.
+        size (int): students freed per neighborhood.
+
+    Returns:
+        dict: schedules (best plan found), objective, start_objective, rounds, neighborhoods,
+              improvements, workers, time_s.
+    """
+    t0 = time.time(); deadline = t0 + time_budget
+    workers = max(1, workers or os.cpu_count() or 1)
+    rng = np.random.default_rng(seed)
+    model = build_model_matrix(data)
+    schedules = {s: tuple(schedule) for s, schedule in schedules.items()}
+
+    def objective(plan):
+        return float(model["c"] @ start_vector(model, data, schedule_pairs(data, plan)) + model["offset"])
+
+    def crowds(plan):
+        return np.bincount([a for schedule in plan.values() for a in schedule], minlength=data["n_instances"])
+
+    best = start_objective = objective(schedules)
+    rounds = tried = improvements = 0
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) if workers > 1 else None
+    try:
+        while time.time() < deadline and not (stop is not None and stop.is_set()):
+            counts = crowds(schedules)
+            seated = [[] for _ in range(data["n_instances"])]
+            for s, schedule in schedules.items():
+                for a in schedule: seated[a].append(s)
+            time_limit = max(1, int(min(SUBMIP_TIME_LIMIT, deadline - time.time())))
+            tasks = []
+            for k in range(workers):
+                kind = NEIGHBORHOOD_KINDS[(rounds * workers + k) % len(NEIGHBORHOOD_KINDS)]
+                students = _neighborhood(kind, rng, data, schedules, groups, seated, size)
+                if len(students) == 0: continue
+                sub = _sub_data(data, students, counts, schedules)
+                args = (sub, {i: schedules[s] for i, s in enumerate(students.tolist())}, solver_backend, time_limit)
+                tasks.append((students, pool.submit(_solve_neighborhood, *args) if pool else _solve_neighborhood(*args)))
+            rounds += 1; tried += len(tasks)
+            whole = any(len(students) == data["n_students"] for students, _ in tasks)
+            for students, result in tasks:
+                result = result.result() if pool else result
+                if result is None: continue
+                candidate = dict(schedules)
+                for i, s in enumerate(students.tolist()): candidate[s] = result[i]
+                if (crowds(candidate) > data["capacity"]).any(): continue
+                value = objective(candidate)
+                if value < best - 1e-6:
+                    schedules, best = candidate, value; improvements += 1
+                    print(f"LNS: objectif {best:.2f} ({time.time() - t0:.1f}s)")
+                    if callback: callback(best, None)
+            if whole: break
+    finally:
+        if pool: pool.shutdown(cancel_futures=True)
+    return {"schedules": schedules, "objective": best, "start_objective": start_objective, "rounds": rounds,
+            "neighborhoods": tried, "improvements": improvements, "workers": workers, "time_s": round(time.time() - t0, 3)}
@@ -0,0 +1,259 @@
+# model_matrix.py
+"""
+Matrix-native model builder.
+
+Emits the whole assignment model (objective, bounds, constraint matrix) as NumPy arrays
+built from precomputed index arrays, instead of assembling PuLP expressions term by term.
+The constraint matrix is returned in CSR form; write_mps() streams it column-wise to a
+file any MPS reader (CBC) can load. Solving is done by solver_backends.
+
+Column layout: [x pairs | dev per instance | z per student | w per student | y per (student, category)]
+"""
+import numpy as np
+
+INF = float("inf")
+
+
+def _group_rows(keys):
+    """
+    Groups entries sharing a key into one row each, keeping only groups of 2 entries or more
+    (a "<= 1" row over a single binary is redundant).
+
+    Returns:
+        tuple: (row index per kept entry, mask of kept entries, number of rows)
+    """
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=bool), 0
+    uniq, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    kept_groups = counts > 1
+    group_row = np.cumsum(kept_groups) - 1
+    keep = kept_groups[inverse]
+    return group_row[inverse][keep], keep, int(kept_groups.sum())
+
+
+def build_model_matrix(data, category_weight=None, debug_names=False):
+    """
+    Builds the assignment model from the index arrays of `data` (see solver_logic.prepare_model_data).
+
+    Args:
+        data (dict): precomputed model data (pairs, durations, session masks, capacities, costs...).
+        category_weight (float | None): overrides data["category_weight"] (0 = no category terms).
+        debug_names (bool): also generate readable column/row names (costly, debug only).
+
+    Returns:
+        dict: c, offset, col_lower, col_upper, integer, CSR arrays (indptr, indices, data),
+              row_lower, row_upper, n_rows, n_cols, column block offsets and, in debug mode,
+              col_names / row_names (None otherwise).
+    """
+    weight = data["category_weight"] if category_weight is None else category_weight
+    ps, pa = data["pair_student"], data["pair_instance"]
+    n_s, n_a, n_cat, n_sess = data["n_students"], data["n_instances"], data["n_categories"], data["total_sessions"]
+    n_pairs = len(ps)
+    use_cat = weight > 0 and n_cat >= 2
+    pairs = np.arange(n_pairs, dtype=np.int64)
+    dev0 = n_pairs; z0 = dev0 + n_a; w0 = z0 + n_s; y0 = w0 + n_s
+    n_cols = y0 + (n_s * n_cat if use_cat else 0)
+
+    # --- Columns ---
+    c = np.zeros(n_cols)
+    c[:n_pairs] = data["costs"][ps, pa]
+    c[dev0:z0] = data["deviation_weight"]
+    c[w0:y0] = data["extra_neutral_penalty"]
+    col_lower = np.zeros(n_cols)
+    col_upper = np.full(n_cols, INF)
+    col_upper[:n_pairs] = 1
+    integer = np.zeros(n_cols, dtype=bool)
+    integer[:n_pairs] = True; integer[z0:w0] = True
+    offset = 0.0
+    cat_of_pair = data["category_ids"][pa]
+    if use_cat:
+        c[y0:] = -weight
+        offset = weight * n_cat * n_s
+        # y[s][c] is fixed to 0 when every admissible instance of the category is vetoed (or there is none)
+        available = np.zeros((n_s, n_cat), dtype=bool)
+        usable = (cat_of_pair >= 0) & ~data["vetoed"][ps, pa]
+        available[ps[usable], cat_of_pair[usable]] = True
+        col_upper[y0:] = available.ravel()
+
+    # --- Rows, collected as COO blocks ---
+    blocks_r, blocks_c, blocks_v, lowers, uppers, kinds = [], [], [], [], [], []
+    n_rows = 0
+
+    def add_block(rows, cols, vals, lower, upper, kind):
+        nonlocal n_rows
+        blocks_r.append(np.asarray(rows, dtype=np.int64) + n_rows); blocks_c.append(np.asarray(cols, dtype=np.int64))
+        blocks_v.append(np.broadcast_to(np.asarray(vals, dtype=float), (len(blocks_c[-1]),)))
+        lower = np.asarray(lower, dtype=float); upper = np.asarray(upper, dtype=float)
+        lowers.append(lower); uppers.append(upper); kinds.append((kind, n_rows, len(lower)))
+        n_rows += len(lower)
+
+    durations = data["durations"]
+    capacity, ideal = data["capacity"].astype(float), data["ideal"].astype(float)
+    # TotalDuration: sum duration * x == TOTAL_SESSIONS
+    add_block(ps, pairs, durations[pa], np.full(n_s, n_sess), np.full(n_s, n_sess), "TotalDuration")
+    # CapacitéMax, only where the admissible crowd can exceed the capacity
+    crowd = np.bincount(pa, minlength=n_a)
+    cap_inst = np.flatnonzero(crowd > capacity)
+    cap_row = np.full(n_a, -1); cap_row[cap_inst] = np.arange(len(cap_inst))
+    in_cap = cap_row[pa] >= 0
+    add_block(cap_row[pa][in_cap], pairs[in_cap], 1.0, np.full(len(cap_inst), -INF), capacity[cap_inst], "CapacitéMax")
+    # DevPos: n_a - dev_a <= ideal ; DevNeg: n_a + dev_a >= ideal
+    dev_cols = dev0 + np.arange(n_a)
+    add_block(np.concatenate([pa, np.arange(n_a)]), np.concatenate([pairs, dev_cols]),
+              np.concatenate([np.ones(n_pairs), -np.ones(n_a)]), np.full(n_a, -INF), ideal, "DevPos")
+    add_block(np.concatenate([pa, np.arange(n_a)]), np.concatenate([pairs, dev_cols]), 1.0, ideal, np.full(n_a, INF), "DevNeg")
+    # UniqueCode: at most one instance of a code per student
+    rows, keep, k = _group_rows(ps * (int(data["code_ids"].max()) + 1) + data["code_ids"][pa])
+    add_block(rows, pairs[keep], 1.0, np.full(k, -INF), np.ones(k), "UniqueCode")
+    # Overlap: at most one instance per student and session
+    sess_keys, sess_cols = [], []
+    for sess in range(n_sess):
+        covering = np.flatnonzero((data["masks"][pa] >> sess) & 1)
+        sess_keys.append(ps[covering] * n_sess + sess); sess_cols.append(covering)
+    sess_keys = np.concatenate(sess_keys); sess_cols = np.concatenate(sess_cols)
+    rows, keep, k = _group_rows(sess_keys)
+    add_block(rows, sess_cols[keep], 1.0, np.full(k, -INF), np.ones(k), "Overlap")
+    # ZDef: z_s - sum(neutral x) == 0 ; WDef: w_s - z_s >= -1
+    neutral_pairs = np.flatnonzero(data["neutral"][ps, pa])
+    add_block(np.concatenate([ps[neutral_pairs], np.arange(n_s)]), np.concatenate([neutral_pairs, z0 + np.arange(n_s)]),
+              np.concatenate([-np.ones(len(neutral_pairs)), np.ones(n_s)]), np.zeros(n_s), np.zeros(n_s), "ZDef")
+    add_block(np.concatenate([np.arange(n_s), np.arange(n_s)]), np.concatenate([w0 + np.arange(n_s), z0 + np.arange(n_s)]),
+              np.concatenate([np.ones(n_s), -np.ones(n_s)]), np.full(n_s, -1.0), np.full(n_s, INF), "WDef")
+    if use_cat:
+        # CatMax: y_sc - sum(x in category c) <= 0, for the y that are not fixed to 0
+        y_free = np.flatnonzero(col_upper[y0:] > 0)
+        cat_row = np.full(n_s * n_cat, -1); cat_row[y_free] = np.arange(len(y_free))
+        in_cat = np.flatnonzero(cat_of_pair >= 0)
+        pair_rows = cat_row[ps[in_cat] * n_cat + cat_of_pair[in_cat]]
+        live = pair_rows >= 0
+        add_block(np.concatenate([np.arange(len(y_free)), pair_rows[live]]), np.concatenate([y0 + y_free, in_cat[live]]),
+                  np.concatenate([np.ones(len(y_free)), -np.ones(int(live.sum()))]),
+                  np.full(len(y_free), -INF), np.zeros(len(y_free)), "CatMax")
+        # CatSessionBound: sum_c y_sc <= TOTAL_SESSIONS
+        add_block(np.repeat(np.arange(n_s), n_cat), y0 + np.arange(n_s * n_cat), 1.0, np.full(n_s, -INF), np.full(n_s, n_sess), "CatSessionBound")
+
+    # --- COO -> CSR ---
+    row_idx = np.concatenate(blocks_r); col_idx = np.concatenate(blocks_c); vals = np.concatenate(blocks_v)
+    order = np.argsort(row_idx, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_idx, minlength=n_rows), out=indptr[1:])
+
+    model = {
+        "n_rows": n_rows, "n_cols": n_cols, "c": c, "offset": offset,
+        "col_lower": col_lower, "col_upper": col_upper, "integer": integer,
+        "indptr": indptr, "indices": col_idx[order], "data": vals[order],
+        "row_lower": np.concatenate(lowers), "row_upper": np.concatenate(uppers),
+        "x_cols": (0, n_pairs), "dev_cols": (dev0, z0), "z_cols": (z0, w0), "w_cols": (w0, y0), "y_cols": (y0, n_cols),
+        "use_category_diversity": use_cat, "pair_student": ps, "pair_instance": pa,
+        "col_names": None, "row_names": None,
+    }
+    if debug_names:
+        model["col_names"], model["row_names"] = _debug_names(data, model, kinds)
+    return model
+
+
+def with_category_weight(model, category_weight):
+    """
+    Returns a view of `model` sharing its constraint arrays, with the category terms of the
+    objective reweighted (0 = phase 1 of the two-phase solve). The y columns are kept, so a
+    solution of one objective is a feasible start for the other.
+    """
+    if not model["use_category_diversity"]:
+        return model
+    y0, y1 = model["y_cols"]
+    c = model["c"].copy()
+    c[y0:y1] = -category_weight
+    return {**model, "c": c, "offset": category_weight * (y1 - y0)}
+
+
+def _debug_names(data, model, kinds):
+    """Readable names in the style of the PuLP model (x_<student>_<instance>, TotalDuration_<student>, ...)."""
+    sids, iids, cats = data["student_ids"], data["instance_ids"], data["categories"]
+    ps, pa = model["pair_student"], model["pair_instance"]
+    col_names = [f"x_{sids[s]}_{iids[a]}" for s, a in zip(ps.tolist(), pa.tolist())]
+    col_names += [f"dev_{a}" for a in iids] + [f"z_{s}" for s in sids] + [f"w_{s}" for s in sids]
+    if model["use_category_diversity"]:
+        col_names += [f"ycat_{s}_{c}" for s in sids for c in cats]
+    row_names = []
+    for kind, start, count in kinds:
+        row_names += [f"{kind}_{i}" for i in range(count)]
+    # Names must not contain spaces in MPS files
+    return [n.replace(" ", "_") for n in col_names], [n.replace(" ", "_") for n in row_names]
+
+
+def start_vector(model, data, x_pairs):
+    """
+    Completes a 0/1 assignment of the x pairs into a full column vector (dev, z, w, y derived),
+    usable as a MIP start.
+    """
+    x_pairs = np.asarray(x_pairs, dtype=float)
+    ps, pa = model["pair_student"], model["pair_instance"]
+    values = np.zeros(model["n_cols"])
+    values[slice(*model["x_cols"])] = x_pairs
+    counts = np.bincount(pa, weights=x_pairs, minlength=data["n_instances"])
+    values[slice(*model["dev_cols"])] = np.abs(counts - data["ideal"])
+    z = np.bincount(ps, weights=x_pairs * data["neutral"][ps, pa], minlength=data["n_students"])
+    values[slice(*model["z_cols"])] = z
+    values[slice(*model["w_cols"])] = np.maximum(z - 1, 0)
+    if model["use_category_diversity"]:
+        n_cat = data["n_categories"]
+        cat = data["category_ids"][pa]
+        covered = np.zeros(data["n_students"] * n_cat)
+        chosen = (x_pairs > 0.5) & (cat >= 0)
+        covered[ps[chosen] * n_cat + cat[chosen]] = 1
+        values[slice(*model["y_cols"])] = np.minimum(covered, model["col_upper"][slice(*model["y_cols"])])
+    return values
+
+
+def _fmt(v):
+    return "%.12g" % v
+
+
+def write_mps(model, path):
+    """Writes the model to a (free) MPS file, column by column from the CSR arrays. Returns (col_names, row_names)."""
+    n_rows, n_cols = model["n_rows"], model["n_cols"]
+    row_names = model["row_names"] or [f"R{i}" for i in range(n_rows)]
+    col_names = model["col_names"] or [f"C{j}" for j in range(n_cols)]
+    lower, upper = model["row_lower"], model["row_upper"]
+    lines = ["NAME PLANNING FREE", "ROWS", " N OBJ"]  # FREE: names and values are not column-aligned
+    senses = np.where(lower == upper, "E", np.where(np.isinf(lower), "L", "G"))
+    if np.any(np.isfinite(lower) & np.isfinite(upper) & (lower != upper)):
+        raise ValueError("Ranged rows are not supported by write_mps().")
+    lines += [f" {t} {n}" for t, n in zip(senses.tolist(), row_names)]
+    # CSR -> CSC
+    row_of_entry = np.repeat(np.arange(n_rows), np.diff(model["indptr"]))
+    order = np.argsort(model["indices"], kind="stable")
+    cols_sorted = model["indices"][order]; rows_sorted = row_of_entry[order]; vals_sorted = model["data"][order]
+    col_ptr = np.zeros(n_cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cols_sorted, minlength=n_cols), out=col_ptr[1:])
+    lines.append("COLUMNS")
+    c, integer = model["c"], model["integer"]
+    in_int = False
+    rows_list, vals_list = rows_sorted.tolist(), vals_sorted.tolist()
+    for j in range(n_cols):
+        if integer[j] != in_int:
+            lines.append(f"    MARKER 'MARKER' '{'INTORG' if integer[j] else 'INTEND'}'")
+            in_int = bool(integer[j])
+        name = col_names[j]
+        if c[j] != 0: lines.append(f"    {name} OBJ {_fmt(c[j])}")
+        for k in range(col_ptr[j], col_ptr[j + 1]):
+            lines.append(f"    {name} {row_names[rows_list[k]]} {_fmt(vals_list[k])}")
+        if c[j] == 0 and col_ptr[j] == col_ptr[j + 1]:
+            lines.append(f"    {name} OBJ 0")  # keep empty columns declared
+    if in_int: lines.append("    MARKER 'MARKER' 'INTEND'")
+    lines.append("RHS")
+    rhs = np.where(senses == "G", lower, upper)
+    for i in np.flatnonzero(rhs != 0).tolist():
+        lines.append(f"    RHS {row_names[i]} {_fmt(rhs[i])}")
+    lines.append("BOUNDS")
+    col_lower, col_upper = model["col_lower"], model["col_upper"]
+    for j in range(n_cols):
+        lo, up = col_lower[j], col_upper[j]
+        if lo == up: lines.append(f" FX BND {col_names[j]} {_fmt(lo)}"); continue
+        if lo != 0: lines.append(f" LO BND {col_names[j]} {_fmt(lo)}")
+        if np.isfinite(up): lines.append(f" UP BND {col_names[j]} {_fmt(up)}")
+        elif integer[j]: lines.append(f" PL BND {col_names[j]}")
+    lines.append("ENDATA")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return col_names, row_names
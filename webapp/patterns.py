@@ -0,0 +1,278 @@
+# patterns.py
+"""
+Schedule patterns and the aggregated (equivalence-class) model.
+
+A pattern is a complete weekly schedule: a set of admissible instances covering every
+session exactly once, with no workshop code repeated. Students with identical admissible
+instances and identical votes are interchangeable, so they are grouped in one class and the
+aggregated model only decides how many students of each class take each pattern:
+
+    [n per (class, pattern) | dev per instance]
+
+Assignment, neutral and category terms are constant per pattern, so they become plain
+pattern costs; only capacities and deviations link the classes. disaggregate() hands the
+patterns back to named students, deterministically (input order within a class).
+"""
+from collections import defaultdict
+
+import numpy as np
+
+from heuristics import best_schedule
+
+INF = float("inf")
+PATTERN_LIMIT = 20_000  # enumerated pattern columns; beyond, the pool is grown by column generation
+
+
+def signature_classes(data):
+    """
+    Groups students by preference signature: same admissible instances, same vote on each.
+
+    Returns:
+        list[np.ndarray]: student indices of every class, classes ordered by first member,
+                          members in input order.
+    """
+    ps, pa = data["pair_student"], data["pair_instance"]
+    starts = np.searchsorted(ps, np.arange(data["n_students"] + 1))
+    costs = data["costs"][ps, pa]
+    classes = {}
+    for s in range(data["n_students"]):
+        lo, hi = starts[s], starts[s + 1]
+        key = (pa[lo:hi].tobytes(), costs[lo:hi].tobytes())
+        classes.setdefault(key, []).append(s)
+    return [np.array(members, dtype=np.int64) for members in classes.values()]
+
+
+def enumerate_patterns(instances, masks, codes, full_mask, limit=PATTERN_LIMIT):
+    """
+    Lists the complete schedules that can be built from `instances`.
+
+    The lowest uncovered session must be opened by an instance whose own lowest session is
+    that one, so every schedule is produced exactly once.
+
+    Args:
+        instances (iterable[int]): admissible instance indices.
+        masks, codes (np.ndarray): session bitmask and code id of every instance.
+        full_mask (int): bitmask of all sessions.
+        limit (int | None): stop and return None beyond this many patterns.
+
+    Returns:
+        list[tuple[int, ...]] | None
+    """
+    opening = defaultdict(list)
+    for a in instances:
+        m = int(masks[a])
+        opening[m & -m].append(a)
+    patterns, stack, used_codes = [], [], set()
+
+    def extend(covered):
+        if covered == full_mask:
+            patterns.append(tuple(stack))
+            return limit is None or len(patterns) <= limit
+        free = full_mask & ~covered
+        for a in opening.get(free & -free, ()):
+            if masks[a] & covered or codes[a] in used_codes: continue
+            stack.append(a); used_codes.add(codes[a])
+            ok = extend(covered | int(masks[a]))
+            stack.pop(); used_codes.discard(codes[a])
+            if not ok: return False
+        return True
+
+    return patterns if extend(0) else None
+
+
+def pattern_costs(data, student, patterns, category_weight):
+    """
+    Objective contribution of one student taking each pattern: assignment costs, the
+    extra-neutral penalty on the neutral instances beyond the first and, with category
+    diversity, -weight per category covered (the constant weight * n_categories is
+    carried by the model offset). A category only counts when the student has a
+    non-vetoed admissible instance in it, as the y bounds of the matrix model do.
+    """
+    if not patterns: return np.zeros(0)
+    flat = np.fromiter((a for p in patterns for a in p), dtype=np.int64)
+    owner = np.repeat(np.arange(len(patterns)), [len(p) for p in patterns])
+    cost = np.bincount(owner, weights=data["costs"][student, flat], minlength=len(patterns))
+    neutrals = np.bincount(owner, weights=data["neutral"][student, flat], minlength=len(patterns))
+    cost += data["extra_neutral_penalty"] * np.maximum(neutrals - 1, 0)
+    n_cat = data["n_categories"]
+    if category_weight > 0 and n_cat >= 2:
+        ps, pa = data["pair_student"], data["pair_instance"]
+        mine = pa[ps == student]
+        cats = data["category_ids"][mine]
+        usable = (cats >= 0) & ~data["vetoed"][student, mine]
+        available = np.zeros(n_cat, dtype=bool); available[cats[usable]] = True
+        flat_cat = data["category_ids"][flat]
+        hit = (flat_cat >= 0) & available[np.maximum(flat_cat, 0)]
+        covered = np.zeros((len(patterns), n_cat), dtype=bool)
+        covered[owner[hit], flat_cat[hit]] = True
+        cost -= category_weight * covered.sum(axis=1)
+    return cost
+
+
+def build_pattern_model(data, classes, class_patterns, category_weight=None, slack_cost=None, integer=True):
+    """
+    Builds the aggregated model in the array format of model_matrix (usable by every backend).
+
+    Args:
+        data (dict): model data from solver_logic.prepare_model_data.
+        classes (list[np.ndarray]): student indices per class (see signature_classes).
+        class_patterns (list[list[tuple]]): patterns of every class.
+        category_weight (float | None): overrides data["category_weight"].
+        slack_cost (float | None): adds a continuous slack of this cost to every capacity row,
+            so that a restricted set of patterns always gives a feasible master (column generation).
+        integer (bool): False for the LP relaxation.
+
+    Returns:
+        dict: the model_matrix keys (c, offset, bounds, CSR arrays, rows) plus pattern_class
+              and pattern_list (class and instances of every n column), n_cols_patterns,
+              dev_cols / slack_cols and cap_instances (instance of every capacity row).
+    """
+    weight = data["category_weight"] if category_weight is None else category_weight
+    n_a, n_cat = data["n_instances"], data["n_categories"]
+    sizes = np.array([len(k) for k in classes], dtype=float)
+    pattern_class = np.repeat(np.arange(len(classes)), [len(p) for p in class_patterns])
+    pattern_list = [p for patterns in class_patterns for p in patterns]
+    capacity, ideal = data["capacity"].astype(float), data["ideal"].astype(float)
+    crowd = np.bincount(data["pair_instance"], minlength=n_a)
+    cap_inst = np.flatnonzero(crowd > capacity)
+    n_k, n_c = len(classes), len(cap_inst)
+    n_pat = len(pattern_list); dev0 = n_pat; slack0 = n_pat + n_a
+    n_cols = slack0 + (n_c if slack_cost is not None else 0)
+
+    c = np.zeros(n_cols)
+    c[:n_pat] = np.concatenate([pattern_costs(data, int(k[0]), p, weight) for k, p in zip(classes, class_patterns)]) if n_pat else 0
+    c[dev0:slack0] = data["deviation_weight"]
+    c[slack0:] = slack_cost if slack_cost is not None else 0
+    offset = weight * n_cat * data["n_students"] if weight > 0 and n_cat >= 2 else 0.0
+    col_lower = np.zeros(n_cols)
+    col_upper = np.full(n_cols, INF); col_upper[:n_pat] = sizes[pattern_class]
+    is_integer = np.zeros(n_cols, dtype=bool); is_integer[:n_pat] = integer
+
+    # Instance membership of every pattern column
+    entry_col = np.repeat(np.arange(n_pat), [len(p) for p in pattern_list])
+    entry_inst = np.fromiter((a for p in pattern_list for a in p), dtype=np.int64, count=len(entry_col))
+    cap_row = np.full(n_a, -1); cap_row[cap_inst] = np.arange(n_c)
+    in_cap = cap_row[entry_inst] >= 0
+    dev_cols = dev0 + np.arange(n_a)
+    # ClassSize: sum_p n_kp == |k| ; CapacitéMax ; DevPos: n_a - dev_a <= ideal ; DevNeg: n_a + dev_a >= ideal
+    rows = [pattern_class, n_k + cap_row[entry_inst][in_cap],
+            n_k + n_c + entry_inst, n_k + n_c + np.arange(n_a),
+            n_k + n_c + n_a + entry_inst, n_k + n_c + n_a + np.arange(n_a)]
+    cols = [np.arange(n_pat), entry_col[in_cap], entry_col, dev_cols, entry_col, dev_cols]
+    vals = [np.ones(n_pat), np.ones(int(in_cap.sum())), np.ones(len(entry_col)), -np.ones(n_a),
+            np.ones(len(entry_col)), np.ones(n_a)]
+    if slack_cost is not None:
+        rows.append(n_k + np.arange(n_c)); cols.append(slack0 + np.arange(n_c)); vals.append(-np.ones(n_c))
+    row_lower = np.concatenate([sizes, np.full(n_c, -INF), np.full(n_a, -INF), ideal])
+    row_upper = np.concatenate([sizes, capacity[cap_inst], ideal, np.full(n_a, INF)])
+    row_idx = np.concatenate(rows); col_idx = np.concatenate(cols); data_v = np.concatenate(vals)
+    n_rows = len(row_lower)
+    order = np.argsort(row_idx, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_idx, minlength=n_rows), out=indptr[1:])
+    return {
+        "n_rows": n_rows, "n_cols": n_cols, "c": c, "offset": offset,
+        "col_lower": col_lower, "col_upper": col_upper, "integer": is_integer,
+        "indptr": indptr, "indices": col_idx[order], "data": data_v[order],
+        "row_lower": row_lower, "row_upper": row_upper,
+        "n_cols_patterns": n_pat, "dev_cols": (dev0, slack0), "slack_cols": (slack0, n_cols), "cap_instances": cap_inst,
+        "pattern_class": pattern_class, "pattern_list": pattern_list,
+        "col_names": None, "row_names": None,
+    }
+
+
+def class_options(data, classes):
+    """Admissible instance indices of every class (those of its first member)."""
+    starts = np.searchsorted(data["pair_student"], np.arange(data["n_students"] + 1))
+    return [data["pair_instance"][starts[k[0]]:starts[k[0] + 1]].tolist() for k in classes]
+
+
+def non_dominated_pools(data, classes, limit=PATTERN_LIMIT):
+    """
+    Enumerates the non-dominated patterns of every class: a pattern through a vetoed instance
+    is dominated as soon as the class has a veto-free schedule (it costs VETO_PENALTY more than
+    any capacity trade-off could save), so those are only listed for classes without one.
+    Column generation (price_patterns) still brings a dominated pattern back if the duals ask for it.
+
+    Returns:
+        list[dict] | None: per class, frozenset(pattern) -> pattern; None beyond `limit` patterns.
+    """
+    full_mask = (1 << data["total_sessions"]) - 1
+    pools, budget = [], limit
+    for members, options in zip(classes, class_options(data, classes)):
+        vetoed = data["vetoed"][members[0]]
+        patterns = enumerate_patterns([a for a in options if not vetoed[a]], data["masks"], data["code_ids"], full_mask, limit=budget)
+        if patterns == []:
+            patterns = enumerate_patterns(options, data["masks"], data["code_ids"], full_mask, limit=budget)
+        if patterns is None: return None
+        pools.append({frozenset(p): p for p in patterns}); budget -= len(patterns)
+    return pools
+
+
+def price_patterns(data, classes, options, model, duals, pools, tolerance=1e-6):
+    """
+    Pricing step of the column generation: for every class, the schedule of least reduced cost
+    under the duals of the restricted master LP (class rows, capacity and deviation rows), found
+    by heuristics.best_schedule with dual-adjusted instance costs. Patterns of negative reduced
+    cost are added to `pools`.
+
+    Returns:
+        tuple: (columns added, sum of the negative reduced costs over the classes' members)
+    """
+    n_k, n_a = len(classes), data["n_instances"]
+    cap_inst = model["cap_instances"]; n_c = len(cap_inst)
+    instance_dual = duals[n_k + n_c:n_k + n_c + n_a] + duals[n_k + n_c + n_a:n_k + n_c + 2 * n_a]
+    instance_dual[cap_inst] += duals[n_k:n_k + n_c]
+    weight = data["category_weight"] if data["n_categories"] >= 2 else 0
+    full_mask = (1 << data["total_sessions"]) - 1
+    masks, codes, cats = data["masks"].tolist(), data["code_ids"].tolist(), data["category_ids"].tolist()
+    dual_list = instance_dual.tolist()
+    added, improvement = 0, 0.0
+    for k, (members, opts) in enumerate(zip(classes, options)):
+        s = int(members[0])
+        student_costs, neutral_row, vetoed_row = data["costs"][s].tolist(), data["neutral"][s].tolist(), data["vetoed"][s].tolist()
+        available_cats = {cats[a] for a in opts if cats[a] >= 0 and not vetoed_row[a]} if weight > 0 else set()
+        cost = {a: student_costs[a] - dual_list[a] for a in opts}
+        pattern = best_schedule(opts, masks, codes, cats, cost, neutral_row, available_cats,
+                                data["extra_neutral_penalty"], weight, full_mask)
+        if pattern is None or frozenset(pattern) in pools[k]: continue
+        reduced = pattern_costs(data, s, [pattern], weight)[0] - sum(dual_list[a] for a in pattern) - duals[k]
+        if reduced < -tolerance:
+            pools[k][frozenset(pattern)] = pattern; added += 1; improvement += reduced * len(members)
+    return added, improvement
+
+
+def pattern_start(model, data, classes, schedules):
+    """
+    Turns per-student schedules (student index -> instance indices, e.g. heuristics.greedy_plan)
+    into a full column vector of the aggregated model, usable as a MIP start.
+    """
+    column = {(int(k), frozenset(p)): j for j, (k, p) in enumerate(zip(model["pattern_class"].tolist(), model["pattern_list"]))}
+    values = np.zeros(model["n_cols"])
+    counts = np.zeros(data["n_instances"])
+    for k, members in enumerate(classes):
+        for s in members.tolist():
+            j = column.get((k, frozenset(schedules[s])))
+            if j is None: return None  # schedule outside the enumerated patterns
+            values[j] += 1
+            counts[list(schedules[s])] += 1
+    values[slice(*model["dev_cols"])] = np.abs(counts - data["ideal"])
+    return values
+
+
+def disaggregate(model, classes, values):
+    """
+    Hands the chosen patterns back to the students: within a class, members take the
+    patterns in column order, in input order.
+
+    Returns:
+        dict: student index -> tuple of instance indices.
+    """
+    counts = np.rint(values[:model["n_cols_patterns"]]).astype(np.int64)
+    schedule, next_member = {}, [0] * len(classes)
+    for j in np.flatnonzero(counts > 0).tolist():
+        k = model["pattern_class"][j]
+        for _ in range(counts[j]):
+            schedule[int(classes[k][next_member[k]])] = model["pattern_list"][j]
+            next_member[k] += 1
+    return schedule
@@ -0,0 +1,160 @@
+# repair.py
+"""
+Repair mode: re-optimizes a published plan after late changes, moving as few students as possible.
+
+The previous plan (the "Planning par élève" sheet of an earlier output) is matched to the updated
+data: students by Nom, Prénom and Classe, their schedules by workshop code and sessions. Only the
+perturbed students are freed: new students, students whose schedule no longer exists (workshop
+cancelled, sessions moved), is no longer admissible or now holds a veto, and every student of an
+instance whose new capacity is exceeded. Everybody else stays in place. The freed students are
+re-solved as a sub-MIP (the matrix model over them only, as in lns) where every session spent
+outside the previous schedule costs CHANGE_PENALTY, so a student only moves when it is worth it;
+if the fixed students leave the sub-MIP without solution, every student is freed.
+"""
+import time
+from collections import defaultdict
+
+import numpy as np
+import pulp
+
+from heuristics import greedy_plan, schedule_pairs
+from lns import _sub_data
+from model_matrix import build_model_matrix, start_vector
+from solver_backends import DEFAULT_BACKEND, get_backend
+
+CHANGE_PENALTY = 30  # per session assigned outside the previous schedule
+
+
+def _key(*values):
+    return tuple(str(v).strip() for v in values)
+
+
+def match_previous_plan(previous_rows, students, codes, sessions_covered):
+    """
+    Matches the rows of a previous plan to the current students and instances.
+
+    Args:
+        previous_rows (list): dicts with nom, prenom, classe and sessions (session name -> workshop code or "").
+        students (list): current students (dicts with nom, prenom, classe), in model order.
+        codes (list): workshop code of each instance, in model order.
+        sessions_covered (list): sessions (names) of each instance, in model order.
+
+    Returns:
+        tuple: (previous: student index -> tuple of instance indices, for the students found and whose
+                every session maps to an instance; matched: student index -> previous row, for every
+                student found; removed: previous rows matching no current student)
+    """
+    by_code_sessions = defaultdict(list)
+    for a, (code, sessions) in enumerate(zip(codes, sessions_covered)):
+        by_code_sessions[(_key(code), frozenset(sessions))].append(a)
+    current = defaultdict(list)
+    for s, stud in enumerate(students):
+        current[_key(stud["nom"], stud["prenom"], stud["classe"])].append(s)
+    previous, matched, removed = {}, {}, []
+    for row in previous_rows:
+        matches = current.get(_key(row["nom"], row["prenom"], row["classe"]))
+        if not matches:
+            removed.append(row); continue
+        s = matches.pop(0)  # homonyms in the same Classe are matched in order
+        matched[s] = row
+        sessions_by_code = defaultdict(set)
+        for session, code in row["sessions"].items():
+            if str(code).strip(): sessions_by_code[_key(code)].add(session)
+        schedule = [by_code_sessions.get((code, frozenset(sessions)), [None])[0] for code, sessions in sessions_by_code.items()]
+        if None not in schedule:
+            previous[s] = tuple(schedule)
+    return previous, matched, removed
+
+
+def _perturbed(data, previous, vetoes=True):
+    """Students to re-solve: without a usable previous schedule, holding a veto (if `vetoes`), or in an instance now over capacity."""
+    ps, pa = data["pair_student"], data["pair_instance"]
+    admissible = set(zip(ps.tolist(), pa.tolist()))
+    full_mask = (1 << data["total_sessions"]) - 1
+    masks = data["masks"].tolist()
+    freed = set()
+    for s in range(data["n_students"]):
+        schedule = previous.get(s)
+        covered = 0
+        for a in schedule or ():
+            if covered & masks[a]: covered = -1; break
+            covered |= masks[a]
+        if (schedule is None or covered != full_mask or any((s, a) not in admissible for a in schedule)
+                or (vetoes and data["vetoed"][s, list(schedule)].any())):
+            freed.add(s)
+    seated = defaultdict(list)
+    for s, schedule in previous.items():
+        if s not in freed:
+            for a in schedule: seated[a].append(s)
+    for a, members in seated.items():
+        if len(members) > data["capacity"][a]: freed.update(members)
+    return np.array(sorted(freed), dtype=np.int64)
+
+
+def _solve_freed(data, students, schedules, previous, change_penalty, solver_backend, time_limit, stop):
+    """
+    Solves the sub-MIP of the freed `students` (sorted), every other student fixed on `schedules`.
+
+    Returns:
+        dict | None: student index -> tuple of instance indices for the freed students, None without a solution.
+    """
+    freed = set(students.tolist())
+    kept = {s: (() if s in freed else schedule) for s, schedule in schedules.items()}
+    counts = np.bincount([a for schedule in kept.values() for a in schedule], minlength=data["n_instances"])
+    sub = _sub_data(data, students, counts, kept)
+    if (sub["capacity"] < 0).any():
+        return None
+    model = build_model_matrix(sub)
+    sub_ps, sub_pa = sub["pair_student"], sub["pair_instance"]
+    moved = np.array([a not in previous.get(s, ()) for s, a in zip(students[sub_ps].tolist(), sub_pa.tolist())], dtype=bool)
+    c = model["c"].copy()
+    c[slice(*model["x_cols"])] += change_penalty * sub["durations"][sub_pa] * moved
+    model = {**model, "c": c}
+    initial = greedy_plan(sub)
+    start = start_vector(model, sub, initial["x_pairs"]) if not initial["overflow"] else None
+    solved = get_backend(solver_backend)(model, time_limit=time_limit, gap_rel=0.001, start=start, stop=stop)
+    if solved["status"] != pulp.LpStatusOptimal:
+        if start is None: return None
+        values = start  # stopped or cut short before a solution: the heuristic completion
+    else:
+        values = solved["values"]
+    result = {s: [] for s in students.tolist()}
+    for k in np.flatnonzero(values[slice(*model["x_cols"])] > 0.5).tolist():
+        result[int(students[sub_ps[k]])].append(int(sub_pa[k]))
+    return {s: tuple(schedule) for s, schedule in result.items()}
+
+
+def repair_plan(data, previous, time_limit=60, change_penalty=CHANGE_PENALTY, solver_backend=DEFAULT_BACKEND, stop=None):
+    """
+    Repairs a previous plan on updated data, re-solving only the perturbed students.
+
+    Args:
+        data (dict): model data (see solver_logic.prepare_model_data).
+        previous (dict): student index -> tuple of instance indices (see match_previous_plan).
+        time_limit (float): seconds given to the solver.
+        change_penalty (float): cost of each session assigned outside a student's previous schedule.
+        solver_backend (str): backend solving the sub-MIP (see solver_backends).
+        stop (threading.Event | None): ends the search with the best plan found so far.
+
+    Returns:
+        dict | None: schedules (every student), objective (without change penalties), freed (students
+                     re-solved), widened (True when every student had to be freed), time_s;
+                     None if no plan was found.
+    """
+    t0 = time.time()
+    students = _perturbed(data, previous)
+    schedules = {s: previous.get(s, ()) for s in range(data["n_students"])}
+    widened = False
+    result = _solve_freed(data, students, schedules, previous, change_penalty, solver_backend, time_limit, stop) if len(students) else {}
+    if result is None and len(students) < data["n_students"]:
+        print(f"Réparation: aucun planning en ne libérant que {len(students)} élève(s), tous les élèves sont libérés.")
+        students, widened = np.arange(data["n_students"], dtype=np.int64), True
+        result = _solve_freed(data, students, schedules, previous, change_penalty, solver_backend,
+                              max(1, time_limit - (time.time() - t0)), stop)
+    if result is None:
+        return None
+    schedules.update(result)
+    model = build_model_matrix(data)
+    objective = float(model["c"] @ start_vector(model, data, schedule_pairs(data, schedules)) + model["offset"])
+    return {"schedules": schedules, "objective": objective, "freed": len(students), "widened": widened,
+            "time_s": round(time.time() - t0, 3)}
@@ -0,0 +1,120 @@
+# result_cache.py
+"""
+Content-addressed cache of finished plannings.
+
+A result is keyed by a digest of the input data as the solver reads it (the cell values of the
+Ateliers and Preferences sheets rather than the file bytes, so a workbook saved again still
+hits), the solver parameters, the objective constants and ENGINE_VERSION. Each entry is the
+output workbook plus its stats (JSON) in the cache folder; past max_entries or max_bytes, the
+least recently used entries are evicted. Recency is the files' modification time, so the
+order survives a restart.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from solver_logic import (ATELIERS_SHEET, DEVIATION_WEIGHT, ENGINE_VERSION, EXTRA_NEUTRAL_PENALTY, PREFERENCES_SHEET,
+                          PREF_REWARD, VETO_PENALTY)
+
+DEFAULT_MAX_ENTRIES = 100
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+
+def input_digest(path, sheets=(ATELIERS_SHEET, PREFERENCES_SHEET)):
+    """SHA-256 of the cell values of some sheets of a workbook (by default, the solver input), None if they cannot be read."""
+    names = list(sheets)
+    try:
+        sheets = pd.read_excel(path, sheet_name=names)
+    except Exception:
+        return None  # the solver reports the error itself
+    digest = hashlib.sha256()
+    for name in names:
+        digest.update(name.encode()); digest.update(sheets[name].to_csv(index=False).encode())
+    return digest.hexdigest()
+
+
+def cache_key(digest, **params):
+    """Key of a result: input digest, solver parameters (keyword arguments), objective constants and engine version."""
+    payload = {"input": digest, "params": params, "engine": ENGINE_VERSION,
+               "constants": [PREF_REWARD, VETO_PENALTY, DEVIATION_WEIGHT, EXTRA_NEUTRAL_PENALTY]}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def open_cache(folder, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Opens (or creates) a cache folder, indexing the entries already in it from least to most recently used.
+
+    Returns:
+        dict: folder, limits, index (OrderedDict key -> entry size in bytes), hit/miss counters and a lock.
+    """
+    os.makedirs(folder, exist_ok=True)
+    entries = []
+    for name in os.listdir(folder):
+        key, ext = os.path.splitext(name)
+        workbook = os.path.join(folder, key + ".xlsx")
+        if ext == ".json" and os.path.exists(workbook):
+            entries.append((os.path.getmtime(workbook), key, os.path.getsize(workbook) + os.path.getsize(os.path.join(folder, name))))
+    index = OrderedDict((key, size) for _, key, size in sorted(entries))
+    return {"folder": folder, "max_entries": max_entries, "max_bytes": max_bytes, "index": index,
+            "hits": 0, "misses": 0, "evictions": 0, "lock": threading.Lock()}
+
+
+def _paths(cache, key):
+    return os.path.join(cache["folder"], key + ".xlsx"), os.path.join(cache["folder"], key + ".json")
+
+
+def cache_get(cache, key, output_path):
+    """
+    Looks a key up; on a hit the cached workbook is copied to output_path.
+
+    Returns:
+        dict | None: the stats of the cached result, None on a miss.
+    """
+    with cache["lock"]:
+        if key not in cache["index"]:
+            cache["misses"] += 1
+            return None
+        workbook, stats_path = _paths(cache, key)
+        try:
+            shutil.copyfile(workbook, output_path)
+            with open(stats_path, encoding="utf-8") as f:
+                stats = json.load(f)
+        except OSError:
+            cache["index"].pop(key); cache["misses"] += 1  # entry removed behind our back
+            return None
+        os.utime(workbook)
+        cache["index"].move_to_end(key)
+        cache["hits"] += 1
+        return stats
+
+
+def cache_put(cache, key, output_path, stats):
+    """Stores a result (workbook at output_path and its stats), then evicts the least recently used entries over the limits."""
+    workbook, stats_path = _paths(cache, key)
+    with cache["lock"]:
+        shutil.copyfile(output_path, workbook + ".tmp"); os.replace(workbook + ".tmp", workbook)
+        with open(stats_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(stats, f, default=str)
+        os.replace(stats_path + ".tmp", stats_path)
+        cache["index"][key] = os.path.getsize(workbook) + os.path.getsize(stats_path)
+        cache["index"].move_to_end(key)
+        while len(cache["index"]) > 1 and (len(cache["index"]) > cache["max_entries"] or sum(cache["index"].values()) > cache["max_bytes"]):
+            old, _ = cache["index"].popitem(last=False)
+            for path in _paths(cache, old):
+                if os.path.exists(path): os.remove(path)
+            cache["evictions"] += 1
+
+
+def cache_stats(cache):
+    """Hit/miss/eviction counters and current size of the cache."""
+    with cache["lock"]:
+        lookups = cache["hits"] + cache["misses"]
+        return {"hits": cache["hits"], "misses": cache["misses"], "evictions": cache["evictions"],
+                "hit_rate": round(cache["hits"] / lookups, 3) if lookups else None,
+                "entries": len(cache["index"]), "bytes": sum(cache["index"].values()),
+                "max_entries": cache["max_entries"], "max_bytes": cache["max_bytes"]}
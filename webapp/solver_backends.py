@@ -0,0 +1,237 @@
+# solver_backends.py
+"""
+Solver backends for the matrix model (see model_matrix).
+
+Every backend has the same signature:
+    solve(model, time_limit=300, gap_rel=0.01, threads=1, start=None, keep_files=False, duals=False,
+          callback=None, stop=None)
+        model (dict): matrix model from model_matrix.build_model_matrix().
+        start (np.ndarray | None): full column vector used as MIP start.
+        keep_files (bool): keep intermediate files, if the backend uses any (debug).
+        duals (bool): also return the row duals (models without integer columns only).
+        callback (callable | None): callback(objective, bound) on every improved incumbent (bound may be None).
+        stop (threading.Event | None): when set, the search stops and returns its best incumbent.
+    and returns a dict: status (PuLP status code), values (np.ndarray, None if no solution), objective,
+    bound (best proven bound, None if unknown), proven (the search finished within gap_rel, not on
+    a limit or a stop) and, with duals=True, duals (np.ndarray, reduced costs being c - A^T duals).
+    An incumbent found before a limit or a stop counts as a solution (status LpStatusOptimal).
+
+"cbc" (default) runs the CBC binary shipped with PuLP; "highs" solves in-process through
+highspy, which receives the CSR arrays in memory (optional dependency).
+"""
+import os
+import re
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pulp
+
+from model_matrix import write_mps
+
+try:
+    import highspy
+except ImportError:  # optional backend
+    highspy = None
+
+DEFAULT_BACKEND = "cbc"
+CBC_TIME_GRACE = 2  # seconds past the time limit before CBC is interrupted
+# CBC log lines carrying a new incumbent / a better bound (objective without the model offset)
+NUMBER = r"([-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)"
+CBC_INCUMBENT = re.compile(r"Cbc00(?:04|12)I Integer solution of " + NUMBER)
+CBC_BOUND = re.compile(r"(?:Continuous objective value is|changed objective from \S+ to|best possible|Lower bound:)\s+" + NUMBER)
+# CBC block-buffers its log into a pipe; stdbuf (GNU coreutils), when present, makes incumbents arrive as found
+LINE_BUFFERED = [shutil.which("stdbuf"), "-oL"] if shutil.which("stdbuf") else []
+
+
+def _fmt(v):
+    return "%.12g" % v
+
+def _write_mipstart(path, col_names, values):
+    """Writes a CBC solution file used as MIP start (-mips)."""
+    lines = ["Stopped on time - objective value 0"]
+    lines += [f"{j:>7} {name} {_fmt(v):>15} {0:>23}" for j, (name, v) in enumerate(zip(col_names, values.tolist()))]
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def _read_cbc_solution(path, n_cols, col_index, n_rows=0, row_index=None):
+    """Parses a CBC solution file. Returns (status line, column values, row duals)."""
+    values = np.zeros(n_cols); duals = np.zeros(n_rows)
+    with open(path) as f:
+        status_line = f.readline().strip()
+        for line in f:
+            parts = line.split()
+            if len(parts) < 3: break
+            if parts[0] == "**": parts = parts[1:]
+            j = col_index.get(parts[1])
+            if j is not None: values[j] = float(parts[2])
+            elif row_index is not None and parts[1] in row_index: duals[row_index[parts[1]]] = float(parts[3])
+    return status_line, values, duals
+
+
+def _cbc_status(status_line):
+    """Maps the first line of a CBC solution file to a PuLP status code (same rules as PuLP)."""
+    words = status_line.split()
+    status = {"Optimal": pulp.LpStatusOptimal, "Infeasible": pulp.LpStatusInfeasible, "Integer": pulp.LpStatusInfeasible,
+              "Unbounded": pulp.LpStatusUnbounded, "Stopped": pulp.LpStatusNotSolved}.get(words[0] if words else "", pulp.LpStatusUndefined)
+    if status == pulp.LpStatusNotSolved and len(words) >= 5 and words[4] == "objective":
+        status = pulp.LpStatusOptimal  # stopped on a limit with an integer solution
+    return status
+
+
+def _follow_cbc_log(lines, offset, callback):
+    """Reads CBC's log as it is written, reporting new incumbents to callback(objective, bound). Returns the last bound."""
+    bound = incumbent = None
+    for line in lines:
+        match = CBC_BOUND.search(line)
+        if match and abs(float(match.group(1))) < 1e50: bound = float(match.group(1)) + offset  # +-1e50: none yet
+        match = CBC_INCUMBENT.search(line)
+        if match:
+            value = float(match.group(1)) + offset
+            if incumbent is None or value < incumbent - 1e-9:
+                incumbent = value
+                if callback: callback(incumbent, bound)
+    return bound
+
+
+def _interrupt(process, stop, deadline, interrupted):
+    """
+    Sends CBC a SIGINT (it then stops and writes its best solution) once `stop` is set or past
+    `deadline`: CBC only checks its own time limit between steps, which can be long on big models.
+    CBC only honours the signal at the same points, so it is killed if still running CBC_TIME_GRACE later.
+    """
+    while process.poll() is None:
+        if (stop is not None and stop.is_set()) or time.time() > deadline:
+            interrupted.set(); process.send_signal(signal.SIGINT)
+            try: process.wait(CBC_TIME_GRACE)
+            except subprocess.TimeoutExpired: process.kill()
+            return
+        time.sleep(0.2)
+
+
+def solve_cbc(model, time_limit=300, gap_rel=0.01, threads=1, start=None, keep_files=False, duals=False,
+              callback=None, stop=None):
+    """
+    Solves the matrix model with the CBC binary bundled with PuLP: the model goes through
+    an MPS file and a CBC subprocess, the solution is parsed back from CBC's solution file.
+    The log is followed while CBC runs for the incumbents and the bound.
+    """
+    cbc_path = pulp.PULP_CBC_CMD().path
+    tmp_dir = tempfile.mkdtemp(prefix="planning_cbc_")
+    mps_path = os.path.join(tmp_dir, "model.mps"); sol_path = os.path.join(tmp_dir, "model.sol"); mst_path = os.path.join(tmp_dir, "model.mst")
+    try:
+        col_names, row_names = write_mps(model, mps_path)
+        args = [cbc_path, mps_path]
+        if start is not None:
+            _write_mipstart(mst_path, col_names, start)
+            args += ["-mips", mst_path]
+        args += ["-sec", str(time_limit), "-ratio", str(gap_rel), "-threads", str(threads), "-timeMode", "elapsed",
+                 "-branch", "-printingOptions", "all", "-solution", sol_path]
+        process = subprocess.Popen(LINE_BUFFERED + args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, stdin=subprocess.DEVNULL, text=True)
+        interrupted = threading.Event()
+        threading.Thread(target=_interrupt, args=(process, stop, time.time() + time_limit + CBC_TIME_GRACE, interrupted),
+                         daemon=True).start()
+        bound = _follow_cbc_log(process.stdout, model["offset"], callback)
+        if process.wait() != 0:
+            if interrupted.is_set():  # interrupted before CBC could handle the signal, or killed
+                return {"status": pulp.LpStatusNotSolved, "values": None, "objective": None, "bound": bound}
+            raise pulp.PulpSolverError(f"Erreur lors de l'exécution de CBC ({cbc_path}).")
+        if not os.path.exists(sol_path):
+            raise pulp.PulpSolverError("CBC n'a pas produit de fichier solution.")
+        col_index = {name: j for j, name in enumerate(col_names)}
+        row_index = {name: i for i, name in enumerate(row_names)} if duals else None
+        status_line, values, row_duals = _read_cbc_solution(sol_path, model["n_cols"], col_index, model["n_rows"], row_index)
+        status = _cbc_status(status_line)
+        if status != pulp.LpStatusOptimal:
+            return {"status": status, "values": None, "objective": None}
+        objective = float(model["c"] @ values) + model["offset"]
+        proven = status_line.startswith("Optimal")
+        result = {"status": status, "values": values, "objective": objective, "proven": proven,
+                  "bound": min(bound, objective) if bound is not None else (objective if proven else None)}
+        if duals: result["duals"] = row_duals
+        return result
+    finally:
+        if keep_files: print(f"Fichiers CBC conservés dans {tmp_dir}")
+        else:
+            for p in (mps_path, sol_path, mst_path):
+                if os.path.exists(p): os.remove(p)
+            os.rmdir(tmp_dir)
+
+
+def solve_highs(model, time_limit=300, gap_rel=0.01, threads=1, start=None, keep_files=False, duals=False,
+                callback=None, stop=None):
+    """
+    Solves the matrix model in-process with HiGHS: the CSR arrays are passed to highspy as is,
+    without files nor subprocess. `threads` is left to HiGHS (it can only be set once per process).
+    Incumbents and stop requests go through the HiGHS MIP callbacks.
+    """
+    if highspy is None:
+        raise pulp.PulpSolverError("Le solveur HiGHS n'est pas installé (paquet highspy).")
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", False)
+    h.setOptionValue("time_limit", float(time_limit))
+    h.setOptionValue("mip_rel_gap", float(gap_rel))
+    lp = highspy.HighsLp()
+    lp.num_col_ = model["n_cols"]; lp.num_row_ = model["n_rows"]
+    lp.col_cost_ = model["c"]; lp.offset_ = model["offset"]
+    lp.col_lower_ = model["col_lower"]; lp.col_upper_ = model["col_upper"]
+    lp.row_lower_ = model["row_lower"]; lp.row_upper_ = model["row_upper"]
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.start_ = model["indptr"]; lp.a_matrix_.index_ = model["indices"]; lp.a_matrix_.value_ = model["data"]
+    lp.integrality_ = [highspy.HighsVarType.kInteger if flag else highspy.HighsVarType.kContinuous for flag in model["integer"].tolist()]
+    h.passModel(lp)
+    if start is not None:
+        solution = highspy.HighsSolution(); solution.col_value = start.tolist(); solution.value_valid = True
+        h.setSolution(solution)
+    if callback is not None:
+        h.cbMipImprovingSolution.subscribe(
+            lambda e: callback(e.data_out.objective_function_value,
+                               e.data_out.mip_dual_bound if np.isfinite(e.data_out.mip_dual_bound) else None))
+    if stop is not None:
+        h.cbMipInterrupt.subscribe(lambda e: e.interrupt() if stop.is_set() else None)
+    h.run()
+    model_status = h.getModelStatus()
+    if model_status == highspy.HighsModelStatus.kInfeasible:
+        return {"status": pulp.LpStatusInfeasible, "values": None, "objective": None}
+    has_solution = h.getInfo().primal_solution_status == highspy.SolutionStatus.kSolutionStatusFeasible
+    if not has_solution:
+        return {"status": pulp.LpStatusNotSolved, "values": None, "objective": None}
+    # Like CBC through PuLP, an incumbent found before a limit counts as a solution
+    solution = h.getSolution()
+    values = np.array(solution.col_value)
+    objective = float(model["c"] @ values) + model["offset"]
+    proven = model_status == highspy.HighsModelStatus.kOptimal
+    bound = h.getInfo().mip_dual_bound if model["integer"].any() else objective
+    result = {"status": pulp.LpStatusOptimal, "values": values, "objective": objective, "proven": proven,
+              "bound": min(bound, objective) if np.isfinite(bound) else (objective if proven else None)}
+    if duals: result["duals"] = np.array(solution.row_dual)
+    return result
+
+
+BACKENDS = {"cbc": solve_cbc, "highs": solve_highs}
+
+
+def relative_gap(objective, bound):
+    """Relative gap between an incumbent and a lower bound (None without a bound)."""
+    if objective is None or bound is None:
+        return None
+    return max(objective - bound, 0.0) / max(abs(objective), 1.0)
+
+
+def available_backends():
+    """Names of the backends usable in this environment."""
+    return [name for name in BACKENDS if name != "highs" or highspy is not None]
+
+
+def get_backend(name):
+    """Returns the solve function of a backend; raises ValueError if unknown or not installed."""
+    if name not in BACKENDS:
+        raise ValueError(f"Solveur inconnu '{name}' (disponibles: {', '.join(available_backends())}).")
+    if name not in available_backends():
+        raise ValueError(f"Solveur '{name}' indisponible sur ce serveur.")
+    return BACKENDS[name]
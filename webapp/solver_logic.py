@@ -1,12 +1,22 @@
 # solver_logic.py
+import numpy as np
 import pandas as pd
 import pulp
 from collections import defaultdict
 import math
 import os
 import time
+import tracemalloc
 import traceback
 
+from model_matrix import build_model_matrix, start_vector, with_category_weight
+from patterns import (build_pattern_model, class_options, disaggregate, non_dominated_pools, pattern_start, price_patterns,
+                      signature_classes)
+from heuristics import greedy_plan, schedule_pairs
+from lns import improve_plan
+from repair import CHANGE_PENALTY, _perturbed, match_previous_plan, repair_plan
+from solver_backends import DEFAULT_BACKEND, get_backend, relative_gap
+
 # --- Parameters and Config (Keep as is) ---
 PREF_REWARD = 10
 VETO_PENALTY = 1000
@@ -14,15 +24,530 @@ DEVIATION_WEIGHT = 50
 EXTRA_NEUTRAL_PENALTY = 25
 ATELIERS_SHEET = "Ateliers"
 PREFERENCES_SHEET = "Preferences"
+PLANNING_SHEET = "Planning par élève"
+CHANGES_SHEET = "Changements"
+ENGINE_VERSION = "3"  # bump on any change that can alter the plannings produced (keys the result cache)
+STUDENT_INFO_COLUMNS = ["Nom", "Prénom", "Classe", "# Préférences"]
 EXPECTED_SESSIONS = ["Lundi matin", "Lundi après-midi", "Mardi matin", "Mardi après-midi", "Mercredi matin"]
 TOTAL_SESSIONS = len(EXPECTED_SESSIONS)
 SESSION_COLUMNS = [f"Session {i}" for i in range(1, TOTAL_SESSIONS + 1)]
 session_indices = {session: i for i, session in enumerate(EXPECTED_SESSIONS)}
+FULL_SESSION_MASK = (1 << TOTAL_SESSIONS) - 1
+MODEL_BUILDERS = ("matrix", "pulp", "patterns", "aggregated")
+# Readable variable/constraint names in the matrix model (and kept CBC files) are for debugging only
+DEBUG_MODEL_NAMES = os.environ.get("PLANNING_DEBUG_MODEL", "") == "1"
+CG_MAX_ITERATIONS = 100  # column generation rounds before the integer master is solved anyway
+CG_TIME_LIMIT = 120  # seconds
+CG_SLACK_COST = 100 * VETO_PENALTY  # per seat over capacity in the restricted master
+TERMINATIONS = {"optimal": "Optimum (dans la tolérance)", "time_limit": "Limite de temps atteinte (meilleure solution)",
+                "stopped": "Arrêt demandé (meilleure solution)", "heuristic": "Heuristique"}
 # --- End Parameters ---
 
 
+# --- Preference ingestion ---
+def load_preferences(prefs_df):
+    """
+    Converts the Preferences sheet into a compact vote matrix.
+    Every cell is coerced to 1 (preference), -1 (veto) or 0 (neutral, empty or unreadable)
+    with vectorized operations: the value is truncated like int(float(v)) first.
+
+    Returns:
+        tuple: (students: list of dicts with id/nom/prenom/classe,
+                pref_matrix: np.ndarray int8 of shape (students, codes),
+                code_index: dict activity code -> column of pref_matrix)
+    """
+    codes = [c for c in prefs_df.columns if c not in STUDENT_INFO_COLUMNS]
+    code_index = {code: j for j, code in enumerate(codes)}
+    values = np.trunc(prefs_df[codes].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float))
+    pref_matrix = np.select([values == 1, values == -1], [1, -1], 0).astype(np.int8)
+    students = [{"id": f"{nom}_{prenom}_{classe}_{idx}", "nom": nom, "prenom": prenom, "classe": classe}
+                for idx, nom, prenom, classe in zip(prefs_df.index, prefs_df["Nom"], prefs_df["Prénom"], prefs_df["Classe"])]
+    return students, pref_matrix, code_index
+
+
+def instance_preferences(pref_matrix, code_index, activity_dict):
+    """
+    Gathers the (student x instance) vote matrix, columns in activity_dict order.
+    Instances whose code has no column in the Preferences sheet are neutral for everyone.
+    """
+    cols = np.array([code_index.get(inst["code"], -1) for inst in activity_dict.values()], dtype=np.intp)
+    instance_prefs = np.zeros((pref_matrix.shape[0], len(cols)), dtype=np.int8)
+    known = cols >= 0
+    instance_prefs[:, known] = pref_matrix[:, cols[known]]
+    return instance_prefs
+
+
+# --- Presolve ---
+def _session_mask(sessions):
+    """Bitmask of the sessions covered by an instance (bit i = EXPECTED_SESSIONS[i])."""
+    mask = 0
+    for sess in sessions: mask |= 1 << session_indices[sess]
+    return mask
+
+
+def _tileable_masks(instance_masks):
+    """
+    Returns the list tileable[m] for every session mask m: True if the sessions of m
+    can be covered exactly (no gap, no overlap) by disjoint instances with the given masks.
+    """
+    distinct_masks = set(instance_masks)
+    tileable = [False] * (FULL_SESSION_MASK + 1); tileable[0] = True
+    for m in range(1, FULL_SESSION_MASK + 1):
+        low = m & -m  # the lowest uncovered session must be opened by some instance
+        tileable[m] = any((im & low) and not (im & ~m) and tileable[m ^ im] for im in distinct_masks)
+    return tileable
+
+
+def presolve_assignments(activity_dict, student_ids, instance_prefs, hard_veto=False):
+    """
+    Computes, for every student, the workshop instances that can appear in a complete
+    schedule: the sessions an instance leaves free must be coverable exactly by other
+    instances. With hard_veto, instances the student vetoed are excluded as well.
+    instance_prefs is the (student x instance) vote matrix from instance_preferences().
+
+    Returns:
+        tuple: (admissible: dict student_id -> list of instance ids, vetoes_dropped: int)
+               A student mapped to an empty list has no valid schedule at all.
+    """
+    instance_ids = list(activity_dict)
+    masks = {a: _session_mask(inst["sessions_covered"]) for a, inst in activity_dict.items()}
+    tileable_cache = {}
+    admissible = {}; vetoes_dropped = 0
+    allowed_matrix = instance_prefs != -1
+    for i, s in enumerate(student_ids):
+        if hard_veto:
+            allowed = [instance_ids[j] for j in np.flatnonzero(allowed_matrix[i])]
+            vetoes_dropped += len(activity_dict) - len(allowed)
+        else:
+            allowed = instance_ids
+        allowed_masks = frozenset(masks[a] for a in allowed)
+        if allowed_masks not in tileable_cache: tileable_cache[allowed_masks] = _tileable_masks(allowed_masks)
+        tileable = tileable_cache[allowed_masks]
+        admissible[s] = [a for a in allowed if tileable[FULL_SESSION_MASK ^ masks[a]]]
+    return admissible, vetoes_dropped
+
+
+def _safe(name): return name.replace('/', '_').replace('\\', '_').replace(':', '_').replace(' ', '_').replace('-', '_')
+
+
+def assignment_cost_matrix(instance_prefs):
+    """Objective cost of every (student, instance) pair: -PREF_REWARD, VETO_PENALTY or 0."""
+    return np.select([instance_prefs == 1, instance_prefs == -1], [-PREF_REWARD, VETO_PENALTY], 0).astype(float)
+
+
+def prepare_model_data(activity_dict, student_ids, instance_prefs, admissible, categories, category_weight):
+    """
+    Precomputes the index arrays the matrix builder works from: admissible pairs as
+    (student index, instance index), per-instance durations, session masks, capacities,
+    code and category ids, plus the cost / neutral / veto matrices.
+    """
+    instance_ids = list(activity_dict)
+    col = {a: j for j, a in enumerate(instance_ids)}
+    pair_student = np.repeat(np.arange(len(student_ids)), [len(admissible[s]) for s in student_ids])
+    pair_instance = np.array([col[a] for s in student_ids for a in admissible[s]], dtype=np.int64)
+    code_ids = {}
+    category_index = {c: k for k, c in enumerate(categories)}
+    insts = list(activity_dict.values())
+    return {
+        "n_students": len(student_ids), "n_instances": len(instance_ids), "n_categories": len(categories),
+        "student_ids": student_ids, "instance_ids": instance_ids, "categories": categories,
+        "pair_student": pair_student.astype(np.int64), "pair_instance": pair_instance,
+        "durations": np.array([inst["duration"] for inst in insts], dtype=np.int64),
+        "masks": np.array([_session_mask(inst["sessions_covered"]) for inst in insts], dtype=np.int64),
+        "capacity": np.array([inst["max"] for inst in insts], dtype=np.int64),
+        "ideal": np.array([inst["ideal"] for inst in insts], dtype=np.int64),
+        "code_ids": np.array([code_ids.setdefault(inst["code"], len(code_ids)) for inst in insts], dtype=np.int64),
+        "category_ids": np.array([category_index.get(inst["category"], -1) for inst in insts], dtype=np.int64),
+        "costs": assignment_cost_matrix(instance_prefs),
+        "neutral": instance_prefs == 0, "vetoed": instance_prefs == -1,
+        "total_sessions": TOTAL_SESSIONS, "deviation_weight": DEVIATION_WEIGHT,
+        "extra_neutral_penalty": EXTRA_NEUTRAL_PENALTY, "category_weight": category_weight,
+    }
+
+
+def _full_constraint_count(activity_dict, n_students, categories, use_category_diversity):
+    """Number of constraints of the unpruned model (every student x every instance), for the presolve report."""
+    codes = defaultdict(int)
+    for inst in activity_dict.values(): codes[inst["code"]] += 1
+    covered_sessions = {sess for inst in activity_dict.values() for sess in inst["sessions_covered"]}
+    count = n_students * (3 + sum(1 for n in codes.values() if n > 1) + len(covered_sessions)) + 3 * len(activity_dict)
+    if use_category_diversity: count += n_students * (len(categories) + 1)
+    return count
+
+
+def _solver_report(backend, solve_time, solved, stop=None):
+    """
+    The "solver" entry of a solution: backend, solve time and how the search ended, with the
+    incumbent objective, the best bound and their relative gap.
+    """
+    report = {"backend": backend, "solve_time_s": round(solve_time, 3), "termination": None,
+              "incumbent_objective": None, "best_bound": None, "gap": None}
+    if solved["status"] == pulp.LpStatusOptimal:
+        termination = "optimal" if solved.get("proven") else ("stopped" if stop is not None and stop.is_set() else "time_limit")
+        report.update(termination=termination, incumbent_objective=solved["objective"], best_bound=solved.get("bound"),
+                      gap=relative_gap(solved["objective"], solved.get("bound")))
+    return report
+
+
+def _solve_or_stop(solve, model, start, stop, **options):
+    """
+    Runs `solve`, unless a stop was requested before it started; the start is returned as the
+    solution then, or when the search is cut short without any incumbent.
+    """
+    solved = None
+    if stop is None or not stop.is_set() or start is None:
+        solved = solve(model, start=start, stop=stop, **options)
+    if start is not None and (solved is None or solved["status"] == pulp.LpStatusNotSolved):
+        objective = float(model["c"] @ start + model["offset"])
+        bound = solved.get("bound") if solved is not None else None
+        return {"status": pulp.LpStatusOptimal, "values": start, "objective": objective,
+                "bound": min(bound, objective) if bound is not None else None, "proven": False}
+    return solved
+
+
+def _build_and_solve_matrix(data, activity_dict, student_ids, use_category_diversity, progress, measure_memory=False,
+                            solver_backend=DEFAULT_BACKEND, initial=None, time_limit=300, incumbent=None, stop=None,
+                            threads=None):
+    """
+    Builds the model as sparse arrays (model_matrix) and hands it to the selected backend
+    (solver_backends), starting from the heuristic plan `initial` (heuristics.greedy_plan) when given.
+    Improved incumbents of the final solve go to incumbent(objective, bound); once `stop` is set,
+    the search returns its best incumbent. Returns the same dict as _build_and_solve_pulp().
+    """
+    solve = get_backend(solver_backend)
+    t_model = time.time()
+    if measure_memory: tracemalloc.start()
+    model = build_model_matrix(data, debug_names=DEBUG_MODEL_NAMES)
+    t_built = time.time()
+    peak_memory = None
+    if measure_memory: peak_memory = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+    model_build = {"builder": "matrix", "build_time_s": round(t_built - t_model, 3),
+                   "peak_memory_mb": round(peak_memory / 2**20, 1) if peak_memory is not None else None,
+                   "variables": model["n_cols"], "constraints": model["n_rows"], "nonzeros": len(model["indices"])}
+    print(f"Modèle matriciel: {model['n_cols']} variables, {model['n_rows']} contraintes, {len(model['indices'])} non-zéros ({t_built - t_model:.2f}s)")
+    progress("Ajout des contraintes...", 55)
+
+    cbc_threads = threads or os.cpu_count() or 1
+    start = start_vector(model, data, initial["x_pairs"]) if initial is not None else None
+    if use_category_diversity:
+        # Phase 1 reuses the same constraint system, only the category terms of the objective are zeroed
+        print(f"Phase 1: résolution sans diversité catégorielle (warm-start)...")
+        t_swap = time.time()
+        warmup_model = with_category_weight(model, 0)
+        model_build["warmup_build_time_s"] = round(time.time() - t_swap, 3)
+        warmup = _solve_or_stop(solve, warmup_model, start, stop, time_limit=min(60, time_limit), gap_rel=0.01,
+                                threads=cbc_threads, keep_files=DEBUG_MODEL_NAMES)
+        print(f"Phase 1 terminée: {pulp.LpStatus[warmup['status']]} ({time.time() - t_built:.1f}s)")
+        if warmup["status"] == pulp.LpStatusOptimal:
+            warm_start = start_vector(model, data, warmup["values"][slice(*model["x_cols"])].round())
+            # A phase 1 cut short can be worse than the heuristic plan on the full objective
+            if start is None or model["c"] @ warm_start < model["c"] @ start: start = warm_start
+        print(f"Phase 2: résolution complète avec diversité catégorielle...")
+
+    progress("Résolution en cours...", 65)
+    t_solve = time.time()
+    solved = _solve_or_stop(solve, model, start, stop, time_limit=max(1, time_limit - (t_solve - t_built)),
+                            gap_rel=0.03 if use_category_diversity else 0.01, threads=cbc_threads, keep_files=DEBUG_MODEL_NAMES, callback=incumbent)
+    t_solved = time.time()
+    print(f"Statut du solveur ({solver_backend}) : {pulp.LpStatus[solved['status']]} (résolution: {t_solved - t_solve:.1f}s)")
+
+    result = {"status": solved["status"], "objective": None, "assignments": defaultdict(list), "deviation": {},
+              "constraints_built": model["n_rows"], "model_build": model_build,
+              "solver": _solver_report(solver_backend, t_solved - t_solve, solved, stop)}
+    if solved["status"] == pulp.LpStatusOptimal:
+        result["objective"] = solved["objective"]
+        values = solved["values"]
+        chosen = np.flatnonzero(values[slice(*model["x_cols"])] > 0.5)
+        for k in chosen.tolist():
+            result["assignments"][student_ids[data["pair_student"][k]]].append(data["instance_ids"][data["pair_instance"][k]])
+        result["deviation"] = dict(zip(data["instance_ids"], values[slice(*model["dev_cols"])].tolist()))
+    return result
+
+
+def _heuristic_solution(data, initial, model, values):
+    """The heuristic plan as a solution dict (same keys as _build_and_solve_pulp()), for instant mode."""
+    result = {"status": pulp.LpStatusOptimal, "objective": float(model["c"] @ values + model["offset"]),
+              "assignments": defaultdict(list), "constraints_built": model["n_rows"],
+              "deviation": dict(zip(data["instance_ids"], values[slice(*model["dev_cols"])].tolist())),
+              "model_build": {"builder": "heuristic", "build_time_s": 0.0, "peak_memory_mb": None,
+                              "variables": model["n_cols"], "constraints": model["n_rows"], "nonzeros": len(model["indices"])},
+              "solver": {"backend": "heuristic", "solve_time_s": initial["time_s"], "termination": "heuristic",
+                         "incumbent_objective": None, "best_bound": None, "gap": None}}
+    result["solver"]["incumbent_objective"] = result["objective"]
+    for s, schedule in initial["schedules"].items():
+        result["assignments"][data["student_ids"][s]] = [data["instance_ids"][a] for a in schedule]
+    return result
+
+
+def _build_and_solve_patterns(data, activity_dict, student_ids, use_category_diversity, progress, measure_memory=False,
+                              solver_backend=DEFAULT_BACKEND, initial=None, aggregate=False, time_limit=300, incumbent=None,
+                              stop=None, threads=None):
+    """
+    Set-partitioning over complete schedules (patterns.py): one column per (student, pattern) or,
+    with aggregate, per (class of students with identical preferences, pattern). The non-dominated
+    patterns are enumerated when they fit in PATTERN_LIMIT, otherwise the pool starts from the
+    heuristic plan `initial`; column generation then prices new patterns until the LP relaxation
+    is optimal, and the integer master is solved over the pool (incumbents and stop as in
+    _build_and_solve_matrix(); the LP bound holds for the full problem). Returns the same dict as
+    _build_and_solve_pulp(), model_build["patterns"] holding the column generation report.
+    """
+    solve = get_backend(solver_backend)
+    t_model = time.time()
+    if measure_memory: tracemalloc.start()
+    classes = signature_classes(data) if aggregate else [np.array([s]) for s in range(data["n_students"])]
+    options = class_options(data, classes)
+    pools = non_dominated_pools(data, classes)
+    enumerated = pools is not None
+    if not enumerated: pools = [{} for _ in classes]
+    for k, members in enumerate(classes):
+        for s in members.tolist():
+            schedule = initial["schedules"].get(s) if initial is not None else None
+            if schedule: pools[k].setdefault(frozenset(schedule), tuple(schedule))
+    print(f"Plannings candidats: {sum(len(p) for p in pools)} pour {len(classes)} {'classes' if aggregate else 'élèves'}"
+          f" ({'énumérés' if enumerated else 'plan heuristique'}).")
+    progress("Génération de colonnes...", 55)
+    cg_threads = threads or os.cpu_count() or 1
+    iterations = generated = 0; lp_bound = None
+    while True:
+        master = build_pattern_model(data, classes, [list(p.values()) for p in pools], slack_cost=CG_SLACK_COST, integer=False)
+        lp = solve(master, time_limit=60, threads=cg_threads, duals=True)
+        if lp["status"] != pulp.LpStatusOptimal: break
+        added, improvement = price_patterns(data, classes, options, master, lp["duals"], pools)
+        iterations += 1; generated += added; lp_bound = lp["objective"] + improvement
+        if not added or iterations >= CG_MAX_ITERATIONS or time.time() - t_model > min(CG_TIME_LIMIT, time_limit): break
+        if stop is not None and stop.is_set(): break
+    model = build_pattern_model(data, classes, [list(p.values()) for p in pools], slack_cost=CG_SLACK_COST)
+    t_built = time.time()
+    peak_memory = None
+    if measure_memory: peak_memory = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+    model_build = {"builder": "aggregated" if aggregate else "patterns", "build_time_s": round(t_built - t_model, 3),
+                   "peak_memory_mb": round(peak_memory / 2**20, 1) if peak_memory is not None else None,
+                   "variables": model["n_cols"], "constraints": model["n_rows"], "nonzeros": len(model["indices"]),
+                   "patterns": {"enumerated": enumerated, "columns": model["n_cols_patterns"], "cg_iterations": iterations,
+                                "columns_generated": generated, "lp_bound": lp_bound}}
+    if aggregate:
+        model_build["aggregation"] = {"students": data["n_students"], "classes": len(classes),
+                                      "compression_ratio": round(data["n_students"] / max(len(classes), 1), 2),
+                                      "patterns": model["n_cols_patterns"], "applied": True}
+    print(f"Génération de colonnes: {iterations} itération(s), {generated} planning(s) ajouté(s), borne LP "
+          f"{lp_bound if lp_bound is None else round(lp_bound, 2)} ({t_built - t_model:.2f}s)")
+
+    start = None
+    if initial is not None and not initial["overflow"]:
+        start = pattern_start(model, data, classes, initial["schedules"])
+    progress("Résolution en cours...", 65)
+    t_solve = time.time()
+    solved = _solve_or_stop(solve, model, start, stop, time_limit=max(1, time_limit - (t_solve - t_model)),
+                            gap_rel=0.03 if use_category_diversity else 0.01, threads=cg_threads, keep_files=DEBUG_MODEL_NAMES, callback=incumbent)
+    t_solved = time.time()
+    if solved["status"] == pulp.LpStatusOptimal and solved["values"][slice(*model["slack_cols"])].sum() > 0.5:
+        solved = {"status": pulp.LpStatusInfeasible, "values": None, "objective": None}  # capacities only met with slack
+    if solved["status"] == pulp.LpStatusOptimal:
+        # The master's own bound only covers the pool; the column generation bound covers every schedule
+        bounds = ([solved["bound"]] if enumerated and solved["bound"] is not None else []) + ([lp_bound] if lp_bound is not None else [])
+        solved["bound"] = min(max(bounds), solved["objective"]) if bounds else None
+    print(f"Statut du solveur ({solver_backend}) : {pulp.LpStatus[solved['status']]} (résolution: {t_solved - t_solve:.1f}s)")
+
+    result = {"status": solved["status"], "objective": None, "assignments": defaultdict(list), "deviation": {},
+              "constraints_built": model["n_rows"], "model_build": model_build,
+              "solver": _solver_report(solver_backend, t_solved - t_solve, solved, stop)}
+    if solved["status"] == pulp.LpStatusOptimal:
+        result["objective"] = solved["objective"]
+        for s, pattern in disaggregate(model, classes, solved["values"]).items():
+            result["assignments"][student_ids[s]] = [data["instance_ids"][a] for a in pattern]
+        result["deviation"] = dict(zip(data["instance_ids"], solved["values"][slice(*model["dev_cols"])].tolist()))
+    return result
+
+
+def _build_and_solve_pulp(activity_dict, student_ids, instance_prefs, admissible, categories, category_workshops,
+                          use_category_diversity, category_diversity_weight, progress, measure_memory=False,
+                          initial_assignments=None, time_limit=300):
+    """
+    Builds the PuLP model over the admissible (student, instance) pairs only and solves it with CBC.
+    Costs and neutral indicators are read from the (student x instance) vote matrix instance_prefs.
+    Constraints that the presolve made redundant (a capacity no admissible crowd can exceed,
+    a unique-code or overlap row holding a single variable, a category without admissible
+    instance) are not emitted. initial_assignments (student -> instance ids) is handed to CBC as warmStart.
+    The reference path reports no bound and cannot be stopped before time_limit.
+
+    Returns:
+        dict: status (pulp status code), objective, assignments (student -> instance ids),
+              deviation (instance -> value), constraints_built and model_build (size, time, memory).
+    """
+    t_model = time.time()
+    if measure_memory: tracemalloc.start()
+    prob = pulp.LpProblem("PlanningAteliersWeb", pulp.LpMinimize)
+    x = {s: {a_id: pulp.LpVariable(f"x_{s}_{a_id}", cat="Binary") for a_id in admissible[s]} for s in student_ids}
+    dev = {a_id: pulp.LpVariable(f"dev_{a_id}", lowBound=0, cat="Continuous") for a_id in activity_dict}
+    col = {a_id: j for j, a_id in enumerate(activity_dict)}
+    neutral_rows = (instance_prefs == 0).astype(np.int8).tolist()
+    cost_rows = assignment_cost_matrix(instance_prefs).tolist()
+    neutral_indicator = {s: {a_id: neutral_rows[i][col[a_id]] for a_id in x[s]} for i, s in enumerate(student_ids)}
+    z = {s: pulp.LpVariable(f"z_{s}", lowBound=0, cat="Integer") for s in student_ids}
+    w = {s: pulp.LpVariable(f"w_{s}", lowBound=0, cat="Continuous") for s in student_ids}
+    assignment_cost = {s: {a_id: cost_rows[i][col[a_id]] for a_id in x[s]} for i, s in enumerate(student_ids)}
+    assignment_costs = pulp.lpSum(assignment_cost[s][a_id] * x[s][a_id] for s in student_ids for a_id in x[s])
+    deviation_costs = pulp.lpSum(DEVIATION_WEIGHT * dev[a_id] for a_id in dev)
+    extra_neutral_penalty_term = pulp.lpSum(EXTRA_NEUTRAL_PENALTY * w[s] for s in student_ids)
+
+    # Category diversity variables and penalty
+    category_penalty_term = 0
+    if use_category_diversity:
+        safe_categories = {c: _safe(c) for c in categories}
+        y_cat = {s: {c: pulp.LpVariable(f"ycat_{_safe(s)}_{safe_categories[c]}", lowBound=0, upBound=1, cat="Continuous") for c in categories} for s in student_ids}
+        # Pre-fix y_cat=0 for impossible student-category pairs (all workshops vetoed or none admissible)
+        vetoed = instance_prefs == -1
+        for i, s in enumerate(student_ids):
+            for c in categories:
+                if all(vetoed[i, col[a]] or a not in x[s] for a in category_workshops[c]):
+                    y_cat[s][c].upBound = 0
+        category_penalty_term = category_diversity_weight * pulp.lpSum(
+            len(categories) - pulp.lpSum(y_cat[s][c] for c in categories)
+            for s in student_ids
+        )
+
+    prob += assignment_costs + deviation_costs + extra_neutral_penalty_term + category_penalty_term, "TotalCost"
+
+    # --- CONTRAINTES ---
+    # Pre-compute lookups for constraint generation
+    safe_student_ids = {s: _safe(s) for s in student_ids}
+    code_to_instances = defaultdict(list)
+    for a_id, inst in activity_dict.items():
+        code_to_instances[inst["code"]].append(a_id)
+    instances_covering_session = defaultdict(list)
+    for a, inst_data in activity_dict.items():
+        for sess in inst_data['sessions_covered']:
+            if sess in session_indices: instances_covering_session[sess].append(a)
+    safe_sessions = {sess: _safe(sess) for sess in EXPECTED_SESSIONS}
+    students_for_instance = defaultdict(list)
+    for s in student_ids:
+        for a in x[s]: students_for_instance[a].append(s)
+
+    t_constraints = time.time()
+    print(f"Ajout des contraintes... (variables: {t_constraints - t_model:.1f}s)")
+    progress("Ajout des contraintes...", 55)
+
+    def _add_structure(prob, x, dev, z, w, names):
+        """Adds the structural constraints over the admissible pairs."""
+        for s in student_ids: prob += pulp.lpSum(activity_dict[a]['duration'] * x[s][a] for a in x[s]) == TOTAL_SESSIONS, f"{names['TD']}_{s}"
+        for a in activity_dict:
+            # A capacity no admissible crowd can exceed is redundant
+            if len(students_for_instance[a]) > activity_dict[a]["max"]: prob += pulp.lpSum(x[s][a] for s in students_for_instance[a]) <= activity_dict[a]["max"], f"{names['CM']}_{a}"
+        for a in activity_dict: n_a = pulp.lpSum(x[s][a] for s in students_for_instance[a]); ideal = activity_dict[a]["ideal"]; prob += n_a - ideal <= dev[a], f"{names['DP']}_{a}"; prob += ideal - n_a <= dev[a], f"{names['DN']}_{a}"
+        for s in student_ids:
+            ss = safe_student_ids[s]
+            for code, rel_inst in code_to_instances.items():
+                rel = [a for a in rel_inst if a in x[s]]
+                if len(rel) > 1: prob += pulp.lpSum(x[s][a] for a in rel) <= 1, f"{names['UC']}_{ss}_{_safe(code)}"
+        for s in student_ids:
+            ss = safe_student_ids[s]
+            for sess in EXPECTED_SESSIONS:
+                rel = [a for a in instances_covering_session[sess] if a in x[s]]
+                if len(rel) > 1: prob += pulp.lpSum(x[s][a] for a in rel) <= 1, f"{names['OV']}_{ss}_{safe_sessions[sess]}"
+        for s in student_ids: prob += z[s] == pulp.lpSum(neutral_indicator[s][a] * x[s][a] for a in x[s]), f"{names['ZD']}_{s}"; prob += w[s] >= z[s] - 1, f"{names['WD']}_{s}"
+
+    _add_structure(prob, x, dev, z, w, {"TD": "TotalDuration", "CM": "CapacitéMax", "DP": "DevPos", "DN": "DevNeg", "UC": "UniqueCode", "OV": "Overlap", "ZD": "ZDef", "WD": "WDef"})
+
+    # Category diversity constraints
+    # Only CatMax needed: y_cat[s][c] <= sum(x[s][a]) forces y=0 when no workshop assigned.
+    # The objective maximizes y_cat, so the solver sets y=1 whenever allowed — no >= needed.
+    if use_category_diversity:
+        print("Ajout des contraintes de diversité catégorielle...")
+        for s in student_ids:
+            ss = safe_student_ids[s]
+            for c in categories:
+                if y_cat[s][c].upBound == 0: continue  # y already fixed to 0
+                cat_inst = [a for a in category_workshops[c] if a in x[s]]
+                prob += y_cat[s][c] <= pulp.lpSum(x[s][a] for a in cat_inst), f"CatMax_{ss}_{safe_categories[c]}"
+            # Session-count upper bound: can't cover more categories than sessions
+            prob += pulp.lpSum(y_cat[s][c] for c in categories) <= TOTAL_SESSIONS, f"CatSessionBound_{ss}"
+    constraints_built = len(prob.constraints)
+
+    # --- SOLVE THE MODEL ---
+    t_solve = time.time()
+    peak_memory = None
+    if measure_memory: peak_memory = tracemalloc.get_traced_memory()[1]; tracemalloc.stop()
+    model_build = {"builder": "pulp", "build_time_s": round(t_solve - t_model, 3),
+                   "peak_memory_mb": round(peak_memory / 2**20, 1) if peak_memory is not None else None,
+                   "variables": len(prob.variables()), "constraints": constraints_built,
+                   "nonzeros": sum(len(con) for con in prob.constraints.values())}
+    cbc_threads = os.cpu_count() or 1
+    warm_started = initial_assignments is not None
+    if warm_started:
+        for s in student_ids:
+            chosen = set(initial_assignments.get(s, ()))
+            for a_id in x[s]: x[s][a_id].setInitialValue(1 if a_id in chosen else 0)
+
+    # Warm-start: solve the same problem without the category penalty first; CBC writes the
+    # phase-1 values back on the shared variables, which become the MIP start of phase 2.
+    if use_category_diversity:
+        print(f"Phase 1: résolution sans diversité catégorielle (warm-start)...")
+        t_swap = time.time()
+        full_objective = prob.objective
+        prob.setObjective(assignment_costs + deviation_costs + extra_neutral_penalty_term)
+        model_build["warmup_build_time_s"] = round(time.time() - t_swap, 3)
+        solver_warmup = pulp.PULP_CBC_CMD(msg=False, timeLimit=min(60, time_limit), gapRel=0.01, threads=cbc_threads, warmStart=warm_started)
+        prob.solve(solver_warmup)
+        t_warmup = time.time()
+        print(f"Phase 1 terminée: {pulp.LpStatus[prob.status]} ({t_warmup - t_solve:.1f}s)")
+        warm_started = warm_started or prob.status == pulp.LpStatusOptimal
+        prob.setObjective(full_objective)
+        print(f"Phase 2: résolution complète avec diversité catégorielle...")
+
+    print(f"Résolution du modèle... (contraintes: {time.time() - t_constraints:.1f}s)")
+    progress("Résolution en cours...", 65)
+    solver = pulp.PULP_CBC_CMD(
+        msg=False,
+        timeLimit=time_limit,
+        gapRel=0.03 if use_category_diversity else 0.01,
+        threads=cbc_threads,
+        warmStart=warm_started,
+    )
+    t_main = time.time()
+    prob.solve(solver)
+    t_solved = time.time()
+    print(f"Statut du solveur : {pulp.LpStatus[prob.status]} (résolution: {t_solved - t_solve:.1f}s)")
+
+    result = {"status": prob.status, "objective": None, "assignments": defaultdict(list), "deviation": {},
+              "constraints_built": constraints_built, "model_build": model_build,
+              "solver": {"backend": "cbc", "solve_time_s": round(t_solved - t_main, 3), "termination": None,
+                         "incumbent_objective": None, "best_bound": None, "gap": None}}
+    if prob.status == pulp.LpStatusOptimal:
+        result["objective"] = pulp.value(prob.objective) if prob.objective is not None else None
+        result["solver"].update(incumbent_objective=result["objective"],
+                                termination="optimal" if prob.sol_status == pulp.LpSolutionOptimal else "time_limit")
+        # Cache all assignments once (avoids repeated pulp.value() calls)
+        for s in student_ids:
+            for a in x[s]:
+                if pulp.value(x[s][a]) == 1:
+                    result["assignments"][s].append(a)
+        result["deviation"] = {a: pulp.value(dev[a]) or 0 for a in dev}
+    return result
+
+
 # --- Main optimization function ---
-def run_optimization(input_excel_path, output_excel_path, category_diversity_weight=0, progress_callback=None):
+def _read_planning(path, label):
+    """
+    Reads the "Planning par élève" sheet of an output workbook as rows for repair.match_previous_plan.
+
+    Returns:
+        tuple: (rows: list of dicts with nom, prenom, classe, sessions | None, error message | None)
+    """
+    try:
+        planning_df = pd.read_excel(path, sheet_name=PLANNING_SHEET)
+    except ValueError: return None, f"ERREUR: Onglet '{PLANNING_SHEET}' introuvable dans le {label}."
+    except Exception as e: return None, f"Erreur lecture du {label}: {e}"
+    missing_cols = [col for col in ["Nom", "Prénom", "Classe"] + EXPECTED_SESSIONS if col not in planning_df.columns]
+    if missing_cols: return None, f"ERREUR: Colonnes manquantes '{PLANNING_SHEET}' ({label}): {', '.join(missing_cols)}"
+    return [{"nom": row["Nom"], "prenom": row["Prénom"], "classe": row["Classe"],
+             "sessions": {session: "" if pd.isna(row[session]) else row[session] for session in EXPECTED_SESSIONS}}
+            for row in planning_df.to_dict("records")], None
+
+
+def run_optimization(input_excel_path, output_excel_path, category_diversity_weight=0, progress_callback=None, hard_veto=False,
+                     model_builder="matrix", measure_memory=False, solver_backend=DEFAULT_BACKEND, instant=False,
+                     lns_time_limit=0, lns_workers=None, time_limit=300, stop_event=None, previous_plan_path=None,
+                     start_plan_path=None, threads=None):
     """
     Runs the planning optimization.
 
@@ -30,19 +555,59 @@ def run_optimization(input_excel_path, output_excel_path, category_diversity_wei
         input_excel_path (str): Path to the uploaded Excel template.
         output_excel_path (str): Path where the resulting Excel should be saved.
         category_diversity_weight (float): Weight for category diversity penalty (0 = disabled).
+        hard_veto (bool): Drop vetoed (student, workshop) pairs from the model entirely; falls back
+            to the soft VETO_PENALTY if the reduced model is infeasible.
+        model_builder (str): "matrix" (sparse arrays handed to CBC), "pulp" (reference PuLP expressions),
+            "patterns" (set partitioning over complete schedules, with column generation) or "aggregated"
+            (the same with students of identical preferences grouped, one count per class and schedule).
+        measure_memory (bool): trace the peak memory of the model build (slows the build down).
+        solver_backend (str): "cbc" or "highs" (see solver_backends); the "pulp" builder only runs CBC.
+        instant (bool): return the constructive heuristic plan (heuristics.greedy_plan) without solving
+            the MIP; the MIP still runs if the heuristic cannot respect every capacity.
+        lns_time_limit (float): improve the heuristic plan by large neighborhood search (lns.improve_plan)
+            for this many seconds instead of solving the full MIP (0 = disabled); same fallback as instant.
+        lns_workers (int | None): worker processes of the LNS (default: one per CPU).
+        time_limit (float): seconds given to the solver (warm-up phase and column generation included);
+            the best incumbent found by then is returned, stats["solver"] reporting its termination, objective, best bound and gap.
+        stop_event (threading.Event | None): when set, the search stops and the best plan found so
+            far is returned (not supported by the "pulp" builder).
+        previous_plan_path (str | None): output workbook of an earlier run; repair mode (repair.repair_plan):
+            only the students its plan no longer fits are re-solved, changes penalized, and the output gets
+            a "Changements" sheet listing who moved.
+        start_plan_path (str | None): output workbook of an earlier run (e.g. the same data at a neighbouring
+            category weight) whose planning starts the search instead of the heuristic plan when it fits the
+            data and no worse.
+        threads (int | None): solver threads (default: one per CPU).
+        progress_callback: called as progress_callback(step, pct) and, on every improved incumbent,
+            progress_callback(step, pct, incumbent) with incumbent = {objective, bound, gap}.
 
     Returns:
         tuple: (success: bool, message: str, stats: dict | None)
                stats dictionary contains key metrics on success, otherwise None.
     """
-    def _progress(step, pct):
+    def _progress(step, pct, incumbent=None):
         if progress_callback:
-            progress_callback(step, pct)
+            if incumbent is None: progress_callback(step, pct)
+            else: progress_callback(step, pct, incumbent)
+
+    def _incumbent(objective, bound):
+        gap = relative_gap(objective, bound)
+        print(f"Nouvelle solution: objectif {objective:.2f}" + (f", écart {100 * gap:.2f}%" if gap is not None else ""))
+        _progress(f"Solution trouvée : objectif {objective:.2f}" + (f" (écart {100 * gap:.1f}%)" if gap is not None else ""), 75,
+                  {"objective": objective, "bound": bound, "gap": gap})
 
     t_start = time.time()
     print(f"Starting optimization for input: {input_excel_path}")
     _progress("Démarrage...", 5)
     stats_summary = None
+    try:
+        get_backend(solver_backend)
+        if model_builder not in MODEL_BUILDERS:
+            raise ValueError(f"Constructeur de modèle inconnu '{model_builder}' (disponibles: {', '.join(MODEL_BUILDERS)}).")
+        if model_builder == "pulp" and solver_backend != "cbc":
+            raise ValueError("Le modèle PuLP de référence ne se résout qu'avec CBC.")
+    except ValueError as e:
+        return False, f"ERREUR: {e}", None
     try:
         # --- LECTURE DES DONNÉES (Keep as is) ---
         print("Lecture du fichier Excel...")
@@ -55,6 +620,13 @@ def run_optimization(input_excel_path, output_excel_path, category_diversity_wei
         except Exception as e: return False, f"Erreur lecture Excel: {e}", None
         missing_session_cols = [col for col in SESSION_COLUMNS if col not in activities_df.columns];
         if missing_session_cols: return False, f"ERREUR: Colonnes manquantes '{ATELIERS_SHEET}': {', '.join(missing_session_cols)}", None
+        previous_rows = start_rows = None
+        if previous_plan_path:
+            previous_rows, error = _read_planning(previous_plan_path, "planning précédent")
+            if error: return False, error, None
+        if start_plan_path:
+            start_rows, error = _read_planning(start_plan_path, "planning de départ")
+            if error: return False, error, None
 
         # --- PRÉPARATION DES ATELIERS (Keep as is) ---
         print("Préparation des instances d'ateliers...")
@@ -95,175 +667,136 @@ def run_optimization(input_excel_path, output_excel_path, category_diversity_wei
             print("Attention: Moins de 2 catégories trouvées, diversité catégorielle désactivée.")
             use_category_diversity = False
 
-        # --- PRÉPARATION DES PRÉFÉRENCES (Keep as is) ---
+        # --- PRÉPARATION DES PRÉFÉRENCES ---
         print("Préparation des préférences élèves...")
         _progress("Chargement des préférences...", 30)
-        students = []
-        student_dict = {}
-        activity_codes_in_prefs = set(prefs_df.columns) - {"Nom", "Prénom", "Classe", "# Préférences"}
-        for idx, row in prefs_df.iterrows():
-            student_id = f"{row['Nom']}_{row['Prénom']}_{row['Classe']}_{idx}"
-            prefs = defaultdict(int)
-            for code in activity_codes_in_prefs:
-                val = row[code]
-                if pd.notna(val):
-                    try: pref_val = int(float(val)); prefs[code] = pref_val if pref_val in [1, -1] else 0
-                    except (ValueError, TypeError): pass
-            students.append({"id": student_id, "nom": row["Nom"], "prenom": row["Prénom"], "classe": row["Classe"], "prefs": prefs})
+        students, pref_matrix, code_index = load_preferences(prefs_df)
         student_ids = [s["id"] for s in students]; student_dict = {s["id"]: s for s in students}
         if not student_ids: return False, "ERREUR: Aucun élève chargé.", None
-        print(f"{len(student_ids)} élèves chargés.")
+        instance_prefs = instance_preferences(pref_matrix, code_index, activity_dict)
+        print(f"{len(student_ids)} élèves chargés ({len(code_index)} codes).")
+        if previous_rows is not None:
+            previous, matched, removed = match_previous_plan(previous_rows, students, [inst["code"] for inst in activity_dict.values()],
+                                                             [inst["sessions_covered"] for inst in activity_dict.values()])
+            print(f"Planning précédent: {len(matched)} élève(s) retrouvé(s), {len(previous)} planning(s) réutilisable(s), "
+                  f"{len(removed)} élève(s) retiré(s).")
 
 
-        # --- MODÈLE D'OPTIMISATION (Keep as is) ---
+        # --- PRESOLVE + MODÈLE D'OPTIMISATION ---
         t_model = time.time()
         print(f"Mise en place du modèle... (lecture: {t_model - t_start:.1f}s)")
         _progress("Construction du modèle...", 40)
-        def _safe(name): return name.replace('/', '_').replace('\\', '_').replace(':', '_').replace(' ', '_').replace('-', '_')
-        prob = pulp.LpProblem("PlanningAteliersWeb", pulp.LpMinimize)
-        x = {s: {a_id: pulp.LpVariable(f"x_{s}_{a_id}", cat="Binary") for a_id in activity_dict} for s in student_ids}
-        dev = {a_id: pulp.LpVariable(f"dev_{a_id}", lowBound=0, cat="Continuous") for a_id in activity_dict}
-        neutral_indicator = {s: {a_id: 1 if student_dict[s]["prefs"][activity_dict[a_id]["code"]] == 0 else 0 for a_id in activity_dict} for s in student_ids}
-        z = {s: pulp.LpVariable(f"z_{s}", lowBound=0, cat="Integer") for s in student_ids}
-        w = {s: pulp.LpVariable(f"w_{s}", lowBound=0, cat="Continuous") for s in student_ids}
-        assignment_costs = pulp.lpSum((-PREF_REWARD if student_dict[s]["prefs"][activity_dict[a_id]["code"]] == 1 else VETO_PENALTY if student_dict[s]["prefs"][activity_dict[a_id]["code"]] == -1 else 0) * x[s][a_id] for s in student_ids for a_id in activity_dict)
-        deviation_costs = pulp.lpSum(DEVIATION_WEIGHT * dev[a_id] for a_id in dev)
-        extra_neutral_penalty_term = pulp.lpSum(EXTRA_NEUTRAL_PENALTY * w[s] for s in student_ids)
-
-        # Category diversity variables and penalty
-        category_penalty_term = 0
-        if use_category_diversity:
-            safe_categories = {c: _safe(c) for c in categories}
-            y_cat = {s: {c: pulp.LpVariable(f"ycat_{_safe(s)}_{safe_categories[c]}", lowBound=0, upBound=1, cat="Continuous") for c in categories} for s in student_ids}
-            # Pre-fix y_cat=0 for impossible student-category pairs (all workshops vetoed)
-            for s in student_ids:
-                for c in categories:
-                    if all(student_dict[s]["prefs"][activity_dict[a]["code"]] == -1 for a in category_workshops[c]):
-                        y_cat[s][c].upBound = 0
-            category_penalty_term = category_diversity_weight * pulp.lpSum(
-                len(categories) - pulp.lpSum(y_cat[s][c] for c in categories)
-                for s in student_ids
-            )
-
-        prob += assignment_costs + deviation_costs + extra_neutral_penalty_term + category_penalty_term, "TotalCost"
-
-        # --- CONTRAINTES ---
-        # Pre-compute lookups for constraint generation
-        safe_student_ids = {s: _safe(s) for s in student_ids}
-        code_to_instances = defaultdict(list)
-        for a_id, inst in activity_dict.items():
-            code_to_instances[inst["code"]].append(a_id)
-        instances_covering_session = defaultdict(list)
-        for a, inst_data in activity_dict.items():
-            for sess in inst_data['sessions_covered']:
-                if sess in session_indices: instances_covering_session[sess].append(a)
-        safe_sessions = {sess: _safe(sess) for sess in EXPECTED_SESSIONS}
-
-        t_constraints = time.time()
-        print(f"Ajout des contraintes... (variables: {t_constraints - t_model:.1f}s)")
-        _progress("Ajout des contraintes...", 55)
-        for s in student_ids: prob += pulp.lpSum(activity_dict[a]['duration'] * x[s][a] for a in activity_dict) == TOTAL_SESSIONS, f"TotalDuration_{s}"
-        for a in activity_dict: prob += pulp.lpSum(x[s][a] for s in student_ids) <= activity_dict[a]["max"], f"CapacitéMax_{a}"
-        for a in activity_dict: n_a = pulp.lpSum(x[s][a] for s in student_ids); ideal = activity_dict[a]["ideal"]; prob += n_a - ideal <= dev[a], f"DevPos_{a}"; prob += ideal - n_a <= dev[a], f"DevNeg_{a}"
-        for s in student_ids:
-            ss = safe_student_ids[s]
-            for code, rel_inst in code_to_instances.items():
-                if len(rel_inst) > 1: prob += pulp.lpSum(x[s][a] for a in rel_inst) <= 1, f"UniqueCode_{ss}_{_safe(code)}"
-        for s in student_ids:
-            ss = safe_student_ids[s]
-            for sess in EXPECTED_SESSIONS:
-                rel_inst = instances_covering_session[sess]
-                if rel_inst: prob += pulp.lpSum(x[s][a] for a in rel_inst) <= 1, f"Overlap_{ss}_{safe_sessions[sess]}"
-        for s in student_ids: prob += z[s] == pulp.lpSum(neutral_indicator[s][a] * x[s][a] for a in activity_dict), f"ZDef_{s}"; prob += w[s] >= z[s] - 1, f"WDef_{s}"
-
-        # Category diversity constraints
-        # Only CatMax needed: y_cat[s][c] <= sum(x[s][a]) forces y=0 when no workshop assigned.
-        # The objective maximizes y_cat, so the solver sets y=1 whenever allowed — no >= needed.
-        if use_category_diversity:
-            print("Ajout des contraintes de diversité catégorielle...")
-            for s in student_ids:
-                ss = safe_student_ids[s]
-                for c in categories:
-                    cat_inst = category_workshops[c]
-                    prob += y_cat[s][c] <= pulp.lpSum(x[s][a] for a in cat_inst), f"CatMax_{ss}_{safe_categories[c]}"
-                # Session-count upper bound: can't cover more categories than sessions
-                prob += pulp.lpSum(y_cat[s][c] for c in categories) <= TOTAL_SESSIONS, f"CatSessionBound_{ss}"
-
-        # --- SOLVE THE MODEL ---
-        t_solve = time.time()
-        cbc_threads = os.cpu_count() or 1
-
-        # Warm-start: solve without category penalty first, then use as starting point
-        if use_category_diversity:
-            print(f"Phase 1: résolution sans diversité catégorielle (warm-start)...")
-            # Temporarily replace objective with category-free version
-            prob_warmup = pulp.LpProblem("WarmStart", pulp.LpMinimize)
-            # Re-use the same x, dev, w variables in a lightweight problem
-            x_warmup = {s: {a_id: pulp.LpVariable(f"xw_{s}_{a_id}", cat="Binary") for a_id in activity_dict} for s in student_ids}
-            dev_warmup = {a_id: pulp.LpVariable(f"devw_{a_id}", lowBound=0, cat="Continuous") for a_id in activity_dict}
-            z_warmup = {s: pulp.LpVariable(f"zw_{s}", lowBound=0, cat="Integer") for s in student_ids}
-            w_warmup = {s: pulp.LpVariable(f"ww_{s}", lowBound=0, cat="Continuous") for s in student_ids}
-            # Objective without category penalty
-            warmup_assignment = pulp.lpSum((-PREF_REWARD if student_dict[s]["prefs"][activity_dict[a_id]["code"]] == 1 else VETO_PENALTY if student_dict[s]["prefs"][activity_dict[a_id]["code"]] == -1 else 0) * x_warmup[s][a_id] for s in student_ids for a_id in activity_dict)
-            warmup_deviation = pulp.lpSum(DEVIATION_WEIGHT * dev_warmup[a_id] for a_id in dev_warmup)
-            warmup_neutral = pulp.lpSum(EXTRA_NEUTRAL_PENALTY * w_warmup[s] for s in student_ids)
-            prob_warmup += warmup_assignment + warmup_deviation + warmup_neutral, "WarmupCost"
-            # Same structural constraints
-            for s in student_ids: prob_warmup += pulp.lpSum(activity_dict[a]['duration'] * x_warmup[s][a] for a in activity_dict) == TOTAL_SESSIONS, f"TD_{s}"
-            for a in activity_dict: prob_warmup += pulp.lpSum(x_warmup[s][a] for s in student_ids) <= activity_dict[a]["max"], f"CM_{a}"
-            for a in activity_dict: n_a = pulp.lpSum(x_warmup[s][a] for s in student_ids); ideal = activity_dict[a]["ideal"]; prob_warmup += n_a - ideal <= dev_warmup[a], f"DP_{a}"; prob_warmup += ideal - n_a <= dev_warmup[a], f"DN_{a}"
-            for s in student_ids:
-                ss = safe_student_ids[s]
-                for code, rel_inst in code_to_instances.items():
-                    if len(rel_inst) > 1: prob_warmup += pulp.lpSum(x_warmup[s][a] for a in rel_inst) <= 1, f"UC_{ss}_{_safe(code)}"
-            for s in student_ids:
-                ss = safe_student_ids[s]
-                for sess in EXPECTED_SESSIONS:
-                    rel_inst = instances_covering_session[sess]
-                    if rel_inst: prob_warmup += pulp.lpSum(x_warmup[s][a] for a in rel_inst) <= 1, f"OV_{ss}_{safe_sessions[sess]}"
-            for s in student_ids: prob_warmup += z_warmup[s] == pulp.lpSum(neutral_indicator[s][a] * x_warmup[s][a] for a in activity_dict), f"ZD_{s}"; prob_warmup += w_warmup[s] >= z_warmup[s] - 1, f"WD_{s}"
-            # Solve warm-up (fast)
-            solver_warmup = pulp.PULP_CBC_CMD(msg=False, timeLimit=60, gapRel=0.01, threads=cbc_threads)
-            prob_warmup.solve(solver_warmup)
-            t_warmup = time.time()
-            print(f"Phase 1 terminée: {pulp.LpStatus[prob_warmup.status]} ({t_warmup - t_solve:.1f}s)")
-            # Transfer solution as warm-start
-            if prob_warmup.status == pulp.LpStatusOptimal:
-                for s in student_ids:
-                    for a_id in activity_dict:
-                        val = pulp.value(x_warmup[s][a_id])
-                        if val is not None:
-                            x[s][a_id].setInitialValue(val)
-            print(f"Phase 2: résolution complète avec diversité catégorielle...")
-
-        print(f"Résolution du modèle... (contraintes: {time.time() - t_constraints:.1f}s)")
-        _progress("Résolution en cours...", 65)
-        solver = pulp.PULP_CBC_CMD(
-            msg=False,
-            timeLimit=300,
-            gapRel=0.03 if use_category_diversity else 0.01,
-            threads=cbc_threads,
-            warmStart=True if use_category_diversity else False,
-        )
-        result_status = prob.solve(solver)
+        # With hard_veto, vetoed pairs are dropped first; soft penalties are the fallback if that proves infeasible
+        for use_hard_veto in ([True, False] if hard_veto else [False]):
+            admissible, vetoes_dropped = presolve_assignments(activity_dict, student_ids, instance_prefs, hard_veto=use_hard_veto)
+            variables_kept = sum(len(admissible[s]) for s in student_ids)
+            print(f"Presolve{' (veto strict)' if use_hard_veto else ''}: {variables_kept}/{len(student_ids) * len(activity_dict)} variables d'affectation conservées.")
+            stuck = [s for s in student_ids if not admissible[s]]
+            if stuck:
+                if use_hard_veto: print(f"Veto strict impossible pour {len(stuck)} élève(s), retour aux pénalités."); continue
+                stud = student_dict[stuck[0]]
+                return False, f"ERREUR: Modèle infaisable: aucun planning complet possible pour {stud['nom']} {stud['prenom']} ({stud['classe']}). Vérifiez les sessions des ateliers.", None
+            data = prepare_model_data(activity_dict, student_ids, instance_prefs, admissible, categories,
+                                      category_diversity_weight if use_category_diversity else 0)
+            initial = greedy_plan(data)
+            heuristic_model = build_model_matrix(data)
+            heuristic_values = start_vector(heuristic_model, data, initial["x_pairs"])
+            heuristic_report = {"time_s": initial["time_s"], "overflow": initial["overflow"],
+                                "objective": float(heuristic_model["c"] @ heuristic_values + heuristic_model["offset"]),
+                                "source": "heuristic", "start_plan_objective": None}
+            print(f"Heuristique constructive: objectif {heuristic_report['objective']:.2f} en {initial['time_s']:.2f}s"
+                  + (f" ({initial['overflow']} élève(s) hors capacité)" if initial["overflow"] else ""))
+            if start_rows is not None:
+                start_plan, _, _ = match_previous_plan(start_rows, students, [inst["code"] for inst in activity_dict.values()],
+                                                       [inst["sessions_covered"] for inst in activity_dict.values()])
+                if len(start_plan) == len(student_ids) and not len(_perturbed(data, start_plan, vetoes=False)):
+                    start_values = start_vector(heuristic_model, data, schedule_pairs(data, start_plan))
+                    start_objective = float(heuristic_model["c"] @ start_values + heuristic_model["offset"])
+                    print(f"Planning de départ: objectif {start_objective:.2f}")
+                    heuristic_report["start_plan_objective"] = start_objective
+                    if start_objective <= heuristic_report["objective"] or initial["overflow"]:
+                        initial = {**initial, "x_pairs": schedule_pairs(data, start_plan), "schedules": start_plan, "overflow": 0}
+                        heuristic_values = start_values
+                        heuristic_report.update(objective=start_objective, overflow=0, source="start_plan")
+                else:
+                    print("Planning de départ inutilisable sur ces données, plan heuristique conservé.")
+            if (instant or lns_time_limit) and initial["overflow"]:
+                print("Plan heuristique hors capacités, résolution complète.")
+            repaired = None
+            if previous_rows is not None:
+                _progress("Réparation du planning précédent...", 65)
+                repaired = repair_plan(data, previous, time_limit, solver_backend=solver_backend, stop=stop_event)
+                if repaired is None: print("Réparation impossible, optimisation complète.")
+            if repaired is not None:
+                solution = _heuristic_solution(data, repaired, heuristic_model,
+                                               start_vector(heuristic_model, data, schedule_pairs(data, repaired["schedules"])))
+                solution["model_build"]["builder"] = "repair"
+                solution["solver"].update(backend=solver_backend,
+                                          termination="stopped" if stop_event is not None and stop_event.is_set() else "optimal")
+            elif lns_time_limit and not initial["overflow"]:
+                _progress("Amélioration du planning (LNS)...", 65)
+                groups = defaultdict(list)
+                for i, s in enumerate(student_ids): groups[student_dict[s]["classe"]].append(i)
+                improved = improve_plan(data, initial["schedules"], lns_time_limit, [np.array(g) for g in groups.values()],
+                                        workers=lns_workers, solver_backend=solver_backend, callback=_incumbent,
+                                        stop=stop_event)
+                solution = _heuristic_solution(data, improved, heuristic_model,
+                                               start_vector(heuristic_model, data, schedule_pairs(data, improved["schedules"])))
+                solution["model_build"]["builder"] = "lns"
+                solution["model_build"]["lns"] = {k: improved[k] for k in ("start_objective", "objective", "rounds", "neighborhoods", "improvements", "workers")}
+                solution["solver"].update(backend=solver_backend,
+                                          termination="stopped" if stop_event is not None and stop_event.is_set() else "time_limit")
+            elif instant and not initial["overflow"]:
+                solution = _heuristic_solution(data, initial, heuristic_model, heuristic_values)
+            elif model_builder == "pulp":
+                initial_assignments = {student_ids[s]: [data["instance_ids"][a] for a in schedule] for s, schedule in initial["schedules"].items()}
+                solution = _build_and_solve_pulp(activity_dict, student_ids, instance_prefs, admissible, categories, category_workshops,
+                                                 use_category_diversity, category_diversity_weight, _progress, measure_memory,
+                                                 initial_assignments, time_limit)
+            else:
+                if model_builder == "matrix":
+                    solution = _build_and_solve_matrix(data, activity_dict, student_ids, use_category_diversity, _progress,
+                                                       measure_memory, solver_backend, initial, time_limit=time_limit,
+                                                       incumbent=_incumbent, stop=stop_event, threads=threads)
+                else:
+                    solution = _build_and_solve_patterns(data, activity_dict, student_ids, use_category_diversity, _progress,
+                                                         measure_memory, solver_backend, initial, aggregate=model_builder == "aggregated",
+                                                         time_limit=time_limit, incumbent=_incumbent, stop=stop_event,
+                                                         threads=threads)
+                no_better = solution["status"] not in (pulp.LpStatusOptimal, pulp.LpStatusInfeasible) or (
+                    solution["status"] == pulp.LpStatusOptimal and solution["objective"] > heuristic_report["objective"] + 1e-6)
+                if no_better and not initial["overflow"]:
+                    # Anytime: a search cut short may end without incumbent or with a worse one than the heuristic plan
+                    print("Pas de meilleure solution du solveur, plan heuristique conservé.")
+                    fallback = _heuristic_solution(data, initial, heuristic_model, heuristic_values)
+                    solution = {**fallback, "constraints_built": solution["constraints_built"], "model_build": solution["model_build"]}
+            if solution["status"] == pulp.LpStatusInfeasible and use_hard_veto:
+                print("Modèle infaisable en veto strict, retour aux pénalités."); continue
+            break
         t_solved = time.time()
-        print(f"Statut du solveur : {pulp.LpStatus[prob.status]} (résolution: {t_solved - t_solve:.1f}s, total: {t_solved - t_start:.1f}s)")
-        optimal_solution_found = (prob.status == pulp.LpStatusOptimal)
+        print(f"Résolution terminée (total: {t_solved - t_start:.1f}s)")
+        optimal_solution_found = (solution["status"] == pulp.LpStatusOptimal)
         if not optimal_solution_found:
-            status_text = pulp.LpStatus[prob.status]; msg = f"ERREUR: Solution optimale non trouvée (statut: {status_text})."
-            if prob.status == pulp.LpStatusInfeasible: msg = f"ERREUR: Modèle infaisable (statut: {status_text}). Vérifiez capacités, vetos, structure."
+            status_text = pulp.LpStatus[solution["status"]]; msg = f"ERREUR: Solution optimale non trouvée (statut: {status_text})."
+            if solution["status"] == pulp.LpStatusInfeasible: msg = f"ERREUR: Modèle infaisable (statut: {status_text}). Vérifiez capacités, vetos, structure."
             return False, msg, None
+        constraints_full = _full_constraint_count(activity_dict, len(student_ids), categories, use_category_diversity)
+        presolve_report = {
+            "hard_veto": hard_veto,
+            "hard_veto_applied": use_hard_veto,
+            "vetoes_dropped": vetoes_dropped,
+            "variables_full": len(student_ids) * len(activity_dict),
+            "variables_kept": variables_kept,
+            "variables_eliminated": len(student_ids) * len(activity_dict) - variables_kept,
+            "constraints_full": constraints_full,
+            "constraints_kept": solution["constraints_built"],
+            "constraints_eliminated": constraints_full - solution["constraints_built"],
+        }
 
         # --- PREPARE OUTPUT ---
         print("Préparation des fichiers de sortie...")
         _progress("Préparation des résultats...", 85)
-
-        # Cache all assignments once (avoids repeated pulp.value() calls)
-        assignments = defaultdict(list)  # student -> list of assigned activity IDs
-        for s in student_ids:
-            for a in activity_dict:
-                if x[s][a] is not None and pulp.value(x[s][a]) == 1:
-                    assignments[s].append(a)
+        assignments = solution["assignments"]  # student -> list of assigned activity IDs
 
         # 1. Create student schedule
         output_rows_student = []
@@ -280,6 +813,30 @@ def run_optimization(input_excel_path, output_excel_path, category_diversity_wei
             output_rows_student.append(row)
         student_schedule_df = pd.DataFrame(output_rows_student, columns=["Nom", "Prénom", "Classe"] + EXPECTED_SESSIONS)
 
+        # 1b. Changes from the previous plan (repair mode): one row per student whose sessions changed
+        changes_df = pd.DataFrame(); repair_report = None
+        if previous_rows is not None:
+            change_rows = []; moved = new = 0
+            for i, row in enumerate(output_rows_student):
+                after = [str(row[session]).strip() for session in EXPECTED_SESSIONS]
+                if i in matched:
+                    before = [str(matched[i]["sessions"][session]).strip() for session in EXPECTED_SESSIONS]
+                    if before == after: continue
+                    kind = "Planning modifié"; moved += 1
+                else:
+                    before = [""] * TOTAL_SESSIONS; kind = "Nouvel élève"; new += 1
+                cells = [b if b == a else f"{b or '-'} → {a or '-'}" for b, a in zip(before, after)]
+                change_rows.append([row["Nom"], row["Prénom"], row["Classe"], kind] + cells)
+            for prev in removed:
+                change_rows.append([prev["nom"], prev["prenom"], prev["classe"], "Élève retiré"]
+                                   + [f"{str(prev['sessions'][session]).strip() or '-'} → -" for session in EXPECTED_SESSIONS])
+            changes_df = pd.DataFrame(change_rows, columns=["Nom", "Prénom", "Classe", "Changement"] + EXPECTED_SESSIONS)
+            repair_report = {"applied": repaired is not None, "students_matched": len(matched),
+                             "students_freed": repaired["freed"] if repaired else len(student_ids),
+                             "widened": repaired["widened"] if repaired else True, "students_moved": moved,
+                             "students_new": new, "students_removed": len(removed), "change_penalty": CHANGE_PENALTY}
+            print(f"Réparation: {moved} élève(s) déplacé(s), {new} nouveau(x), {len(removed)} retiré(s).")
+
         # 2. Create workshop schedule
         instance_student_lists = defaultdict(list); max_students = 0
         for s in student_ids:
@@ -300,45 +857,39 @@ def run_optimization(input_excel_path, output_excel_path, category_diversity_wei
 
         # --- Calculate statistics AND Preference Distribution (single pass) ---
         # KPI is session-based: a 2-session preferred workshop = 2 sessions satisfied out of TOTAL_SESSIONS
-        stats_rows = [("Statut Final Solveur", pulp.LpStatus[prob.status])]
-        total_pref_sessions = 0; total_veto_sessions = 0; total_neutral_sessions = 0
-        total_deviation = sum(pulp.value(dev[a]) or 0 for a in dev)
+        stats_rows = [("Statut Final Solveur", pulp.LpStatus[solution["status"]])]
+        total_deviation = sum(solution["deviation"].values())
         student_neutral_counts = defaultdict(int)
         prefs_distribution = defaultdict(int)
         students_by_pref_sessions = defaultdict(list)
         track_categories = bool(categories)
         cat_div_dist = defaultdict(int)
 
-        for s in student_ids:
-            neutral_sessions_for_student = 0
-            pref_sessions_for_student = 0
-            cats_covered = set() if track_categories else None
-            for a in assignments[s]:
-                instance = activity_dict[a]; act_code = instance["code"]
-                vote = student_dict[s]["prefs"][act_code]
-                duration = instance["duration"]
-
-                if vote == 1:
-                    total_pref_sessions += duration
-                    pref_sessions_for_student += duration
-                elif vote == -1:
-                    total_veto_sessions += duration
-                else:
-                    total_neutral_sessions += duration
-                    neutral_sessions_for_student += duration
-
-                if track_categories and instance["category"]:
-                    cats_covered.add(instance["category"])
-
-            student_neutral_counts[s] = neutral_sessions_for_student
+        # Session counts per student read from the vote matrix: (assignment x vote) @ durations
+        col = {a: j for j, a in enumerate(activity_dict)}
+        assigned = np.zeros(instance_prefs.shape, dtype=np.int32)
+        for i, s in enumerate(student_ids):
+            for a in assignments[s]: assigned[i, col[a]] = 1
+        durations = np.array([inst["duration"] for inst in activity_dict.values()], dtype=np.int32)
+        pref_sessions = (assigned * (instance_prefs == 1)) @ durations
+        veto_sessions = (assigned * (instance_prefs == -1)) @ durations
+        neutral_sessions = (assigned * (instance_prefs == 0)) @ durations
+        total_pref_sessions = int(pref_sessions.sum()); total_veto_sessions = int(veto_sessions.sum()); total_neutral_sessions = int(neutral_sessions.sum())
+        if track_categories:
+            category_onehot = np.array([[inst["category"] == c for c in categories] for inst in activity_dict.values()], dtype=np.int32)
+            cats_covered = ((assigned @ category_onehot) > 0).sum(axis=1)
+
+        for i, s in enumerate(student_ids):
+            pref_sessions_for_student = int(pref_sessions[i])
+            student_neutral_counts[s] = int(neutral_sessions[i])
             prefs_distribution[pref_sessions_for_student] += 1
             students_by_pref_sessions[pref_sessions_for_student].append(student_dict[s])
             if track_categories:
-                cat_div_dist[f"{len(cats_covered)}/{len(categories)}"] += 1
+                cat_div_dist[f"{int(cats_covered[i])}/{len(categories)}"] += 1
 
         # Continue with other stats
         average_deviation = total_deviation / len(activity_instances) if activity_instances else 0
-        obj_value = pulp.value(prob.objective) if prob.objective is not None else "N/A"
+        obj_value = solution["objective"] if solution["objective"] is not None else "N/A"
         total_student_sessions = TOTAL_SESSIONS * len(student_ids)
         pref_rate = f"{round((total_pref_sessions / total_student_sessions) * 100, 1)}%" if total_student_sessions else "N/A"
 
@@ -371,11 +922,34 @@ def run_optimization(input_excel_path, output_excel_path, category_diversity_wei
             "mostly_satisfied_pct": f"{100 * mostly_satisfied / num_students:.1f}%" if num_students else "N/A",
             "category_diversity_distribution": category_diversity_distribution,
             "categories": categories,
-            "category_diversity_weight": category_diversity_weight
+            "category_diversity_weight": category_diversity_weight,
+            "presolve": presolve_report,
+            "model_build": solution["model_build"],
+            "solver": solution["solver"],
+            "heuristic": heuristic_report,
+            "repair": repair_report
         }
 
         # Add stats to full stats DataFrame (for Excel)
         stats_rows.extend([ ("Valeur Objectif Calculée", stats_summary["objective_value"]), ("Nb sessions Préférence", total_pref_sessions), ("Nb sessions Veto", total_veto_sessions), ("Nb sessions Neutre", total_neutral_sessions), ("Taux Préférence (sessions)", pref_rate), ("Déviation totale", stats_summary["total_deviation"]), ("Déviation moyenne/instance", stats_summary["avg_deviation"]) ])
+        stats_rows.extend([ ("--- Presolve ---", ""), ("Veto strict appliqué", "Oui" if presolve_report["hard_veto_applied"] else "Non"), ("Variables d'affectation éliminées", f"{presolve_report['variables_eliminated']}/{presolve_report['variables_full']}"), ("Contraintes éliminées", f"{presolve_report['constraints_eliminated']}/{presolve_report['constraints_full']}") ])
+        stats_rows.append(("Plan de départ (objectif)" if heuristic_report["source"] == "start_plan" else "Plan heuristique (objectif)",
+                           f"{heuristic_report['objective']:.2f}"))
+        if solution["solver"]["backend"] == "heuristic": stats_rows.append(("Mode", "Instantané (heuristique, sans optimisation)"))
+        solver_report = solution["solver"]
+        if solver_report["termination"]: stats_rows.append(("Arrêt du solveur", TERMINATIONS[solver_report["termination"]]))
+        if solver_report["best_bound"] is not None:
+            stats_rows.extend([("Meilleure borne", f"{solver_report['best_bound']:.2f}"), ("Écart relatif", f"{100 * solver_report['gap']:.2f}%")])
+        lns_report = solution["model_build"].get("lns")
+        if lns_report:
+            stats_rows.append(("Mode", f"Recherche à grand voisinage (LNS, {lns_time_limit}s, {lns_report['improvements']} amélioration(s))"))
+        if repair_report:
+            stats_rows.append(("Mode", f"Réparation du planning précédent ({repair_report['students_freed']} élève(s) réoptimisé(s), "
+                                       f"{repair_report['students_moved']} déplacé(s), {repair_report['students_new']} nouveau(x), "
+                                       f"{repair_report['students_removed']} retiré(s))"))
+        aggregation = solution["model_build"].get("aggregation")
+        if aggregation and aggregation["applied"]:
+            stats_rows.append(("Classes d'élèves équivalents", f"{aggregation['classes']} pour {aggregation['students']} élèves (x{aggregation['compression_ratio']})"))
         neutral_distribution = defaultdict(int); max_neutral_observed = 0
         for s in student_ids: count = student_neutral_counts[s]; neutral_distribution[count] += 1; max_neutral_observed = max(max_neutral_observed, count)
         stats_rows.append(("--- Analyse Choix Neutres / Élève ---", ""))
@@ -416,16 +990,25 @@ def run_optimization(input_excel_path, output_excel_path, category_diversity_wei
         _progress("Écriture du fichier...", 95)
         try:
             with pd.ExcelWriter(output_excel_path, engine="xlsxwriter") as writer:
-                student_schedule_df.to_excel(writer, sheet_name="Planning par élève", index=False)
+                student_schedule_df.to_excel(writer, sheet_name=PLANNING_SHEET, index=False)
                 if not activity_schedule_df.empty:
                     activity_schedule_df.to_excel(writer, sheet_name="Planning par Atelier", index=True, header=True)
                 stats_df.to_excel(writer, sheet_name="Résumé et Stats", index=False)
                 # ADDED: Write the new sheet
                 if not students_by_pref_df.empty:
                     students_by_pref_df.to_excel(writer, sheet_name="Élèves par Nb Préférences", index=False)
+                if repair_report:
+                    changes_df.to_excel(writer, sheet_name=CHANGES_SHEET, index=False)
 
             print("Écriture réussie.")
             success_msg = "Optimisation terminée avec succès."
+            if repair_report:
+                success_msg = (f"Planning réparé : {repair_report['students_moved']} élève(s) déplacé(s), "
+                               f"{repair_report['students_new']} nouveau(x) élève(s) placé(s).")
+            if solution["solver"]["termination"] in ("time_limit", "stopped") and solution["solver"]["backend"] != "heuristic":
+                gap = solution["solver"]["gap"]
+                success_msg = ("Optimisation interrompue : meilleur planning trouvé"
+                               + (f" (écart à l'optimum au plus {100 * gap:.1f}%)." if gap is not None else "."))
             return True, success_msg, stats_summary
 
         except Exception as e:
@@ -10,6 +10,8 @@ document.addEventListener('DOMContentLoaded', function () {
     const uploadSection = document.getElementById('upload-section');
     const fileInput = document.getElementById('file');
     const fileLabel = document.getElementById('file-label');
+    const incumbentEl = document.getElementById('incumbent');
+    const stopBtn = document.getElementById('stop-btn');
 
     // --- File input feedback ---
     if (fileInput && fileLabel) {
@@ -54,8 +56,9 @@ document.addEventListener('DOMContentLoaded', function () {
 
             // Send file via fetch
             const formData = new FormData(form);
+            const isSweep = formData.get('sweep') === '1';
 
-            fetch('/optimize', {
+            fetch(isSweep ? '/sweep' : '/optimize', {
                 method: 'POST',
                 body: formData
             })
@@ -73,8 +76,29 @@ document.addEventListener('DOMContentLoaded', function () {
                 const completedSteps = [];
                 let currentStep = null;
 
+                if (stopBtn && !isSweep) {
+                    stopBtn.style.display = '';
+                    stopBtn.onclick = function () {
+                        stopBtn.disabled = true;
+                        stopBtn.textContent = 'Arrêt en cours...';
+                        fetch('/stop/' + jobId, { method: 'POST' })
+                            .then(function (resp) { return resp.json(); })
+                            .then(function (stop) {
+                                // Shared run: it goes on until every requester has asked to stop
+                                if (stop.stopping === false) stopBtn.textContent = 'Arrêt demandé (calcul partagé)';
+                            });
+                    };
+                }
+
                 source.addEventListener('progress', function (e) {
                     const event = JSON.parse(e.data);
+                    if (event.incumbent) {
+                        // Improved solution: shown next to the timer, not as a new step
+                        var text = 'Meilleur planning : objectif ' + event.incumbent.objective.toFixed(2);
+                        if (event.incumbent.gap !== null) text += ' — écart ≤ ' + (100 * event.incumbent.gap).toFixed(1) + '%';
+                        if (incumbentEl) incumbentEl.textContent = text;
+                        return;
+                    }
                     updateProgress(event.step, event.pct, completedSteps, currentStep);
                     currentStep = event.step;
                     completedSteps.push(event.step);
@@ -83,6 +107,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 source.addEventListener('complete', function (e) {
                     clearInterval(timer);
                     source.close();
+                    if (stopBtn) stopBtn.style.display = 'none';
                     const result = JSON.parse(e.data);
 
                     // Mark all steps as done
@@ -95,7 +120,9 @@ document.addEventListener('DOMContentLoaded', function () {
 
                     // Short delay then show results
                     setTimeout(function () {
-                        if (result.success) {
+                        if (result.success && result.sweep) {
+                            showSweep(result);
+                        } else if (result.success) {
                             showResults(result);
                         } else {
                             showError(result.message);
@@ -160,6 +187,37 @@ document.addEventListener('DOMContentLoaded', function () {
         resultsSection.classList.add('active');
     }
 
+    // --- Show the category-weight sweep (trade-off table) ---
+    function showSweep(result) {
+        progressArea.classList.remove('active');
+        if (uploadSection) uploadSection.style.display = 'none';
+
+        var html = '<div class="verdict-banner verdict-green">' + escapeHtml(result.message) + '</div>';
+        html += '<table class="table table-sm align-middle">' +
+                    '<thead><tr><th>Poids variété</th><th>Satisfaction</th><th>Couverture des catégories</th>' +
+                    '<th>100% satisfaits</th><th>Vetos</th><th>Temps</th><th></th></tr></thead><tbody>';
+        result.sweep.forEach(function (p) {
+            if (!p.success) {
+                html += '<tr><td>' + p.weight + '</td><td colspan="6">' + escapeHtml(p.message) + '</td></tr>';
+                return;
+            }
+            html += '<tr' + (p.pareto ? ' class="table-success"' : '') + '>' +
+                        '<td>' + p.weight + (p.pareto ? ' ★' : '') + '</td>' +
+                        '<td>' + p.pref_rate + '%</td>' +
+                        '<td>' + (p.category_coverage !== null ? p.category_coverage + '%' : '-') + '</td>' +
+                        '<td>' + p.fully_satisfied_pct + '</td>' +
+                        '<td>' + p.veto_count + '</td>' +
+                        '<td>' + p.time_s + 's</td>' +
+                        '<td><a href="/download_result/' + encodeURIComponent(p.filename) + '" class="btn btn-sm btn-success">Télécharger</a></td>' +
+                    '</tr>';
+        });
+        html += '</tbody></table>';
+        html += '<div class="secondary-info"><span>★ : aucun autre niveau ne fait mieux à la fois en satisfaction et en variété.</span></div>';
+        html += '<div class="text-center"><a href="/" class="btn btn-primary">Nouvelle Optimisation</a></div>';
+        resultsSection.innerHTML = html;
+        resultsSection.classList.add('active');
+    }
+
     // --- Show results ---
     function showResults(result) {
         progressArea.classList.remove('active');
@@ -229,6 +287,16 @@ document.addEventListener('DOMContentLoaded', function () {
                     '<span>' + (result.solve_time || '?') + 's</span>' +
                 '</div>';
 
+        if (result.cached || stats.repair) {
+            html += '<div class="secondary-info"><span>' + escapeHtml(result.message) + '</span></div>';
+        }
+
+        // Search ended on a limit or a stop request: the planning is the best one found
+        var solver = stats.solver || {};
+        if (solver.termination === 'time_limit' || solver.termination === 'stopped') {
+            html += '<div class="secondary-info"><span>' + escapeHtml(result.message) + '</span></div>';
+        }
+
         // Download button
         html += '<div class="download-area">' +
                     '<a href="/download_result/' + encodeURIComponent(result.filename) + '" class="btn btn-success btn-lg">' +
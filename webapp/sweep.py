@@ -0,0 +1,119 @@
+# sweep.py
+"""
+Category-weight sweep: solves the same data for several category_diversity_weight values in one
+job and returns the preference rate / category coverage trade-off.
+
+The weights are sorted and split into contiguous chains, one per worker process, the CPU cores
+shared between them (solver threads per chain = cores // chains). Within a chain, each weight
+starts from the planning of the previous (neighbouring) weight (run_optimization start_plan_path),
+which is usually close to optimal already. Every point keeps its own output workbook; the points
+no other point beats on both preference rate and category coverage form the Pareto front.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from solver_backends import DEFAULT_BACKEND
+from solver_logic import run_optimization
+
+SWEEP_WEIGHTS = (0, 5, 10, 15)
+
+
+def category_coverage(stats):
+    """Share (%) of the categories the students cover on average, None without categories."""
+    distribution, categories = stats.get("category_diversity_distribution"), stats.get("categories")
+    if not distribution or not categories:
+        return None
+    covered = sum(int(key.split("/")[0]) * count for key, count in distribution.items())
+    return round(100 * covered / (sum(distribution.values()) * len(categories)), 1)
+
+
+def _point(weight, output_path, success, message, stats, time_s):
+    """One row of the trade-off table."""
+    point = {"weight": weight, "filename": os.path.basename(output_path) if success else None, "success": success,
+             "message": message, "time_s": round(time_s, 1), "pareto": False}
+    if success:
+        point.update(objective=float(stats["objective_value"]), pref_rate=stats["pref_rate_float"],
+                     category_coverage=category_coverage(stats), veto_count=stats["veto_count"],
+                     fully_satisfied_pct=stats["fully_satisfied_pct"], termination=stats["solver"]["termination"],
+                     warm_started=stats["heuristic"]["source"] == "start_plan", stats=stats)
+    return point
+
+
+def _solve_chain(input_path, chain, options, previous=None):
+    """
+    Worker: solves the (weight, output path) pairs of a chain in order, each from the previous planning
+    (the first one from the `previous` output workbook, if any).
+
+    Returns:
+        list: one point per weight (see _point).
+    """
+    points = []
+    for weight, output_path in chain:
+        t0 = time.time()
+        success, message, stats = run_optimization(input_path, output_path, category_diversity_weight=weight,
+                                                   start_plan_path=previous, **options)
+        points.append(_point(weight, output_path, success, message, stats, time.time() - t0))
+        if success: previous = output_path
+    return points
+
+
+def pareto_front(points):
+    """Marks (pareto=True) the successful points no other one beats on both preference rate and category coverage."""
+    solved = [p for p in points if p["success"]]
+    for p in solved:
+        mine = (p["pref_rate"], p["category_coverage"] or 0)
+        p["pareto"] = not any(
+            (q["pref_rate"], q["category_coverage"] or 0) != mine
+            and q["pref_rate"] >= mine[0] and (q["category_coverage"] or 0) >= mine[1] for q in solved)
+    return points
+
+
+def run_weight_sweep(input_path, output_paths, workers=None, solver_backend=DEFAULT_BACKEND, hard_veto=False,
+                     time_limit=300, progress_callback=None):
+    """
+    Solves the input once per category weight.
+
+    Args:
+        input_path (str): filled template.
+        output_paths (dict): category weight -> output workbook path.
+        workers (int | None): concurrent chains (default: one per CPU, at most one per weight; 1 = in-process).
+        solver_backend (str): "cbc" or "highs" (see solver_backends).
+        hard_veto (bool): as run_optimization.
+        time_limit (float): solver time limit of each weight.
+        progress_callback (callable | None): progress_callback(step, pct) after each finished chain (each weight in-process).
+
+    Returns:
+        list: one point per weight, by increasing weight: weight, filename, success, message, time_s, pareto
+              and, when solved, objective, pref_rate, category_coverage, veto_count, fully_satisfied_pct,
+              termination, warm_started, stats.
+    """
+    weights = sorted(output_paths)
+    cores = os.cpu_count() or 1
+    workers = max(1, min(workers or cores, len(weights)))
+    options = {"solver_backend": solver_backend, "hard_veto": hard_veto, "time_limit": time_limit,
+               "threads": max(1, cores // workers)}
+    chains = [[(w, output_paths[w]) for w in chunk.tolist()] for chunk in np.array_split(np.array(weights, dtype=object), workers)]
+    print(f"Balayage des poids {weights}: {workers} chaîne(s), {options['threads']} thread(s) solveur chacune.")
+
+    def report(done):
+        if progress_callback:
+            progress_callback(f"Poids résolus : {done}/{len(weights)}", 10 + int(85 * done / len(weights)))
+
+    points = []
+    if workers == 1:
+        previous = None
+        for weight, output_path in chains[0]:
+            points.extend(_solve_chain(input_path, [(weight, output_path)], options, previous))
+            if points[-1]["success"]: previous = output_path
+            report(len(points))
+    else:
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_solve_chain, input_path, chain, options) for chain in chains]
+            for future in as_completed(futures):
+                points.extend(future.result())
+                report(len(points))
+    return pareto_front(sorted(points, key=lambda p: p["weight"]))
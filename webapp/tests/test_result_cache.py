@@ -0,0 +1,154 @@
+"""
+Tests for result_cache (content-addressed cache of finished plannings) and its use by /optimize.
+"""
+
+import io
+import json
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from result_cache import cache_get, cache_key, cache_put, cache_stats, input_digest, open_cache
+from tests import test_solver_logic
+from tests.test_solver_logic import _build_excel
+
+
+def _write(path, content):
+    with open(path, "wb") as f:
+        f.write(content)
+    return str(path)
+
+
+class TestResultCache:
+
+    def test_key_depends_on_data_and_parameters(self, tmp_path):
+        workshops, students = test_solver_logic.TestModelBuilders()._mixed_scenario()
+        first, second = _build_excel(workshops, students), _build_excel(workshops, students)
+        students[0]["Nom"] = "Autre"
+        third = _build_excel(workshops, students)
+        try:
+            assert input_digest(first) == input_digest(second)  # same cells, different files
+            assert input_digest(first) != input_digest(third)
+            digest = input_digest(first)
+            assert cache_key(digest, category_weight=0) == cache_key(digest, category_weight=0)
+            assert cache_key(digest, category_weight=0) != cache_key(digest, category_weight=10)
+        finally:
+            for p in (first, second, third):
+                os.remove(p)
+
+    def test_unreadable_input_has_no_digest(self, tmp_path):
+        assert input_digest(_write(tmp_path / "bad.xlsx", b"not a workbook")) is None
+
+    def test_hit_miss_and_lru_eviction(self, tmp_path):
+        cache = open_cache(str(tmp_path / "cache"), max_entries=2)
+        for key in ("a", "b"):
+            cache_put(cache, key, _write(tmp_path / f"{key}.xlsx", key.encode()), {"objective_value": key})
+        out = str(tmp_path / "out.xlsx")
+        assert cache_get(cache, "a", out) == {"objective_value": "a"}  # "a" becomes the most recent
+        with open(out, "rb") as f:
+            assert f.read() == b"a"
+        cache_put(cache, "c", _write(tmp_path / "c.xlsx", b"c"), {"objective_value": "c"})
+        assert cache_get(cache, "b", out) is None
+        assert cache_get(cache, "a", out) is not None
+        stats = cache_stats(cache)
+        assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (2, 1, 1, 2)
+        # The index is rebuilt from the folder, least recently used first
+        reopened = open_cache(str(tmp_path / "cache"), max_entries=2)
+        assert set(reopened["index"]) == {"a", "c"}
+
+    def test_size_bound(self, tmp_path):
+        cache = open_cache(str(tmp_path / "cache"), max_bytes=1500)
+        for key in ("a", "b", "c"):
+            cache_put(cache, key, _write(tmp_path / f"{key}.xlsx", b"x" * 600), {})
+        assert list(cache["index"]) == ["b", "c"]
+        assert cache_stats(cache)["bytes"] <= 1500
+
+
+class TestOptimizeCache:
+
+    def test_second_upload_is_served_from_cache(self, tmp_path, monkeypatch):
+        import app as webapp
+        monkeypatch.setattr(webapp, "result_cache", open_cache(str(tmp_path / "cache")))
+        monkeypatch.setitem(webapp.app.config, "RESULT_FOLDER", str(tmp_path))
+        workshops, students = test_solver_logic.TestModelBuilders()._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        with open(input_path, "rb") as f:
+            content = f.read()
+        os.remove(input_path)
+        client = webapp.app.test_client()
+
+        def upload():
+            response = client.post("/optimize", data={"file": (io.BytesIO(content), "prefs.xlsx"), "category_weight": "0"},
+                                   content_type="multipart/form-data")
+            job_id = response.get_json()["job_id"]
+            stream = client.get(f"/progress/{job_id}").get_data(as_text=True)
+            complete = [line for line in stream.splitlines() if line.startswith("data:") and '"complete"' in line][-1]
+            return response.get_json(), json.loads(complete[len("data:"):])
+
+        first, first_event = upload()
+        second, second_event = upload()
+        assert first_event["success"] and second_event["success"]
+        assert "cached" not in first and second["cached"]
+        assert second_event["stats"]["objective_value"] == first_event["stats"]["objective_value"]
+        assert os.path.exists(webapp.jobs[second["job_id"]]["output_path"])
+        assert cache_stats(webapp.result_cache)["hits"] == 1
+        assert client.get("/cache/stats").get_json()["misses"] == 1
+
+
+class TestSingleFlight:
+
+    def _client(self, tmp_path, monkeypatch):
+        import app as webapp
+        monkeypatch.setattr(webapp, "result_cache", open_cache(str(tmp_path / "cache")))
+        monkeypatch.setitem(webapp.app.config, "RESULT_FOLDER", str(tmp_path))
+        release, calls = threading.Event(), []
+
+        def fake_optimization(input_path, output_path, progress_callback=None, stop_event=None, **kwargs):
+            calls.append(input_path)
+            progress_callback("Lecture", 10)
+            release.wait(10)
+            _write(output_path, b"planning")
+            return True, "ok", {"objective_value": 1, "solver": {"termination": "stopped" if stop_event.is_set() else "optimal"}}
+
+        monkeypatch.setattr(webapp, "run_optimization", fake_optimization)
+        workshops, students = test_solver_logic.TestModelBuilders()._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        with open(input_path, "rb") as f:
+            content = f.read()
+        os.remove(input_path)
+        client = webapp.app.test_client()
+
+        def upload():
+            return client.post("/optimize", data={"file": (io.BytesIO(content), "prefs.xlsx"), "category_weight": "0"},
+                               content_type="multipart/form-data").get_json()
+
+        def events(job_id):
+            stream = client.get(f"/progress/{job_id}").get_data(as_text=True)
+            return [json.loads(line[len("data:"):]) for line in stream.splitlines() if line.startswith("data:")]
+
+        return webapp, client, upload, events, release, calls
+
+    def test_identical_requests_share_one_solve(self, tmp_path, monkeypatch):
+        webapp, client, upload, events, release, calls = self._client(tmp_path, monkeypatch)
+        first = upload()
+        second = upload()
+        assert "coalesced" not in first and second["coalesced"]
+        release.set()
+        first_events, second_events = events(first["job_id"]), events(second["job_id"])
+        assert len(calls) == 1
+        assert second_events[0] == {"type": "progress", "step": "Lecture", "pct": 10}  # replayed to the late joiner
+        assert first_events[-1]["success"] and second_events[-1] == first_events[-1]
+        assert not webapp.inflight
+        assert upload()["cached"]  # once finished, the result comes from the cache
+
+    def test_shared_run_stops_when_every_requester_asked(self, tmp_path, monkeypatch):
+        webapp, client, upload, events, release, calls = self._client(tmp_path, monkeypatch)
+        first, second = upload(), upload()
+        assert client.post(f"/stop/{first['job_id']}").get_json() == {"stopping": False}
+        assert not webapp.jobs[first["job_id"]]["stop"].is_set()
+        assert client.post(f"/stop/{second['job_id']}").get_json() == {"stopping": True}
+        release.set()
+        assert events(first["job_id"])[-1]["stats"]["solver"]["termination"] == "stopped"
+        assert len(calls) == 1
@@ -7,14 +7,19 @@ Output files use /tmp and are cleaned up after each test.
 
 import os
 import sys
+import threading
+import time
 import uuid
 import pytest
 import openpyxl
+import numpy as np
+import pandas as pd
 
 # Ensure the webapp package is importable
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 from solver_logic import run_optimization, EXPECTED_SESSIONS, TOTAL_SESSIONS
+from model_matrix import with_category_weight
 
 
 # ---------------------------------------------------------------------------
@@ -838,3 +843,696 @@ class TestEdgeCases:
             for p in (input_path, output_path):
                 if os.path.exists(p):
                     os.remove(p)
+
+
+# ---------------------------------------------------------------------------
+# 6. Presolve and hard vetoes
+# ---------------------------------------------------------------------------
+
+class TestPresolve:
+
+    def _make_unusable_instance_scenario(self):
+        """
+        Multi-session scenario plus a single-session workshop B on Lundi matin.
+        Lundi après-midi is only reachable through M (sessions 1+2), so B can
+        never be part of a complete schedule.
+        """
+        workshops = TestMultiSessionWorkshops()._make_multi_session_scenario()
+        sessions_map = {f"Session {j+1}": None for j in range(TOTAL_SESSIONS)}
+        sessions_map["Session 1"] = EXPECTED_SESSIONS[0]
+        workshops.append({
+            "Code": "B", "Description": "Blocked", "Enseignant": "T7", "Salle": "R7",
+            "Catégorie": "Sport", "Nombre de périodes": 1,
+            "Nombre d'élèves max par session": 30,
+            "Nombre idéal d'élèves par session": 3,
+            **sessions_map,
+        })
+        return workshops
+
+    def test_unusable_instance_is_eliminated(self):
+        workshops = self._make_unusable_instance_scenario()
+        students = [{"Nom": "X", "Prénom": "Y", "Classe": "6A", "B": 1, "S3": 1},
+                    {"Nom": "Z", "Prénom": "W", "Classe": "6B", "M": 1}]
+
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path)
+            assert ok, msg
+            presolve = stats["presolve"]
+            assert presolve["variables_full"] == 2 * len(workshops)
+            assert presolve["variables_eliminated"] == 2  # B for both students
+            assert presolve["constraints_eliminated"] > 0
+            assert not presolve["hard_veto_applied"]
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_hard_veto_drops_vetoed_pairs(self):
+        workshops = _make_basic_workshops()
+        sessions_map = {f"Session {j+1}": None for j in range(TOTAL_SESSIONS)}
+        sessions_map["Session 4"] = EXPECTED_SESSIONS[3]
+        workshops.append({
+            "Code": "W4b", "Description": "Alt", "Enseignant": "T", "Salle": "R",
+            "Catégorie": "Art", "Nombre de périodes": 1,
+            "Nombre d'élèves max par session": 30,
+            "Nombre idéal d'élèves par session": 5,
+            **sessions_map,
+        })
+        students = [{"Nom": "A", "Prénom": "B", "Classe": "6A", "W1": 1, "W4": -1}]
+
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path, hard_veto=True)
+            assert ok, msg
+            assert stats["veto_count"] == 0
+            assert stats["presolve"]["hard_veto_applied"]
+            assert stats["presolve"]["vetoes_dropped"] == 1
+            assert stats["presolve"]["variables_eliminated"] == 1
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_hard_veto_falls_back_to_soft_penalty(self):
+        """A veto on the only workshop of a session cannot be honoured strictly."""
+        workshops = _make_basic_workshops()
+        codes = [w["Code"] for w in workshops]
+        students = _make_basic_students(codes, n=1)
+        students[0]["W3"] = -1
+
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path, hard_veto=True)
+            assert ok, msg
+            assert stats["veto_count"] == 1
+            assert stats["presolve"]["hard_veto"]
+            assert not stats["presolve"]["hard_veto_applied"]
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_no_complete_schedule_reports_infeasible(self):
+        """Nothing covers Mercredi matin: presolve proves infeasibility without solving."""
+        workshops = _make_basic_workshops()[:4]
+        codes = [w["Code"] for w in workshops]
+        students = _make_basic_students(codes, n=1)
+
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path)
+            assert not ok
+            assert stats is None
+            assert "infaisable" in msg
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+
+# ---------------------------------------------------------------------------
+# 7. Preference ingestion
+# ---------------------------------------------------------------------------
+
+class TestPreferenceIngestion:
+
+    def test_votes_are_coerced_to_int8(self):
+        import numpy as np
+        import pandas as pd
+        from solver_logic import load_preferences
+
+        prefs_df = pd.DataFrame({
+            "Nom": ["A", "B"], "Prénom": ["a", "b"], "Classe": ["6A", "6B"], "# Préférences": [1, 0],
+            "W1": [1, "1"], "W2": [-1, 1.7], "W3": [None, "abc"], "W4": [2, -1.2],
+        })
+        students, pref_matrix, code_index = load_preferences(prefs_df)
+
+        assert pref_matrix.dtype == np.int8
+        assert code_index == {"W1": 0, "W2": 1, "W3": 2, "W4": 3}
+        assert pref_matrix.tolist() == [[1, -1, 0, 0], [1, 1, 0, -1]]
+        assert [s["id"] for s in students] == ["A_a_6A_0", "B_b_6B_1"]
+
+    def test_codes_missing_from_preferences_are_neutral(self):
+        import numpy as np
+        from solver_logic import instance_preferences
+
+        pref_matrix = np.array([[1, -1], [-1, 1]], dtype=np.int8)
+        activity_dict = {10: {"code": "W2"}, 11: {"code": "NEW"}, 12: {"code": "W1"}}
+        instance_prefs = instance_preferences(pref_matrix, {"W1": 0, "W2": 1}, activity_dict)
+
+        assert instance_prefs.tolist() == [[-1, 0, 1], [1, 0, -1]]
+
+
+# ---------------------------------------------------------------------------
+# 8. Model builders
+# ---------------------------------------------------------------------------
+
+class TestModelBuilders:
+
+    def _mixed_scenario(self):
+        workshops = TestCategoryDiversity()._make_diverse_scenario()
+        codes = [w["Code"] for w in workshops]
+        students = []
+        for i in range(6):
+            s = {"Nom": f"N{i}", "Prénom": f"P{i}", "Classe": "6A"}
+            for j, code in enumerate(codes):
+                s[code] = 1 if (i + j) % 3 == 0 else (-1 if (i + j) % 5 == 0 else None)
+            students.append(s)
+        return workshops, students
+
+    def test_matrix_and_pulp_builders_agree(self):
+        workshops, students = self._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        out_matrix = _tmp_path("out_matrix")
+        out_pulp = _tmp_path("out_pulp")
+
+        try:
+            ok_m, msg_m, stats_m = run_optimization(input_path, out_matrix, model_builder="matrix")
+            ok_p, msg_p, stats_p = run_optimization(input_path, out_pulp, model_builder="pulp")
+            assert ok_m, msg_m
+            assert ok_p, msg_p
+            assert stats_m["objective_value"] == stats_p["objective_value"]
+            for key in ("variables", "constraints", "nonzeros"):
+                assert stats_m["model_build"][key] == stats_p["model_build"][key], key
+            assert stats_m["model_build"]["builder"] == "matrix"
+            assert stats_p["model_build"]["builder"] == "pulp"
+        finally:
+            for p in (input_path, out_matrix, out_pulp):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_build_memory_is_reported_on_request(self):
+        workshops, students = self._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path, category_diversity_weight=10, measure_memory=True)
+            assert ok, msg
+            assert stats["model_build"]["peak_memory_mb"] is not None
+            assert stats["model_build"]["build_time_s"] >= 0
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_two_phase_shares_constraint_system(self):
+        model = {"use_category_diversity": True, "y_cols": (3, 5), "c": np.array([1.0, 2.0, 3.0, -10.0, -10.0]),
+                 "offset": 20.0, "indptr": np.array([0, 2]), "indices": np.array([0, 3]), "data": np.array([1.0, -1.0])}
+        phase1 = with_category_weight(model, 0)
+        assert phase1["c"].tolist() == [1.0, 2.0, 3.0, 0.0, 0.0]
+        assert phase1["offset"] == 0
+        assert phase1["indices"] is model["indices"] and phase1["data"] is model["data"]
+        assert model["c"][3] == -10.0
+
+    def test_two_phase_reuses_pulp_problem(self):
+        workshops, students = self._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        out_matrix = _tmp_path("out_matrix")
+        out_pulp = _tmp_path("out_pulp")
+
+        try:
+            ok_m, msg_m, stats_m = run_optimization(input_path, out_matrix, category_diversity_weight=10, model_builder="matrix")
+            ok_p, msg_p, stats_p = run_optimization(input_path, out_pulp, category_diversity_weight=10, model_builder="pulp")
+            assert ok_m, msg_m
+            assert ok_p, msg_p
+            for stats in (stats_m, stats_p):
+                assert "warmup_build_time_s" in stats["model_build"]
+            for key in ("variables", "constraints"):
+                assert stats_m["model_build"][key] == stats_p["model_build"][key], key
+        finally:
+            for p in (input_path, out_matrix, out_pulp):
+                if os.path.exists(p):
+                    os.remove(p)
+
+
+# ---------------------------------------------------------------------------
+# 9. Solver backends
+# ---------------------------------------------------------------------------
+
+class TestSolverBackends:
+
+    def test_unknown_backend_returns_error(self):
+        workshops = _make_basic_workshops()
+        codes = [w["Code"] for w in workshops]
+        students = _make_basic_students(codes, n=2)
+
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path, solver_backend="gurobi")
+            assert not ok
+            assert stats is None
+            assert "gurobi" in msg
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_highs_matches_cbc(self):
+        pytest.importorskip("highspy")
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        out_cbc = _tmp_path("out_cbc")
+        out_highs = _tmp_path("out_highs")
+
+        try:
+            ok_c, msg_c, stats_c = run_optimization(input_path, out_cbc, category_diversity_weight=10, solver_backend="cbc")
+            ok_h, msg_h, stats_h = run_optimization(input_path, out_highs, category_diversity_weight=10, solver_backend="highs")
+            assert ok_c, msg_c
+            assert ok_h, msg_h
+            assert stats_h["solver"]["backend"] == "highs"
+            assert stats_c["solver"]["backend"] == "cbc"
+            assert stats_h["pref_count"] + stats_h["veto_count"] + stats_h["neutral_count"] == stats_h["total_assignments"]
+            assert abs(float(stats_h["objective_value"]) - float(stats_c["objective_value"])) <= 0.03 * abs(float(stats_c["objective_value"])) + 1e-6
+        finally:
+            for p in (input_path, out_cbc, out_highs):
+                if os.path.exists(p):
+                    os.remove(p)
+
+
+# ---------------------------------------------------------------------------
+# 10. Aggregated model (equivalence classes of students)
+# ---------------------------------------------------------------------------
+
+class TestAggregatedModel:
+
+    def _copied_scenario(self):
+        """Three preference profiles, each copied by several students, plus all-neutral students."""
+        workshops = TestCategoryDiversity()._make_diverse_scenario()
+        codes = [w["Code"] for w in workshops]
+        profiles = [{codes[0]: 1, codes[2]: 1}, {codes[1]: 1, codes[3]: -1}, {}]
+        students = []
+        for i in range(9):
+            s = {"Nom": f"N{i}", "Prénom": f"P{i}", "Classe": "6A"}
+            for code in codes:
+                s[code] = profiles[i % 3].get(code)
+            students.append(s)
+        return workshops, students
+
+    @pytest.mark.parametrize("weight", [0, 10])
+    def test_aggregated_matches_per_student_model(self, weight):
+        workshops, students = self._copied_scenario()
+        input_path = _build_excel(workshops, students)
+        out_agg = _tmp_path("out_agg")
+        out_matrix = _tmp_path("out_matrix")
+
+        try:
+            ok_a, msg_a, stats_a = run_optimization(input_path, out_agg, category_diversity_weight=weight, model_builder="aggregated")
+            ok_m, msg_m, stats_m = run_optimization(input_path, out_matrix, category_diversity_weight=weight)
+            assert ok_a, msg_a
+            assert ok_m, msg_m
+            aggregation = stats_a["model_build"]["aggregation"]
+            assert aggregation["applied"]
+            assert aggregation["classes"] == 3
+            assert aggregation["compression_ratio"] == 3.0
+            gap = 0.03 if weight else 0.01
+            assert abs(float(stats_a["objective_value"]) - float(stats_m["objective_value"])) <= gap * abs(float(stats_m["objective_value"])) + 1e-6
+            # Every student still gets a complete, valid schedule
+            wb = openpyxl.load_workbook(out_agg)
+            ws = wb["Planning par élève"]
+            headers = [c.value for c in ws[1]]
+            for row in ws.iter_rows(min_row=2, values_only=True):
+                r = dict(zip(headers, row))
+                codes = [r[sess] for sess in EXPECTED_SESSIONS]
+                assert all(codes)
+            wb.close()
+        finally:
+            for p in (input_path, out_agg, out_matrix):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_unknown_builder_returns_error(self):
+        workshops = _make_basic_workshops()
+        students = _make_basic_students([w["Code"] for w in workshops], n=2)
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path, model_builder="columns")
+            assert not ok
+            assert "columns" in msg
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+
+# ---------------------------------------------------------------------------
+# 11. Constructive heuristic and instant mode
+# ---------------------------------------------------------------------------
+
+class TestHeuristic:
+
+    def test_instant_plan_is_valid(self):
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path, category_diversity_weight=10, instant=True)
+            assert ok, msg
+            assert stats["solver"]["backend"] == "heuristic"
+            assert stats["heuristic"]["overflow"] == 0
+            assert stats["objective_value"] == f"{stats['heuristic']['objective']:.2f}"
+            max_by_code = {w["Code"]: w["Nombre d'élèves max par session"] for w in workshops}
+            wb = openpyxl.load_workbook(output_path)
+            ws = wb["Planning par élève"]
+            headers = [c.value for c in ws[1]]
+            crowd = {}
+            for row in ws.iter_rows(min_row=2, values_only=True):
+                r = dict(zip(headers, row))
+                codes = [r[sess] for sess in EXPECTED_SESSIONS]
+                assert all(codes)
+                for sess, code in zip(EXPECTED_SESSIONS, codes):
+                    crowd[(sess, code)] = crowd.get((sess, code), 0) + 1
+            wb.close()
+            assert all(n <= max_by_code[code] for (_, code), n in crowd.items())
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_mip_improves_on_heuristic(self):
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path, category_diversity_weight=0)
+            assert ok, msg
+            assert stats["solver"]["backend"] == "cbc"
+            assert float(stats["objective_value"]) <= stats["heuristic"]["objective"] + 1e-6
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+
+# ---------------------------------------------------------------------------
+# 12. Set partitioning over schedule patterns
+# ---------------------------------------------------------------------------
+
+class TestPatternModel:
+
+    def _run(self, workshops, students, **kwargs):
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+        try:
+            return run_optimization(input_path, output_path, **kwargs)
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    @pytest.mark.parametrize("weight", [0, 10])
+    def test_patterns_match_matrix_model(self, weight):
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        ok_p, msg_p, stats_p = self._run(workshops, students, category_diversity_weight=weight, model_builder="patterns")
+        ok_m, msg_m, stats_m = self._run(workshops, students, category_diversity_weight=weight)
+        assert ok_p, msg_p
+        assert ok_m, msg_m
+        report = stats_p["model_build"]["patterns"]
+        assert report["enumerated"]
+        objective = float(stats_p["objective_value"])
+        assert report["lp_bound"] <= objective + 1e-6
+        gap = 0.03 if weight else 0.01
+        assert abs(objective - float(stats_m["objective_value"])) <= gap * abs(float(stats_m["objective_value"])) + 1e-6
+
+    def test_column_generation_without_enumeration(self, monkeypatch):
+        import solver_logic
+        monkeypatch.setattr(solver_logic, "non_dominated_pools", lambda data, classes: None)
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        ok_g, msg_g, stats_g = self._run(workshops, students, model_builder="patterns")
+        ok_m, msg_m, stats_m = self._run(workshops, students)
+        assert ok_g, msg_g
+        assert ok_m, msg_m
+        report = stats_g["model_build"]["patterns"]
+        assert not report["enumerated"]
+        assert report["cg_iterations"] >= 1
+        assert report["lp_bound"] <= float(stats_g["objective_value"]) + 1e-6
+        assert report["lp_bound"] <= float(stats_m["objective_value"]) + 1e-6
+        assert stats_g["pref_count"] + stats_g["veto_count"] + stats_g["neutral_count"] == stats_g["total_assignments"]
+
+
+# ---------------------------------------------------------------------------
+# 13. Large neighborhood search
+# ---------------------------------------------------------------------------
+
+class TestLNS:
+
+    def _run(self, workshops, students, **kwargs):
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+        try:
+            return run_optimization(input_path, output_path, **kwargs)
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_lns_improves_heuristic_within_budget(self, workers):
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        t0 = time.time()
+        ok, msg, stats = self._run(workshops, students, category_diversity_weight=10, lns_time_limit=3, lns_workers=workers)
+        assert ok, msg
+        assert time.time() - t0 < 30
+        report = stats["model_build"]["lns"]
+        assert stats["model_build"]["builder"] == "lns"
+        assert report["workers"] == workers
+        assert report["neighborhoods"] >= 1
+        assert report["start_objective"] == stats["heuristic"]["objective"]
+        assert float(stats["objective_value"]) == pytest.approx(report["objective"])
+        assert report["objective"] <= report["start_objective"] + 1e-6
+        assert stats["pref_count"] + stats["veto_count"] + stats["neutral_count"] == stats["total_assignments"]
+
+
+# ---------------------------------------------------------------------------
+# 14. Anytime solving (incumbents, bound, gap, stop)
+# ---------------------------------------------------------------------------
+
+class TestAnytime:
+
+    def _run(self, **kwargs):
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+        try:
+            return run_optimization(input_path, output_path, **kwargs)
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_solver_reports_bound_and_gap(self):
+        ok, msg, stats = self._run(category_diversity_weight=10)
+        assert ok, msg
+        solver = stats["solver"]
+        assert solver["termination"] == "optimal"
+        assert solver["incumbent_objective"] == pytest.approx(float(stats["objective_value"]), abs=1e-2)
+        assert solver["best_bound"] is not None
+        assert solver["best_bound"] <= solver["incumbent_objective"] + 1e-6
+        assert 0 <= solver["gap"] <= 0.05
+
+    def test_incumbents_go_through_progress_callback(self):
+        incumbents = []
+
+        def callback(step, pct, incumbent=None):
+            if incumbent is not None:
+                incumbents.append(incumbent)
+
+        ok, msg, stats = self._run(category_diversity_weight=10, progress_callback=callback)
+        assert ok, msg
+        assert incumbents
+        objectives = [inc["objective"] for inc in incumbents]
+        assert objectives == sorted(objectives, reverse=True)
+        assert objectives[-1] >= float(stats["objective_value"]) - 1e-2
+
+    @pytest.mark.parametrize("builder", ["matrix", "patterns"])
+    def test_stop_returns_best_plan_so_far(self, builder):
+        stop = threading.Event()
+        stop.set()
+        ok, msg, stats = self._run(category_diversity_weight=10, model_builder=builder, stop_event=stop)
+        assert ok, msg
+        assert stats["solver"]["termination"] == "stopped"
+        assert "interrompue" in msg
+        assert float(stats["objective_value"]) <= stats["heuristic"]["objective"] + 1e-6
+        assert stats["pref_count"] + stats["veto_count"] + stats["neutral_count"] == stats["total_assignments"]
+
+    def test_cbc_log_is_followed(self):
+        from solver_backends import _follow_cbc_log
+        log = ["Continuous objective value is -120 - 0.1 seconds\n",
+               "Cbc0012I Integer solution of -100 found by feasibility pump after 0 iterations\n",
+               "Cbc0010I After 100 nodes, 3 on tree, -100 best solution, best possible -110 (1.0 seconds)\n",
+               "Cbc0004I Integer solution of -105 found after 200 iterations and 120 nodes\n",
+               "Cbc0012I Integer solution of -104 found by DiveCoefficient\n"]
+        seen = []
+        bound = _follow_cbc_log(iter(log), 50.0, lambda objective, b: seen.append((objective, b)))
+        assert seen == [(-50.0, -70.0), (-55.0, -60.0)]
+        assert bound == -60.0
+
+
+# ---------------------------------------------------------------------------
+# 15. Repair mode (re-optimization from a previous planning)
+# ---------------------------------------------------------------------------
+
+class TestRepair:
+
+    def _plan(self, workshops, students, **kwargs):
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path, **kwargs)
+        finally:
+            os.remove(input_path)
+        assert ok, msg
+        return output_path, stats
+
+    def _sheets(self, path):
+        return pd.read_excel(path, sheet_name=None)
+
+    def test_unchanged_data_moves_nobody(self):
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        previous, stats = self._plan(workshops, students)
+        repaired, repair_stats = self._plan(workshops, students, previous_plan_path=previous)
+        try:
+            assert repair_stats["repair"]["students_freed"] == 0
+            assert repair_stats["repair"]["students_moved"] == 0
+            assert repair_stats["model_build"]["builder"] == "repair"
+            assert repair_stats["objective_value"] == stats["objective_value"]
+            sheets = self._sheets(repaired)
+            assert sheets["Changements"].empty
+            assert sheets["Planning par élève"].equals(self._sheets(previous)["Planning par élève"])
+        finally:
+            for p in (previous, repaired):
+                os.remove(p)
+
+    def test_cancelled_workshop_and_roster_changes(self):
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        previous, _ = self._plan(workshops, students)
+        before = self._sheets(previous)["Planning par élève"].set_index("Nom")
+        cancelled = before.loc["N1", "Lundi matin"]
+        newcomer = {**students[0], "Nom": "Nouveau"}
+        updated_students = students[1:] + [newcomer]
+        repaired, stats = self._plan([w for w in workshops if w["Code"] != cancelled], updated_students,
+                                     previous_plan_path=previous)
+        try:
+            after = self._sheets(repaired)["Planning par élève"].set_index("Nom")
+            changes = self._sheets(repaired)["Changements"].set_index("Nom")
+            in_cancelled = set(before.index[before["Lundi matin"] == cancelled]) - {"N0"}
+            report = stats["repair"]
+            assert (report["students_new"], report["students_removed"]) == (1, 1)
+            assert report["students_moved"] == len(in_cancelled)
+            assert not report["widened"]
+            assert set(changes.index) == in_cancelled | {"N0", "Nouveau"}
+            assert changes.loc["N0", "Changement"] == "Élève retiré"
+            assert changes.loc["Nouveau", "Changement"] == "Nouvel élève"
+            assert cancelled not in set(after["Lundi matin"])
+            # Nobody else moved, and the students who had to move kept their other sessions
+            for nom in set(before.index) - {"N0"}:
+                for session in EXPECTED_SESSIONS[1:]:
+                    assert after.loc[nom, session] == before.loc[nom, session]
+        finally:
+            for p in (previous, repaired):
+                os.remove(p)
+
+    def test_shrunk_capacity_moves_only_the_overflow(self):
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        previous, _ = self._plan(workshops, students)
+        before = self._sheets(previous)["Planning par élève"].set_index("Nom")
+        code = before["Mardi matin"].value_counts().index[0]
+        crowd = int((before["Mardi matin"] == code).sum())
+        shrunk = [{**w, "Nombre d'élèves max par session": crowd - 1} if w["Code"] == code else w for w in workshops]
+        repaired, stats = self._plan(shrunk, students, previous_plan_path=previous)
+        try:
+            after = self._sheets(repaired)["Planning par élève"].set_index("Nom")
+            assert int((after["Mardi matin"] == code).sum()) <= crowd - 1
+            assert stats["repair"]["students_freed"] == crowd
+            assert 1 <= stats["repair"]["students_moved"] <= crowd
+        finally:
+            for p in (previous, repaired):
+                os.remove(p)
+
+    def test_previous_plan_without_planning_sheet(self):
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        output_path = _tmp_path("output")
+        try:
+            ok, msg, stats = run_optimization(input_path, output_path, previous_plan_path=input_path)
+            assert not ok
+            assert "Planning par élève" in msg
+        finally:
+            for p in (input_path, output_path):
+                if os.path.exists(p):
+                    os.remove(p)
+
+
+# ---------------------------------------------------------------------------
+# 16. Category-weight sweep (Pareto table, warm start from a neighbouring weight)
+# ---------------------------------------------------------------------------
+
+class TestWeightSweep:
+
+    def test_start_plan_from_own_output(self):
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        first, second = _tmp_path("output"), _tmp_path("output")
+        try:
+            ok, msg, stats = run_optimization(input_path, first, category_diversity_weight=10)
+            assert ok, msg
+            ok, msg, warm = run_optimization(input_path, second, category_diversity_weight=10, start_plan_path=first)
+            assert ok, msg
+            assert warm["heuristic"]["source"] == "start_plan"
+            assert warm["heuristic"]["objective"] == pytest.approx(float(stats["objective_value"]))
+            assert float(warm["objective_value"]) <= float(stats["objective_value"]) + 1e-6
+        finally:
+            for p in (input_path, first, second):
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_sweep_returns_one_workbook_per_weight(self):
+        from sweep import run_weight_sweep
+        workshops, students = TestModelBuilders()._mixed_scenario()
+        input_path = _build_excel(workshops, students)
+        outputs = {w: _tmp_path(f"sweep_{w}") for w in (10, 0, 5)}
+        steps = []
+        try:
+            points = run_weight_sweep(input_path, outputs, workers=1, progress_callback=lambda step, pct: steps.append(pct))
+            assert [p["weight"] for p in points] == [0, 5, 10]
+            assert all(p["success"] for p in points)
+            # Every weight but the first is offered its neighbour's planning, kept when no worse than the heuristic plan
+            for p in points[1:]:
+                report = p["stats"]["heuristic"]
+                assert report["start_plan_objective"] is not None
+                assert p["warm_started"] == (report["source"] == "start_plan")
+            assert not points[0]["warm_started"]
+            assert all(os.path.exists(outputs[p["weight"]]) and p["filename"] == os.path.basename(outputs[p["weight"]]) for p in points)
+            assert any(p["pareto"] for p in points)
+            assert all(0 < p["category_coverage"] <= 100 for p in points)
+            # Category weight trades preferences for coverage, never the other way round
+            assert points[-1]["category_coverage"] >= points[0]["category_coverage"]
+            assert steps == sorted(steps) and len(steps) == 3
+        finally:
+            for p in [input_path, *outputs.values()]:
+                if os.path.exists(p):
+                    os.remove(p)
+
+    def test_pareto_front(self):
+        from sweep import pareto_front
+        points = [{"success": True, "pref_rate": 95, "category_coverage": 60},
+                  {"success": True, "pref_rate": 94, "category_coverage": 80},
+                  {"success": True, "pref_rate": 93, "category_coverage": 70},
+                  {"success": True, "pref_rate": 94, "category_coverage": 80},
+                  {"success": False}]
+        assert [p.get("pareto") for p in pareto_front(points)] == [True, True, False, True, None]